@@ -1,22 +1,14 @@
 import streamlit as st
 import requests
-import time
 import json
+import uuid
 
 # --- 1. Configuración y Constantes ---
 BACKEND_URL = "http://web:8000/api/v1"
-POLLING_INTERVAL_SECONDS = 15
-MAX_POLLING_ATTEMPTS = 12
-
-# Pasos de generación con un enfoque técnico y directo
-GENERATION_STEPS = [
-    ("Enviando la Solicitud...", 0.10, 10),
-    ("Iniciando la generación del borrador inicial...", 0.25, 10),
-    ("Generando opciones y distractores basados en errores conceptuales...", 0.45, 10),
-    ("Ejecutando Auditores de Contenido, Lógica Interna y Políticas de Equidad...", 0.70, 25),
-    ("Aplicando refinamientos basados en los hallazgos encontrados...", 0.85, 10),
-    ("Evaluando reactivos y preparando su calificación...", 0.95, 10),
-]
+# El backend envía un 'ping' cada 15 s; sin eventos durante más tiempo, la conexión se da por perdida.
+EVENTS_READ_TIMEOUT_SECONDS = 60
+# Estados con los que un reactivo ya no avanza en el pipeline.
+FINAL_STATUSES = {"persistence_success", "fatal", "skipped"}
 
 # --- 2. Funciones Auxiliares y Callbacks ---
 
@@ -31,8 +23,20 @@ def handle_form_submission():
         "formato": {"tipo_reactivo": st.session_state.tipo_reactivo_input, "numero_opciones": st.session_state.n_opciones_input}
     }
     st.session_state.n_items_solicitados = params["n_items"]
+    # La misma clave en los reintentos y dobles clics: el backend devuelve el mismo lote.
+    if not st.session_state.get("idempotency_key") or st.session_state.get("idempotency_params") != params:
+        st.session_state.idempotency_key = str(uuid.uuid4())
+        st.session_state.idempotency_params = params
     try:
-        response = requests.post(f"{BACKEND_URL}/items/generate", json=params, timeout=15)
+        response = requests.post(
+            f"{BACKEND_URL}/items/generate", json=params, timeout=15,
+            headers={"Idempotency-Key": st.session_state.idempotency_key},
+        )
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After", "unos")
+            st.warning(f"El servidor está saturado: {response.json().get('detail')} Intenta de nuevo en {retry_after} segundos.")
+            st.session_state.generating = False
+            return
         response.raise_for_status()
         st.session_state.batch_id = response.json().get("batch_id")
         st.session_state.generating = True
@@ -40,22 +44,30 @@ def handle_form_submission():
         st.error(f"Error al contactar al servidor de SIGIE: {e}")
         st.session_state.generating = False
 
-def consultar_estado_del_lote(batch_id):
-    """Consulta el estado de un lote en el backend."""
-    try:
-        response = requests.get(f"{BACKEND_URL}/items/batch/{batch_id}", timeout=10)
-        if response.status_code == 404: return None
+def seguir_eventos_del_lote(batch_id):
+    """Genera los pares (evento, datos) del flujo SSE del lote hasta 'complete'."""
+    with requests.get(
+        f"{BACKEND_URL}/items/batch/{batch_id}/events", stream=True, timeout=(10, EVENTS_READ_TIMEOUT_SECONDS)
+    ) as response:
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException: return None
-
-def obtener_item_por_id(item_id):
-    """Obtiene el payload completo de un ítem por su ID."""
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+
+def cancelar_lote(batch_id):
+    """Solicita al backend que detenga un lote en ejecución."""
     try:
-        response = requests.get(f"{BACKEND_URL}/items/{item_id}", timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException: return None
+        requests.post(f"{BACKEND_URL}/items/batch/{batch_id}/cancel", timeout=10)
+    except requests.exceptions.RequestException: pass
+
+def cancel_and_reset():
+    """Cancela el lote en curso (si existe) y reinicia la interfaz."""
+    if st.session_state.get("batch_id"):
+        cancelar_lote(st.session_state.batch_id)
+    reset_to_initial_state()
 
 def reset_to_initial_state():
     """Reinicia el estado de la sesión para una nueva generación."""
@@ -63,6 +75,7 @@ def reset_to_initial_state():
     st.session_state.batch_id = None
     st.session_state.final_results = None
     st.session_state.n_items_solicitados = 0
+    st.session_state.idempotency_key = None
 
 def display_item_visualization(item_data):
     """Muestra un único reactivo de forma atractiva y funcional."""
@@ -154,44 +167,40 @@ else:
         st.success(f"Solicitud aceptada. Tu lote de generación es: **{st.session_state.batch_id}**")
         progress_bar = st.progress(0.0, "Iniciando proceso...")
 
-        # --- Lógica de "Espera Inteligente" ---
+        # --- Progreso en tiempo real (Server-Sent Events) ---
+        # Cada reactivo se recibe en cuanto se guarda; no hay esperas fijas ni sondeos.
         lote_completado = False
-        for message, progress, wait_time in GENERATION_STEPS:
-            progress_bar.progress(progress, text=message)
-
-            # Realiza una comprobación de estado después de una espera parcial
-            time.sleep(wait_time)
-            estado_lote = consultar_estado_del_lote(st.session_state.batch_id)
-            if estado_lote and estado_lote.get("is_complete"):
-                lote_completado = True
-                break # Interrumpe la animación si el lote ya está listo
-
-        # Si el lote no se completó durante la animación, inicia el sondeo regular
-        if not lote_completado:
-            progress_bar.progress(1.0, text="✨ ¡Proceso creativo finalizado! Verificando estado final en el servidor...")
-            for i in range(MAX_POLLING_ATTEMPTS):
-                estado_lote = consultar_estado_del_lote(st.session_state.batch_id)
-                if estado_lote and estado_lote.get("is_complete"):
+        final_results_data = []
+        total = st.session_state.n_items_solicitados or 1
+        terminados = set()
+        try:
+            for event, data in seguir_eventos_del_lote(st.session_state.batch_id):
+                if event == "status":
+                    total = data.get("total_items") or total
+                elif event == "transition":
+                    if data.get("status") in FINAL_STATUSES:
+                        terminados.add(data.get("temp_id"))
+                    progress_bar.progress(
+                        min(0.1 + 0.9 * len(terminados) / total, 1.0),
+                        text=f"Etapa '{data.get('stage_name')}': {len(terminados)} de {total} reactivos terminados...",
+                    )
+                elif event == "item":
+                    final_results_data.append(data.get("payload"))
+                elif event == "complete":
                     lote_completado = True
                     break
-                time.sleep(POLLING_INTERVAL_SECONDS)
+        except requests.exceptions.RequestException as e:
+            st.error(f"Se perdió la conexión con el servidor de SIGIE: {e}")
 
-        # Procede a obtener los resultados si el lote se completó en cualquier punto
         if lote_completado:
-            VALID_SUCCESS_STATUSES = ["persistence_success", "evaluation_complete"]
-            items_a_buscar = [res.get("item_id") for res in estado_lote.get("results", []) if res.get("status") in VALID_SUCCESS_STATUSES]
-            final_results_data = []
-            with st.spinner(f"Descargando {len(items_a_buscar)} reactivos generados..."):
-                for item_id in items_a_buscar:
-                    payload = obtener_item_por_id(item_id)
-                    if payload: final_results_data.append(payload)
+            progress_bar.progress(1.0, text="✨ ¡Proceso finalizado!")
             st.session_state.final_results = final_results_data
             st.session_state.generating = False
             st.balloons()
             st.rerun()
         else:
-            st.warning("El proceso está tardando más de lo normal. Si el problema persiste, puedes generar un nuevo lote.")
-            st.button("Cancelar y volver a empezar", on_click=reset_to_initial_state)
+            st.warning("No se pudo seguir el progreso del lote. Si el problema persiste, puedes generar un nuevo lote.")
+            st.button("Cancelar y volver a empezar", on_click=cancel_and_reset)
     else:
         st.error("No se pudo iniciar la generación debido a un error al contactar al servidor.")
         st.button("Reintentar", on_click=reset_to_initial_state)
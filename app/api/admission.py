@@ -0,0 +1,161 @@
+# app/api/admission.py
+
+"""
+Control de admisión y contrapresión para `POST /items/generate`.
+
+El tiempo estimado de finalización de una solicitud nueva se calcula con:
+
+- la cola pendiente: ítems ya aceptados que no han terminado (en la base de
+  datos en los modos 'queue'/'distributed'; en este proceso en 'background');
+- el throughput reciente: ítems terminados en la ventana
+  ADMISSION_THROUGHPUT_WINDOW_SECONDS (o ADMISSION_DEFAULT_ITEMS_PER_MINUTE
+  sin historial);
+- la duración reciente de un lote, sumando la EWMA de cada etapa;
+- las llamadas LLM en curso que esperan un hueco del límite de concurrencia.
+
+Si la estimación supera ADMISSION_MAX_ETA_SECONDS, o el cliente (X-Tenant-ID)
+excede su cuota de ítems pendientes, se responde 429 con un Retry-After
+calculado con el mismo throughput.
+
+El presupuesto de un lote nuevo (BUDGET_MAX_*_PER_ITEM por ítem) se acota a
+lo que le queda al cliente de su presupuesto mensual; con el mes agotado se
+responde 429 con Retry-After hasta el mes siguiente.
+"""
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.log import logger
+from app.db import crud
+from app.llm.providers import get_concurrency_limit, get_in_flight_llm_calls
+from app.pipelines.budget import default_batch_limits, month_start, tenant_monthly_limits
+from app.pipelines.metrics import get_llm_call_seconds, get_recent_batch_seconds
+
+# Lotes aceptados en modo 'background' y aún en ejecución: batch_id -> (cliente, ítems).
+_IN_FLIGHT_BATCHES: Dict[str, Tuple[Optional[str], int]] = {}
+
+
+def register_in_flight(batch_id: str, tenant_id: Optional[str], n_items: int):
+    _IN_FLIGHT_BATCHES[batch_id] = (tenant_id, n_items)
+
+
+def unregister_in_flight(batch_id: str):
+    _IN_FLIGHT_BATCHES.pop(batch_id, None)
+
+
+def _pending_items_by_tenant(db: Session) -> Dict[Optional[str], int]:
+    if settings.pipeline_execution_mode in ("queue", "distributed"):
+        return crud.get_pending_item_counts(db)
+    pending: Dict[Optional[str], int] = {}
+    for tenant_id, n_items in _IN_FLIGHT_BATCHES.values():
+        pending[tenant_id] = pending.get(tenant_id, 0) + n_items
+    return pending
+
+
+def tenant_quota(tenant_id: Optional[str]) -> Optional[int]:
+    """
+    Máximo de ítems pendientes del cliente (cuota propia o la general). Las
+    solicitudes sin X-Tenant-ID solo están sujetas al límite global.
+    """
+    if not tenant_id:
+        return None
+    return settings.admission_tenant_quotas.get(tenant_id, settings.admission_tenant_max_pending_items)
+
+
+@dataclass
+class AdmissionEstimate:
+    backlog_items: int
+    tenant_pending_items: int
+    items_per_second: float
+    eta_seconds: float
+
+
+def estimate_completion(db: Session, tenant_id: Optional[str], n_items: int) -> AdmissionEstimate:
+    pending = _pending_items_by_tenant(db)
+    backlog_items = sum(pending.values())
+
+    window = settings.admission_throughput_window_seconds
+    completed = crud.count_recently_completed_items(db, window)
+    items_per_second = completed / window if completed else settings.admission_default_items_per_minute / 60
+
+    batch_seconds = get_recent_batch_seconds() or settings.admission_default_batch_seconds
+
+    # Llamadas LLM que esperan un hueco: se atienden en tandas del tamaño del límite.
+    llm_wait_seconds = 0.0
+    limit = get_concurrency_limit()
+    waiting_calls = get_in_flight_llm_calls() - limit if limit else 0
+    if waiting_calls > 0:
+        llm_wait_seconds = math.ceil(waiting_calls / limit) * (get_llm_call_seconds() or 0.0)
+
+    eta_seconds = (backlog_items + n_items) / items_per_second + batch_seconds + llm_wait_seconds
+    return AdmissionEstimate(
+        backlog_items=backlog_items,
+        tenant_pending_items=pending.get(tenant_id, 0),
+        items_per_second=items_per_second,
+        eta_seconds=eta_seconds,
+    )
+
+
+def _reject(detail: str, retry_after_seconds: float):
+    retry_after = max(1, math.ceil(retry_after_seconds))
+    logger.warning(f"Generation request rejected by admission control: {detail} (Retry-After {retry_after}s).")
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+def check_admission(db: Session, tenant_id: Optional[str], n_items: int) -> AdmissionEstimate:
+    """Devuelve la estimación si se admite la solicitud; si no, lanza 429 con Retry-After."""
+    estimate = estimate_completion(db, tenant_id, n_items)
+
+    quota = tenant_quota(tenant_id)
+    # Una solicitud sin otras pendientes se admite aunque supere la cuota por sí sola.
+    if quota is not None and estimate.tenant_pending_items and estimate.tenant_pending_items + n_items > quota:
+        excess = estimate.tenant_pending_items + n_items - quota
+        _reject(
+            f"Tenant quota exceeded: {estimate.tenant_pending_items} items pending, quota {quota}.",
+            excess / estimate.items_per_second,
+        )
+
+    max_eta = settings.admission_max_eta_seconds
+    if max_eta and estimate.eta_seconds > max_eta:
+        _reject(
+            f"Generation backlog too large: estimated completion in {estimate.eta_seconds:.0f}s "
+            f"exceeds the {max_eta}s limit.",
+            estimate.eta_seconds - max_eta,
+        )
+    return estimate
+
+
+def plan_batch_budget(db: Session, tenant_id: Optional[str], n_items: int) -> Tuple[Optional[int], Optional[float]]:
+    """
+    Límites (tokens, coste) del lote nuevo. Lanza 429 si el cliente ya agotó
+    su presupuesto mensual.
+    """
+    max_tokens, max_cost_usd = default_batch_limits(n_items)
+    if not tenant_id:
+        return max_tokens, max_cost_usd
+    month_tokens, month_cost_usd = tenant_monthly_limits(tenant_id)
+    if not month_tokens and not month_cost_usd:
+        return max_tokens, max_cost_usd
+
+    now = datetime.now(timezone.utc)
+    since = month_start(now)
+    next_month = month_start(since + timedelta(days=32))
+    spent_tokens, spent_cost_usd = crud.get_tenant_month_spend(db, tenant_id, since)
+
+    if month_tokens:
+        remaining_tokens = month_tokens - spent_tokens
+        if remaining_tokens <= 0:
+            _reject(f"Monthly token budget exhausted for tenant '{tenant_id}'.", (next_month - now).total_seconds())
+        max_tokens = min(max_tokens or remaining_tokens, remaining_tokens)
+    if month_cost_usd:
+        remaining_cost_usd = month_cost_usd - spent_cost_usd
+        if remaining_cost_usd <= 0:
+            _reject(f"Monthly cost budget exhausted for tenant '{tenant_id}'.", (next_month - now).total_seconds())
+        max_cost_usd = min(max_cost_usd or remaining_cost_usd, remaining_cost_usd)
+    return max_tokens, max_cost_usd
@@ -0,0 +1,121 @@
+# app/api/batch_events.py
+
+"""
+Flujo de eventos de un lote para `GET /items/batch/{batch_id}/events` (SSE)
+y su equivalente WebSocket:
+
+- 'status': resumen del lote (recuentos y, si está en curso, progreso por etapa);
+- 'transition': cambio de estado de un ítem en una etapa;
+- 'item': payload de un ítem en cuanto se persiste;
+- 'ping': mantiene viva la conexión;
+- 'complete': fin del lote, tras el último 'status'.
+
+Un lote en curso en este proceso se sigue con los eventos del runner
+(`app.pipelines.live_status`). Un lote terminado, o que se ejecuta en los
+workers (modos 'queue' y 'distributed'), se sigue sondeando la base de datos
+cada BATCH_EVENTS_POLL_SECONDS.
+"""
+
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import async_crud
+from app.db.session import AsyncSessionLocal
+from app.pipelines import live_status
+from app.schemas.enums import ItemStatus
+
+# Estados de una fila sin payload que entregar.
+_UNDELIVERABLE_STATUSES = {ItemStatus.PENDING.value, ItemStatus.FATAL.value, ItemStatus.SKIPPED.value}
+
+
+async def batch_exists(db: AsyncSession, batch_id: str) -> bool:
+    if live_status.get_batch_summary(batch_id) is not None:
+        return True
+    total_items = (await async_crud.get_batch_status_counts(db, batch_id))[0]
+    return total_items > 0
+
+
+async def batch_events(batch_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """Eventos del lote hasta 'complete' (ver el docstring del módulo)."""
+    # Suscribirse antes de leer el estado: ninguna transición queda entre ambos.
+    queue = live_status.subscribe(batch_id)
+    sent: Set[str] = set()
+    try:
+        live = live_status.get_batch_summary(batch_id)
+        if live is not None:
+            yield live_status.status_event(live)
+            # Ítems persistidos antes de la suscripción.
+            persisted = [
+                result["item_id"] for result in live["results"]
+                if result["item_id"] and result["status"] == ItemStatus.PERSISTENCE_SUCCESS.value
+            ]
+            async for event in _persisted_item_events(persisted, sent):
+                yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.batch_events_keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield {"event": "ping", "data": {}}
+                    continue
+                if event is None:
+                    # El runner cierra con el estado final del lote.
+                    yield {"event": "complete", "data": {"batch_id": batch_id}}
+                    return
+                yield event
+
+        # Lote terminado, o en ejecución en otro proceso: se sigue desde la base de datos.
+        async for event in _poll_database(batch_id, sent):
+            yield event
+    finally:
+        live_status.unsubscribe(batch_id, queue)
+
+
+async def _persisted_item_events(item_ids: List[uuid.UUID], sent: Set[str]) -> AsyncIterator[Dict[str, Any]]:
+    if not item_ids:
+        return
+    async with AsyncSessionLocal() as db:
+        rows = await async_crud.get_item_payloads(db, item_ids)
+    for item_id, temp_id, status, payload in rows:
+        if payload and str(item_id) not in sent:
+            sent.add(str(item_id))
+            yield {
+                "event": "item",
+                "data": {"temp_id": str(temp_id), "item_id": str(item_id), "stage_name": None, "status": status, "payload": payload},
+            }
+
+
+async def _poll_database(batch_id: str, sent: Set[str]) -> AsyncIterator[Dict[str, Any]]:
+    last_status = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            total_items, processed_items, successful_items, failed_items, tokens_used, cost_usd = (
+                await async_crud.get_batch_status_counts(db, batch_id)
+            )
+            statuses = await async_crud.get_batch_item_statuses(db, batch_id)
+        ready = [item_id for item_id, _, status in statuses if status not in _UNDELIVERABLE_STATUSES]
+        async for event in _persisted_item_events([i for i in ready if str(i) not in sent], sent):
+            yield event
+
+        # Sin filas, el lote terminó sin ítems que persistir.
+        is_complete = processed_items == total_items
+        status = {
+            "total_items": total_items,
+            "processed_items": processed_items,
+            "successful_items": successful_items,
+            "failed_items": failed_items,
+            "tokens_used": tokens_used,
+            "cost_usd": cost_usd,
+            "is_complete": is_complete,
+        }
+        if status != last_status:
+            last_status = status
+            yield {"event": "status", "data": status}
+        if is_complete:
+            yield {"event": "complete", "data": {"batch_id": batch_id}}
+            return
+        await asyncio.sleep(settings.batch_events_poll_seconds)
@@ -0,0 +1,99 @@
+# app/api/coalescing.py
+
+"""
+Agrupación (single-flight) de solicitudes de generación idénticas.
+
+Un doble clic en el formulario o un reintento tras un timeout de la GUI
+envían los mismos `ItemGenerationParams` varias veces. Los parámetros se
+normalizan y se resumen con SHA-256; una solicitud idéntica mientras el lote
+anterior sigue en curso (o dentro de GENERATION_COALESCE_WINDOW_SECONDS) se
+une a ese lote en lugar de iniciar otro pipeline.
+
+Con la cabecera `Idempotency-Key` el cliente controla la agrupación de forma
+explícita: la misma clave devuelve el mismo lote durante
+IDEMPOTENCY_KEY_TTL_SECONDS, y reutilizarla con otros parámetros es un error.
+
+Tanto el resumen de los parámetros como la clave incluyen el cliente
+(`X-Tenant-ID`): solo se agrupan solicitudes del mismo cliente, que nunca
+recibe el lote de otro ni se salta su propia admisión y presupuesto.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import crud
+from app.db.models import GenerationRequestModel
+from app.pipelines.cancellation import is_batch_active
+from app.schemas.item_schemas import ItemGenerationParams
+
+
+def _normalize(value: Any) -> Any:
+    """Elimina diferencias irrelevantes: espacios sobrantes y orden de las claves."""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _normalize(val) for key, val in sorted(value.items())}
+    if isinstance(value, list):
+        return [_normalize(val) for val in value]
+    return value
+
+
+def params_fingerprint(params: ItemGenerationParams, tenant_id: Optional[str]) -> str:
+    # La prioridad no cambia el resultado: no distingue solicitudes.
+    normalized = _normalize(params.model_dump(mode="json", exclude={"priority"}))
+    normalized["tenant_id"] = tenant_id
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def request_key_for(params_hash: str, idempotency_key: Optional[str], tenant_id: Optional[str]) -> str:
+    # `params_hash` ya incluye el cliente; la clave se acota a él sin ambigüedad.
+    if idempotency_key:
+        return "key:" + json.dumps([tenant_id, idempotency_key], ensure_ascii=False)
+    return f"params:{params_hash}"
+
+
+def expire_seconds_for(idempotency_key: Optional[str]) -> int:
+    return settings.idempotency_key_ttl_seconds if idempotency_key else settings.generation_coalesce_window_seconds
+
+
+def _batch_in_flight(db: Session, batch_id: str) -> bool:
+    if is_batch_active(batch_id):
+        return True
+    if settings.pipeline_execution_mode in ("queue", "distributed"):
+        return crud.batch_has_pending_jobs(db, batch_id)
+    return False
+
+
+def check_idempotency_conflict(existing: GenerationRequestModel, params_hash: str, idempotency_key: Optional[str]):
+    if idempotency_key and existing.params_hash != params_hash:
+        raise HTTPException(
+            status_code=409,
+            detail="Idempotency-Key already used with different generation parameters.",
+        )
+
+
+def find_coalescable_request(
+    db: Session, params_hash: str, idempotency_key: Optional[str], tenant_id: Optional[str]
+) -> Optional[GenerationRequestModel]:
+    """
+    Devuelve la solicitud previa a la que debe unirse esta, o None si hay que
+    iniciar un lote nuevo. Lanza 409 si la Idempotency-Key no coincide.
+    """
+    existing = crud.get_generation_request(db, request_key_for(params_hash, idempotency_key, tenant_id))
+    if existing is None:
+        return None
+
+    age_seconds = (datetime.now(timezone.utc) - existing.created_at).total_seconds()
+    if age_seconds < expire_seconds_for(idempotency_key):
+        check_idempotency_conflict(existing, params_hash, idempotency_key)
+        return existing
+    if not idempotency_key and _batch_in_flight(db, existing.batch_id):
+        return existing
+    return None
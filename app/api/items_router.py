@@ -1,79 +1,260 @@
 # app/api/items_router.py
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
+import json
 import uuid
 
 from app.schemas.item_schemas import (
+    BatchBudgetSchema,
+    BatchCancelResultSchema,
     BatchStatusResultSchema,
     GenerationResultSchema,
     ItemGenerationParams,
+    ItemHistorySchema,
+    ItemPageSchema,
     ItemPayloadSchema,
+    ItemRevisionSchema,
+    ItemSummarySchema,
+    QueueDepthSchema,
+    SearchResultSchema,
 )
-from app.schemas.enums import ItemStatus
 from app.schemas.models import Item
-from app.pipelines.runner import run as run_pipeline_async
+from app.pipelines.runner import (
+    get_stage_resource_class,
+    load_pipeline_config,
+    run as run_pipeline_async,
+)
+from app.pipelines import live_status, payload_versions
+from app.pipelines.cancellation import cancel_batch
+from app.api.batch_events import batch_events, batch_exists
+from app.api.export import export_ndjson
+from app.api.pagination import decode_cursor, encode_cursor
+from app.api.search import search_items
+from app.api.admission import check_admission, plan_batch_budget, register_in_flight, unregister_in_flight
+from app.api.coalescing import (
+    check_idempotency_conflict,
+    expire_seconds_for,
+    find_coalescable_request,
+    params_fingerprint,
+    request_key_for,
+)
 from app.pipelines.utils.stage_helpers import initialize_items_for_pipeline
+from app.inventory.service import DEFAULT_TENANT_ID, record_demand, serve_from_inventory
+from app.core.config import settings
 from app.core.log import logger
-from app.db.session import get_db
-from app.db import crud
+from app.db.session import AsyncSessionLocal, PipelineSessionLocal, get_async_db
+from app.db import async_crud, crud
 
 router = APIRouter()
 
 
-async def run_pipeline_in_background(items: List[Item], db: Session):
+async def run_pipeline_in_background(items: List[Item]):
     """
-    Función envoltorio que ahora obtiene el registro y lo inyecta en el runner.
+    Función envoltorio que ejecuta el pipeline tras responder a la petición.
+    El pipeline abre sus propias sesiones asíncronas (pool del pipeline): la
+    sesión de la petición ya está cerrada cuando se ejecuta. El lote se sirve
+    desde el estado en vivo hasta que el estado de sus ítems está en SQL.
     """
     try:
-        # Obtiene el registro completo de etapas
         await run_pipeline_async(
-            pipeline_config_path="pipeline.yml",
+            pipeline_config_path=settings.pipeline_config_path,
             items_to_process=items,
-            ctx={"db_session": db},
+            ctx={"async_session_factory": PipelineSessionLocal, "keep_live_status": True},
         )
+        # Los ítems que no llegaron a 'persist' no tienen fila; el resto queda con su estado final.
+        async with PipelineSessionLocal() as db:
+            await async_crud.sync_item_statuses(db, items)
     except Exception as e:
         logger.error(
             f"Error al ejecutar el pipeline en segundo plano: {e}", exc_info=True
         )
+    finally:
+        unregister_in_flight(items[0].batch_id)
+        live_status.finish_batches([items[0].batch_id])
+
+
+def _dispatch_batch(db: Session, items: List[Item], background_tasks: BackgroundTasks):
+    """Inicia el lote según el modo de ejecución configurado."""
+    if settings.pipeline_execution_mode == "queue":
+        try:
+            crud.enqueue_pipeline_job(db, items)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Failed to enqueue the generation job.")
+    elif settings.pipeline_execution_mode == "distributed":
+        # Modo distribuido: el lote entra en la cola de la primera etapa.
+        config = load_pipeline_config(settings.pipeline_config_path)
+        if not config or not config.get("stages"):
+            raise HTTPException(status_code=503, detail="Pipeline configuration not available.")
+        try:
+            crud.enqueue_pipeline_job(db, items, stage_index=0, stage_name=config["stages"][0]["name"])
+        except Exception:
+            raise HTTPException(status_code=503, detail="Failed to enqueue the generation job.")
+    else:
+        register_in_flight(items[0].batch_id, items[0].tenant_id, len(items))
+        # Visible en GET /items/batch/{batch_id} desde ya, antes de que arranque el pipeline.
+        live_status.track_items(items)
+        background_tasks.add_task(run_pipeline_in_background, items)
+
+
+def _coalesced_result(existing) -> GenerationResultSchema:
+    logger.info(f"Identical generation request coalesced into batch {existing.batch_id}.")
+    return GenerationResultSchema(
+        message="An identical generation request is already in progress; returning its batch.",
+        batch_id=existing.batch_id,
+        num_items=existing.num_items,
+        coalesced=True,
+    )
 
 
 @router.post("/items/generate", response_model=GenerationResultSchema, status_code=202)
 async def generate_items(
     params: ItemGenerationParams,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    tenant_id: Optional[str] = Header(None, alias="X-Tenant-ID"),
+    priority: Optional[Literal["interactive", "bulk", "prefill"]] = Query(
+        None, description="Clase de prioridad de las llamadas LLM del lote; tiene precedencia sobre params.priority."
+    ),
 ):
     """
     Endpoint para iniciar la generación de ítems en segundo plano.
     Ahora inicializa los ítems y devuelve un batch_id inmediatamente.
+    Una solicitud idéntica a otra en curso (o con la misma Idempotency-Key)
+    recibe el batch_id existente en lugar de iniciar otro pipeline, y una
+    combinación popular con reserva suficiente se sirve desde el inventario.
+
+    Las funciones de `crud` síncronas se ejecutan con `AsyncSession.run_sync`
+    sobre la conexión asíncrona, sin bloquear el event loop.
     """
     logger.info(f"Received generation request for {params.n_items} items.")
 
+    # 0. Agrupa solicitudes idénticas (doble clic, reintentos de la GUI).
+    params_hash = params_fingerprint(params, tenant_id)
+    existing = await db.run_sync(find_coalescable_request, params_hash, idempotency_key, tenant_id)
+    if existing is not None:
+        return _coalesced_result(existing)
+
     # 1. Inicializa los ítems ANTES de la tarea en segundo plano.
-    initialized_items = initialize_items_for_pipeline(params.model_dump())
+    params.priority = priority or params.priority or "interactive"
+    params_data = params.model_dump()
+    initialized_items = initialize_items_for_pipeline(params_data)
     if not initialized_items:
         raise HTTPException(
             status_code=400, detail="Failed to initialize items for the pipeline."
         )
+    for item in initialized_items:
+        item.tenant_id = tenant_id
 
     # 2. Extrae el batch_id del primer ítem (todos tienen el mismo).
     batch_id = initialized_items[0].batch_id
 
-    # 3. Añade la tarea en segundo plano, pasándole la lista de ítems.
-    background_tasks.add_task(run_pipeline_in_background, initialized_items, db)
+    # El registro es atómico: si otra solicitud idéntica se adelantó, nos unimos a su lote.
+    request_key = request_key_for(params_hash, idempotency_key, tenant_id)
+    claimed = await db.run_sync(
+        crud.claim_generation_request,
+        request_key, params_hash, batch_id, len(initialized_items), expire_seconds_for(idempotency_key),
+    )
+    if claimed.batch_id != batch_id:
+        check_idempotency_conflict(claimed, params_hash, idempotency_key)
+        return _coalesced_result(claimed)
+
+    # Las combinaciones populares con reserva suficiente se sirven al instante.
+    await db.run_sync(record_demand, params_data)
+    if await db.run_sync(serve_from_inventory, params_data, initialized_items, tenant_id or DEFAULT_TENANT_ID):
+        return GenerationResultSchema(
+            message="Items served from the pre-generated inventory.",
+            batch_id=batch_id,
+            num_items=len(initialized_items),
+            from_inventory=True,
+        )
+
+    # 3. En modo 'queue'/'distributed' los ítems y el trabajo se registran en
+    #    la misma transacción y los procesos `app.worker` los ejecutan; si no, se añade
+    #    la tarea en segundo plano, pasándole la lista de ítems.
+    try:
+        # Contrapresión: 429 con Retry-After si la cola o la cuota del cliente están llenas.
+        estimate = await db.run_sync(check_admission, tenant_id, len(initialized_items))
+        # Presupuesto de tokens y coste del lote, acotado por el mensual del cliente.
+        max_tokens, max_cost_usd = await db.run_sync(plan_batch_budget, tenant_id, len(initialized_items))
+        await db.run_sync(crud.create_batch_budget, batch_id, tenant_id, max_tokens, max_cost_usd)
+        await db.run_sync(_dispatch_batch, initialized_items, background_tasks)
+    except HTTPException:
+        await db.run_sync(crud.delete_batch_budget, batch_id)
+        await db.run_sync(crud.release_generation_request, request_key, batch_id)
+        raise
 
     # 4. Devuelve una respuesta útil y alineada con el nuevo schema.
     return GenerationResultSchema(
         message="Item generation process started successfully in the background.",
         batch_id=batch_id,
         num_items=len(initialized_items),
+        estimated_completion_seconds=round(estimate.eta_seconds, 1),
+        estimated_completion_at=datetime.now(timezone.utc) + timedelta(seconds=estimate.eta_seconds),
     )
 
 
+@router.get("/items/export")
+async def export_items(
+    batch_id: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    tenant_id: Optional[str] = None,
+    asignatura: Optional[str] = None,
+    tema: Optional[str] = None,
+    nivel_cognitivo: Optional[str] = None,
+    gzip: bool = Query(False, description="Comprime la exportación con gzip (.ndjson.gz)."),
+):
+    """
+    Exporta como NDJSON los ítems (con payload) que cumplen los filtros, en
+    streaming y con memoria constante: una línea por ítem con su ID, lote,
+    estado, cliente, fecha de creación y payload.
+    """
+    clauses = async_crud.item_filter_clauses(
+        batch_id=batch_id, status=status, tenant_id=tenant_id,
+        asignatura=asignatura, tema=tema, nivel_cognitivo=nivel_cognitivo,
+    )
+    filename = "items.ndjson.gz" if gzip else "items.ndjson"
+    return StreamingResponse(
+        export_ndjson(clauses, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/items/search", response_model=SearchResultSchema)
+async def search_item_bank(
+    q: str = Query(..., min_length=1, description='Texto a buscar: palabras, "frase exacta", OR, -excluir.'),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    status: Optional[List[str]] = Query(None),
+    asignatura: Optional[str] = None,
+    tema: Optional[str] = None,
+    nivel_cognitivo: Optional[str] = None,
+    tipo_reactivo: Optional[str] = None,
+    score_min: Optional[int] = Query(None, ge=0, le=100),
+    score_max: Optional[int] = Query(None, ge=0, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Busca en el banco ítems existentes por el texto del enunciado, el estímulo
+    y las opciones (en español, con derivación: 'suturas' encuentra 'suturar'),
+    ordenados por relevancia, con recuentos por asignatura, tema, nivel
+    cognitivo, tipo de reactivo y rango de puntuación (ver app.api.search).
+    """
+    clauses = async_crud.item_filter_clauses(
+        status=status, asignatura=asignatura, tema=tema, nivel_cognitivo=nivel_cognitivo,
+        tipo_reactivo=tipo_reactivo, score_min=score_min, score_max=score_max,
+    )
+    return await search_items(db, q, clauses, limit=limit, offset=offset)
+
+
 @router.get("/items/{item_id}", response_model=ItemPayloadSchema)
-def get_item(item_id: str, db: Session = Depends(get_db)):
+async def get_item(item_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint para obtener un ítem específico por su ID.
     Actualizado para devolver el payload completo usando ItemPayloadSchema.
@@ -86,7 +267,7 @@ def get_item(item_id: str, db: Session = Depends(get_db)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid item ID format.")
 
-    db_item = crud.get_item(db, item_uuid)
+    db_item = await async_crud.get_item(db, item_uuid)
     if db_item is None or not db_item.payload:
         raise HTTPException(status_code=404, detail="Item not found or has no payload.")
 
@@ -96,28 +277,47 @@ def get_item(item_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/items/batch/{batch_id}", response_model=BatchStatusResultSchema)
-def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene el estado de un lote de generación de ítems.
-    Permite al usuario sondear el resultado de su solicitud asíncrona.
+    Permite al usuario sondear el resultado de su solicitud asíncrona. Mientras
+    el lote está en curso en este proceso se responde desde el estado en vivo
+    (con el progreso por etapa); al terminar, desde la base de datos.
     """
     logger.info(f"Fetching status for batch_id: {batch_id}")
-    db_items = crud.get_items_by_batch_id(db, batch_id)
+    # Un lote en curso en este proceso se sirve desde memoria, sin consultar la DB.
+    live = live_status.get_batch_summary(batch_id)
+    if live is not None:
+        return _live_batch_status(batch_id, live)
+
+    # Coste constante por sondeo: recuentos agregados en SQL y proyección
+    # estrecha, sin cargar los payloads ni los registros JSONB de cada ítem.
+    total_items, processed_items, successful_items, failed_items, tokens_used, cost_usd = (
+        await async_crud.get_batch_status_counts(db, batch_id)
+    )
 
-    if not db_items:
+    if not total_items:
         raise HTTPException(status_code=404, detail="Batch ID not found.")
 
-    total_items = len(db_items)
-    processed_items = sum(1 for item in db_items if item.status != ItemStatus.PENDING.value)
-    successful_items = sum(1 for item in db_items if item.status == ItemStatus.PERSISTENCE_SUCCESS.value)
-    failed_items = sum(1 for item in db_items if item.status == ItemStatus.FATAL.value)
     is_complete = processed_items == total_items
 
     results = [
-        {"item_id": item.id, "temp_id": item.temp_id, "status": item.status}
-        for item in db_items
+        {"item_id": item_id, "temp_id": temp_id, "status": status}
+        for item_id, temp_id, status in await async_crud.get_batch_item_statuses(db, batch_id)
     ]
 
+    # El gasto registrado incluye las llamadas de ítems que no llegaron a persistirse.
+    budget_row = await async_crud.get_batch_budget(db, batch_id)
+    if budget_row is not None:
+        budget = BatchBudgetSchema(
+            max_tokens=budget_row.max_tokens,
+            max_cost_usd=budget_row.max_cost_usd,
+            tokens_used=budget_row.tokens_used,
+            cost_usd=budget_row.cost_usd,
+        )
+    else:
+        budget = BatchBudgetSchema(tokens_used=tokens_used, cost_usd=cost_usd)
+
     return BatchStatusResultSchema(
         batch_id=batch_id,
         is_complete=is_complete,
@@ -126,14 +326,195 @@ def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
         successful_items=successful_items,
         failed_items=failed_items,
         results=results,
+        budget=budget,
+    )
+
+
+def _live_batch_status(batch_id: str, live: dict) -> BatchStatusResultSchema:
+    return BatchStatusResultSchema(
+        batch_id=batch_id,
+        is_complete=False,
+        total_items=live["total_items"],
+        processed_items=live["processed_items"],
+        successful_items=live["successful_items"],
+        failed_items=live["failed_items"],
+        results=live["results"],
+        budget=BatchBudgetSchema(
+            max_tokens=live["max_tokens"],
+            max_cost_usd=live["max_cost_usd"],
+            tokens_used=live["tokens_used"],
+            cost_usd=live["cost_usd"],
+        ),
+        current_stage=live["current_stage"],
+        stages=live["stages"],
+    )
+
+
+@router.get("/items/batch/{batch_id}/items", response_model=List[ItemPayloadSchema])
+async def get_batch_items(
+    batch_id: str,
+    status: Optional[List[str]] = Query(None, description="Solo los ítems con estos estados."),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Payloads de todos los ítems del lote en una sola consulta, en lugar de un GET /items/{id} por ítem."""
+    payloads = await async_crud.get_batch_payloads(db, batch_id, status)
+    if not payloads:
+        raise HTTPException(status_code=404, detail="Batch ID not found or has no items with payload.")
+    return payloads
+
+
+@router.get("/items/batch/{batch_id}/events")
+async def stream_batch_events(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events con el progreso del lote: transiciones de estado de
+    cada ítem según ocurren y el payload de cada ítem en cuanto se persiste,
+    hasta el evento 'complete' (ver app.api.batch_events).
+    """
+    if not await batch_exists(db, batch_id):
+        raise HTTPException(status_code=404, detail="Batch ID not found.")
+
+    async def event_stream():
+        async for event in batch_events(batch_id):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
-@router.get("/items", response_model=List[dict])
-def get_all_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.websocket("/items/batch/{batch_id}/ws")
+async def batch_events_websocket(websocket: WebSocket, batch_id: str):
+    """Equivalente WebSocket de /items/batch/{batch_id}/events: un mensaje JSON {event, data} por evento."""
+    await websocket.accept()
+    async with AsyncSessionLocal() as db:
+        found = await batch_exists(db, batch_id)
+    if not found:
+        await websocket.close(code=4404, reason="Batch ID not found.")
+        return
+    try:
+        async for event in batch_events(batch_id):
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
+@router.post("/items/batch/{batch_id}/cancel", response_model=BatchCancelResultSchema, status_code=202)
+async def cancel_batch_run(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Solicita la cancelación de un lote en ejecución. Las etapas en curso se
+    interrumpen y los ítems pendientes quedan marcados como 'skipped'.
+    En modo 'queue' o 'distributed' el lote puede estar en otro proceso: la solicitud se
+    registra en su trabajo y el worker la aplica en el siguiente heartbeat.
     """
-    Endpoint para obtener una lista de todos los ítems.
+    logger.info(f"Cancel requested for batch_id: {batch_id}")
+    cancelled = cancel_batch(batch_id)
+    if not cancelled and settings.pipeline_execution_mode in ("queue", "distributed"):
+        cancelled = await db.run_sync(crud.request_job_cancellation, batch_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="Batch ID not found or not running.")
+
+    return BatchCancelResultSchema(batch_id=batch_id, message="Cancellation requested.")
+
+
+@router.get("/items/{item_id}/history", response_model=ItemHistorySchema)
+async def get_item_history(item_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    """Auditoría por etapa, hallazgos y correcciones del ítem (tabla `item_events`)."""
+    events = await async_crud.get_item_events(db, item_id)
+    if not events and await async_crud.get_item(db, item_id) is None:
+        raise HTTPException(status_code=404, detail="Item not found.")
+    entries = {"revision": [], "finding": [], "correction": []}
+    for event in events:
+        entries[event.kind].append(event.data)
+    return ItemHistorySchema(
+        item_id=item_id,
+        revision_log=entries["revision"],
+        findings=entries["finding"],
+        change_log=entries["correction"],
+    )
+
+
+@router.get("/items/{item_id}/revisions", response_model=List[ItemRevisionSchema])
+async def get_item_revisions(
+    item_id: uuid.UUID,
+    from_revision: int = Query(0, ge=0),
+    to_revision: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    items = crud.get_items(db, skip=skip, limit=limit)
-    # Devuelve una lista simplificada para no sobrecargar la respuesta.
-    return [{"item_id": str(item.item_id), "status": item.status} for item in items]
+    Revisiones del payload del ítem: la etapa que hizo cada cambio y su parche
+    JSON (RFC 6902). Aplicar en orden los parches de (a, b] lleva de la
+    revisión a a la b, así que un diff entre revisiones es esta misma lista.
+    """
+    rows = await async_crud.get_item_revisions(db, item_id, from_revision, to_revision)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Item not found or has no revisions in that range.")
+    return [
+        ItemRevisionSchema(revision=revision, stage_name=stage_name, timestamp=occurred_at, patch=patch, has_snapshot=has_snapshot)
+        for revision, stage_name, occurred_at, patch, has_snapshot in rows
+    ]
+
+
+@router.get("/items/{item_id}/revisions/{revision}", response_model=ItemPayloadSchema)
+async def get_item_payload_at_revision(item_id: uuid.UUID, revision: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Payload del ítem tal como quedó en la revisión indicada, reconstruido desde
+    el snapshot anterior más cercano (ver app.pipelines.payload_versions).
+    """
+    chain = await async_crud.get_revision_chain(db, item_id, revision)
+    if not chain or chain[-1].revision != revision:
+        raise HTTPException(status_code=404, detail="Item or revision not found.")
+    return payload_versions.reconstruct(chain[0].snapshot, [row.patch for row in chain[1:]])
+
+
+@router.get("/pipeline/queues", response_model=List[QueueDepthSchema])
+async def get_queue_depths(db: AsyncSession = Depends(get_async_db)):
+    """
+    Métricas de profundidad por cola (una por etapa en el modo distribuido),
+    para dimensionar por separado el pool de workers de cada una.
+    """
+    return [
+        QueueDepthSchema(
+            resource_class="mixed" if depth["queue"] == "pipeline" else get_stage_resource_class(depth["queue"]),
+            **depth,
+        )
+        for depth in await db.run_sync(crud.get_queue_depths)
+    ]
+
+
+@router.get("/items", response_model=ItemPageSchema)
+async def get_all_items(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="`next_cursor` de la página anterior."),
+    batch_id: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    asignatura: Optional[str] = None,
+    tema: Optional[str] = None,
+    nivel_cognitivo: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Lista los ítems del más reciente al más antiguo, con filtros opcionales.
+    La paginación es por clave (created_at, id): cada página cuesta lo mismo a
+    cualquier profundidad. Para la página siguiente se envía `next_cursor`.
+    """
+    clauses = async_crud.item_filter_clauses(
+        batch_id=batch_id, status=status, asignatura=asignatura, tema=tema, nivel_cognitivo=nivel_cognitivo,
+    )
+    after = decode_cursor(cursor) if cursor else None
+    # Una fila de más indica si hay página siguiente.
+    rows = await async_crud.list_items(db, clauses, after=after, limit=limit + 1)
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    return ItemPageSchema(
+        items=[
+            ItemSummarySchema(
+                item_id=item_id, batch_id=row_batch_id, status=row_status, created_at=created_at,
+                asignatura=row_asignatura, tema=row_tema, nivel_cognitivo=row_nivel_cognitivo,
+            )
+            for item_id, row_batch_id, row_status, created_at, row_asignatura, row_tema, row_nivel_cognitivo in page
+        ],
+        next_cursor=next_cursor,
+    )
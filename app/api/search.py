@@ -0,0 +1,47 @@
+# app/api/search.py
+
+"""
+Búsqueda de texto completo y facetas sobre el banco de ítems para
+`GET /items/search`: antes de pagar por generar ítems nuevos se buscan los
+existentes por el texto del enunciado, el estímulo y las opciones.
+
+El texto buscable (`items.search_vector`) y los campos de faceta son columnas
+generadas por Postgres a partir del payload, con índices GIN y btree (ver
+migration.sql), de modo que siempre están al día sin código que los mantenga.
+"""
+
+from typing import Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import async_crud
+from app.schemas.item_schemas import FacetValueSchema, SearchHitSchema, SearchResultSchema
+
+# Rangos de `final_evaluation.score_total` (0-100) de la faceta 'score_range';
+# 85 es el umbral de producción del evaluador final.
+SCORE_RANGES = [(0, 59), (60, 69), (70, 84), (85, 100)]
+
+
+async def search_items(db: AsyncSession, query: str, clauses: list, limit: int, offset: int) -> SearchResultSchema:
+    max_candidates = settings.search_max_candidates
+    hits, counts = await async_crud.search_items(
+        db, query, clauses, SCORE_RANGES, limit=limit, offset=offset, max_candidates=max_candidates,
+    )
+
+    total = 0
+    facets: Dict[str, List[FacetValueSchema]] = {name: [] for name in async_crud.SEARCH_FACETS}
+    for facet, value, count in counts:
+        if facet is None:
+            total = count
+        elif value is not None:
+            facets[facet].append(FacetValueSchema(value=str(value), count=count))
+    for values in facets.values():
+        values.sort(key=lambda facet_value: (-facet_value.count, facet_value.value))
+
+    return SearchResultSchema(
+        total=total,
+        truncated=total >= max_candidates,
+        items=[SearchHitSchema(item_id=hit["id"], **{k: v for k, v in hit.items() if k != "id"}) for hit in hits],
+        facets=facets,
+    )
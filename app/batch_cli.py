@@ -0,0 +1,256 @@
+# app/batch_cli.py
+
+"""
+Generación masiva fuera de línea, sin pasar por la API HTTP.
+
+Lee archivos de solicitudes (`ItemGenerationParams`) en JSON (un objeto o una
+lista, p. ej. request_item.json o ejemplos.md) o NDJSON, ejecuta el pipeline
+directamente por ventanas y escribe cada ítem terminado como una línea NDJSON.
+El progreso y el throughput por etapa se muestran en stderr; el archivo de
+estado permite reanudar un trabajo interrumpido sin repetir solicitudes.
+
+Uso:
+    python -m app.batch_cli ejemplos.md --output banco.ndjson --concurrency 8
+    python -m app.batch_cli solicitudes.ndjson -o banco.ndjson --persist --state-file banco.state
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from app.core.config import settings
+from app.core.log import logger
+from app.llm.providers import set_concurrency_limit
+from app.schemas.enums import ItemStatus
+from app.schemas.models import Item
+from app.pipelines.cancellation import CancellationToken
+from app.pipelines.metrics import get_stage_throughput
+from app.pipelines.runner import load_pipeline_config, run as run_pipeline_async
+from app.pipelines.utils.overprovision import is_surplus_candidate
+from app.pipelines.utils.stage_helpers import initialize_items_for_pipeline
+
+# Importación por efecto secundario: registra todas las etapas del pipeline.
+from app.pipelines import builtins  # noqa: F401
+
+NDJSON_SUFFIXES = {".ndjson", ".jsonl"}
+SUCCESS_STATUSES = {ItemStatus.PERSISTENCE_SUCCESS, ItemStatus.EVALUATION_COMPLETE}
+
+
+def read_requests(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Lee las solicitudes de los archivos, de forma perezosa en el caso de NDJSON."""
+    for path in paths:
+        if Path(path).suffix.lower() in NDJSON_SUFFIXES:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            continue
+
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            yield from data
+        else:
+            yield data
+
+
+class BatchJob:
+    """
+    Lleva el seguimiento de las solicitudes de un trabajo: escribe los ítems
+    de cada solicitud cuando todos sus ítems han terminado y mantiene el
+    archivo de estado con el número de solicitudes completadas (en orden).
+    """
+
+    def __init__(self, inputs: List[str], output: TextIO, state_file: Optional[str]):
+        self.inputs = [str(Path(p).resolve()) for p in inputs]
+        self.output = output
+        self.state_file = state_file
+        self.skip_requests = self._load_state()
+
+        self._request_by_batch: Dict[str, int] = {}
+        self._pending_ids: Dict[int, Set[str]] = {}
+        self._finished: Dict[int, List[Item]] = {}
+        self._invalid: Set[int] = set()
+        self._next_to_flush = self.skip_requests
+
+        self.start_time = time.monotonic()
+        self.items_done = 0
+        self.items_ok = 0
+        self.items_failed = 0
+        self.items_discarded = 0
+
+    def _load_state(self) -> int:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return 0
+        with open(self.state_file, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("inputs") != self.inputs:
+            raise SystemExit(f"El archivo de estado {self.state_file} corresponde a otras entradas: {state.get('inputs')}")
+        logger.info(f"Reanudando: se omiten las primeras {state['completed_requests']} solicitudes ya completadas.")
+        return state["completed_requests"]
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"inputs": self.inputs, "completed_requests": self._next_to_flush}, f)
+        os.replace(tmp_path, self.state_file)
+
+    def items(self, requests: Iterator[Dict[str, Any]]) -> Iterator[Item]:
+        """Convierte las solicitudes en ítems, omitiendo las ya completadas."""
+        for index, params in enumerate(requests):
+            if index < self.skip_requests:
+                continue
+            # Sin prioridad explícita, la generación masiva cede el paso a la interactiva.
+            items = initialize_items_for_pipeline({"priority": "bulk", **params})
+            if not items:
+                self._invalid.add(index)
+                self._finished[index] = []
+                self._flush()
+                continue
+            self._request_by_batch[items[0].batch_id] = index
+            self._pending_ids[index] = {str(item.temp_id) for item in items}
+            self._finished[index] = []
+            yield from items
+
+    def on_window_complete(self, window: List[Item], cancelled: bool):
+        # Una ventana cancelada no se registra: se repetirá al reanudar.
+        if cancelled:
+            return
+        for item in window:
+            index = self._request_by_batch[item.batch_id]
+            self._pending_ids[index].discard(str(item.temp_id))
+            if is_surplus_candidate(item):
+                # Candidato excedente de la sobre-generación: no es un resultado.
+                self.items_discarded += 1
+                continue
+            self._finished[index].append(item)
+            self.items_done += 1
+            if item.status in SUCCESS_STATUSES:
+                self.items_ok += 1
+            elif item.status == ItemStatus.FATAL:
+                self.items_failed += 1
+        self._flush()
+        self.report_progress()
+
+    def _flush(self):
+        """Escribe, en orden, las solicitudes cuyos ítems ya terminaron todos."""
+        flushed = False
+        while self._next_to_flush in self._finished and not self._pending_ids.get(self._next_to_flush):
+            index = self._next_to_flush
+            if index in self._invalid:
+                self._invalid.discard(index)
+                self._write({"request_index": index, "error": "Solicitud inválida; ver el log para el detalle."})
+            for item in self._finished.pop(index):
+                record = item.model_dump(mode="json")
+                record["request_index"] = index
+                self._write(record)
+            self._pending_ids.pop(index, None)
+            self._next_to_flush += 1
+            flushed = True
+        if flushed:
+            self.output.flush()
+            self._save_state()
+
+    def _write(self, record: Dict[str, Any]):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def report_progress(self):
+        elapsed = time.monotonic() - self.start_time
+        rate = self.items_done / elapsed if elapsed > 0 else 0.0
+        discarded = f", {self.items_discarded} candidatos excedentes descartados" if self.items_discarded else ""
+        print(
+            f"[sigie-batch] {self.items_done} ítems ({self.items_ok} ok, {self.items_failed} fallidos{discarded}), "
+            f"{self._next_to_flush} solicitudes completas, {rate:.2f} ítems/s",
+            file=sys.stderr,
+        )
+
+    def report_stage_throughput(self):
+        for stage_name, stats in get_stage_throughput().items():
+            print(
+                f"[sigie-batch]   {stage_name:<24} {stats['items']:>7} ítems  "
+                f"{stats['seconds']:>9.2f} s  {stats['items_per_second']:>8.2f} ítems/s",
+                file=sys.stderr,
+            )
+
+
+def _prepare_config(config_path: str, persist: bool) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    config = load_pipeline_config(config_path)
+    if config is None:
+        return None, f"No se pudo cargar la configuración del pipeline: {config_path}"
+    if not persist:
+        config["stages"] = [stage for stage in config.get("stages", []) if stage.get("name") != "persist"]
+    return config, None
+
+
+async def _run(args) -> int:
+    config, error = _prepare_config(args.config, args.persist)
+    if error:
+        print(error, file=sys.stderr)
+        return 1
+
+    set_concurrency_limit(args.concurrency)
+    token = CancellationToken()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, token.cancel, "Interrumpido por el usuario.")
+        except NotImplementedError:
+            pass
+
+    output_mode = "a" if args.state_file and os.path.exists(args.state_file) else "w"
+    output = sys.stdout if args.output == "-" else open(args.output, output_mode, encoding="utf-8")
+    try:
+        job = BatchJob(args.inputs, output, args.state_file)
+        ctx: Dict[str, Any] = {
+            "cancel_token": token,
+            "on_window_complete": lambda window: job.on_window_complete(window, token.cancelled),
+        }
+        if args.persist:
+            from app.db.session import PipelineSessionLocal
+            ctx["async_session_factory"] = PipelineSessionLocal
+
+        await run_pipeline_async(
+            pipeline_config_path=args.config,
+            item_source=job.items(read_requests(args.inputs)),
+            window_size=args.window_size,
+            ctx=ctx,
+            config=config,
+        )
+        job.report_progress()
+        job.report_stage_throughput()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if args.persist:
+            from app.db.session import dispose_async_engines
+            await dispose_async_engines()
+
+    if token.cancelled:
+        print(f"[sigie-batch] Interrumpido; reanuda con el mismo --state-file. ({token.reason})", file=sys.stderr)
+        return 130
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generación masiva de ítems sin la API HTTP (sigie-batch).")
+    parser.add_argument("inputs", nargs="+", help="Archivos de solicitudes: JSON (objeto o lista) o NDJSON (.ndjson/.jsonl).")
+    parser.add_argument("-o", "--output", default="-", help="Archivo NDJSON de resultados ('-' para stdout).")
+    parser.add_argument("--config", default=settings.pipeline_config_path, help="Archivo de configuración del pipeline.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Máximo de llamadas LLM simultáneas.")
+    parser.add_argument("--window-size", type=int, default=None, help="Ítems por ventana (por defecto, window_size de pipeline.yml).")
+    parser.add_argument("--persist", action="store_true", help="Persiste también los ítems en la base de datos.")
+    parser.add_argument("--state-file", default=None, help="Archivo de estado para reanudar el trabajo.")
+    args = parser.parse_args(argv)
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
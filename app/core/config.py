@@ -1,5 +1,5 @@
 # app/core/config.py
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import ConfigDict, Field
 from pydantic_settings import BaseSettings
 
@@ -19,6 +19,11 @@ class Settings(BaseSettings):
     # Configuración de la Base de Datos
     database_url: str = Field(..., env="DATABASE_URL")
     psql_database_url: Optional[str] = Field(None, env="PSQL_DATABASE_URL")
+    # Pools de conexiones asíncronas: uno para las peticiones de la API y otro,
+    # independiente, para las escrituras del pipeline (p. ej. 'persist').
+    db_pool_size: int = Field(5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(10, env="DB_MAX_OVERFLOW")
+    db_pipeline_pool_size: int = Field(5, env="DB_PIPELINE_POOL_SIZE")
 
     # Configuración del Proveedor de LLM
     llm_provider: LLMProvider = Field(
@@ -45,6 +50,89 @@ class Settings(BaseSettings):
     llm_max_tokens: int = Field(3000, env="LLM_MAX_TOKENS")
     prompt_version: str = Field("2025-07-01", env="PROMPT_VERSION")
     llm_temperature: float = Field(0.7, env="LLM_TEMPERATURE")
+    # Llamadas LLM simultáneas por proceso (0 = sin límite). Con el límite
+    # alcanzado, las llamadas esperan en el planificador por clase de
+    # prioridad (pesos relativos) y por cliente y lote a partes iguales.
+    llm_max_concurrency: int = Field(16, env="LLM_MAX_CONCURRENCY")
+    llm_priority_weights: Dict[str, float] = Field(
+        default_factory=lambda: {"interactive": 16.0, "bulk": 4.0, "prefill": 1.0},
+        env="LLM_PRIORITY_WEIGHTS",
+    )
+
+    # Ejecución del pipeline: 'background' (BackgroundTasks de FastAPI),
+    # 'queue' (cola durable en Postgres consumida por procesos `app.worker`) o
+    # 'distributed' (una cola por etapa, cada una con su propio pool de workers).
+    pipeline_execution_mode: Literal["background", "queue", "distributed"] = Field("background", env="PIPELINE_EXECUTION_MODE")
+    pipeline_config_path: str = Field("pipeline.yml", env="PIPELINE_CONFIG_PATH")
+    worker_concurrency: int = Field(4, env="WORKER_CONCURRENCY")
+    worker_lease_seconds: int = Field(120, env="WORKER_LEASE_SECONDS")
+    worker_heartbeat_seconds: int = Field(30, env="WORKER_HEARTBEAT_SECONDS")
+    worker_poll_interval_seconds: float = Field(1.0, env="WORKER_POLL_INTERVAL_SECONDS")
+    worker_max_attempts: int = Field(3, env="WORKER_MAX_ATTEMPTS")
+
+    # Agrupación de solicitudes de generación idénticas: ventana (en segundos)
+    # durante la que una solicitud repetida se une al lote anterior aunque ya
+    # haya terminado, y vigencia de las cabeceras Idempotency-Key.
+    generation_coalesce_window_seconds: int = Field(30, env="GENERATION_COALESCE_WINDOW_SECONDS")
+    idempotency_key_ttl_seconds: int = Field(86400, env="IDEMPOTENCY_KEY_TTL_SECONDS")
+
+    # Inventario de ítems pregenerados para las combinaciones más solicitadas:
+    # una combinación es popular con INVENTORY_MIN_REQUESTS solicitudes y la
+    # última dentro de INVENTORY_DEMAND_WINDOW_DAYS; su reserva se repone hasta
+    # INVENTORY_TARGET_STOCK ítems no entregados cuando hay capacidad ociosa.
+    inventory_enabled: bool = Field(False, env="INVENTORY_ENABLED")
+    inventory_target_stock: int = Field(20, env="INVENTORY_TARGET_STOCK")
+    inventory_min_requests: int = Field(3, env="INVENTORY_MIN_REQUESTS")
+    inventory_demand_window_days: int = Field(7, env="INVENTORY_DEMAND_WINDOW_DAYS")
+    inventory_prefill_interval_seconds: float = Field(60.0, env="INVENTORY_PREFILL_INTERVAL_SECONDS")
+
+    # Control de admisión de /items/generate: 429 si el tiempo estimado de
+    # finalización supera ADMISSION_MAX_ETA_SECONDS (0 = sin límite) o si el
+    # cliente supera su cuota de ítems pendientes. ADMISSION_TENANT_QUOTAS
+    # fija cuotas por cliente como JSON, p. ej. {"lote-masivo": 200}.
+    admission_max_eta_seconds: int = Field(3600, env="ADMISSION_MAX_ETA_SECONDS")
+    admission_throughput_window_seconds: int = Field(900, env="ADMISSION_THROUGHPUT_WINDOW_SECONDS")
+    admission_default_items_per_minute: float = Field(5.0, env="ADMISSION_DEFAULT_ITEMS_PER_MINUTE")
+    admission_default_batch_seconds: float = Field(120.0, env="ADMISSION_DEFAULT_BATCH_SECONDS")
+    admission_tenant_max_pending_items: Optional[int] = Field(50, env="ADMISSION_TENANT_MAX_PENDING_ITEMS")
+    admission_tenant_quotas: Dict[str, int] = Field(default_factory=dict, env="ADMISSION_TENANT_QUOTAS")
+
+    # Presupuesto de tokens y coste (USD) de las llamadas LLM. Cada lote
+    # dispone de BUDGET_MAX_*_PER_ITEM por ítem solicitado y cada cliente
+    # (X-Tenant-ID) de BUDGET_TENANT_MONTHLY_* al mes (0 = sin límite);
+    # BUDGET_TENANT_MONTHLY_COST_USD_OVERRIDES fija límites de coste por cliente
+    # como JSON. LLM_MODEL_PRICES amplía o corrige la tabla de precios
+    # (USD por millón de tokens), p. ej. {"mi-modelo": {"input": 0.2, "output": 0.8}}.
+    budget_max_tokens_per_item: int = Field(20000, env="BUDGET_MAX_TOKENS_PER_ITEM")
+    budget_max_cost_usd_per_item: float = Field(0.05, env="BUDGET_MAX_COST_USD_PER_ITEM")
+    budget_tenant_monthly_max_tokens: int = Field(0, env="BUDGET_TENANT_MONTHLY_MAX_TOKENS")
+    budget_tenant_monthly_max_cost_usd: float = Field(0.0, env="BUDGET_TENANT_MONTHLY_MAX_COST_USD")
+    budget_tenant_monthly_cost_usd_overrides: Dict[str, float] = Field(
+        default_factory=dict, env="BUDGET_TENANT_MONTHLY_COST_USD_OVERRIDES"
+    )
+    llm_model_prices: Dict[str, Dict[str, float]] = Field(default_factory=dict, env="LLM_MODEL_PRICES")
+
+    # Estado en vivo de los lotes en curso en el proceso de la API: como mucho
+    # LIVE_STATUS_MAX_BATCHES lotes; uno sin cambios durante
+    # LIVE_STATUS_TTL_SECONDS se descarta.
+    live_status_max_batches: int = Field(1000, env="LIVE_STATUS_MAX_BATCHES")
+    live_status_ttl_seconds: float = Field(3600.0, env="LIVE_STATUS_TTL_SECONDS")
+    # Eventos de un lote (SSE/WebSocket): intervalo de sondeo de la base de
+    # datos para los lotes que no están en curso en este proceso y de los
+    # mensajes 'ping' que mantienen viva la conexión.
+    batch_events_poll_seconds: float = Field(2.0, env="BATCH_EVENTS_POLL_SECONDS")
+    batch_events_keepalive_seconds: float = Field(15.0, env="BATCH_EVENTS_KEEPALIVE_SECONDS")
+    # Búsqueda (GET /items/search): el ranking y las facetas se calculan
+    # sobre como mucho SEARCH_MAX_CANDIDATES coincidencias, para que una
+    # consulta muy general no recorra todo el banco.
+    search_max_candidates: int = Field(2000, env="SEARCH_MAX_CANDIDATES")
+    # Historial del payload: cada PAYLOAD_SNAPSHOT_INTERVAL revisiones se
+    # guarda el payload completo, así que reconstruir una revisión aplica
+    # como mucho ese número de parches menos uno.
+    payload_snapshot_interval: int = Field(10, env="PAYLOAD_SNAPSHOT_INTERVAL")
+
+    # Workers de los pools para etapas CPU-bound (por defecto, número de CPUs).
+    cpu_executor_max_workers: Optional[int] = Field(None, env="CPU_EXECUTOR_MAX_WORKERS")
 
     # Configuración del Proyecto FastAPI
     PROJECT_NAME: str = "SIGIE API"
@@ -0,0 +1,131 @@
+# app/core/json_patch.py
+
+"""
+Parches JSON (RFC 6902) reversibles entre dos versiones de un documento.
+
+`diff` antepone a cada 'replace' y 'remove' una operación 'test' con el valor
+anterior, igual que `ProposedPatch` guarda `texto_original` junto al
+`texto_refinado`. Así un parche se valida al aplicarlo (un 'test' que no
+coincide delata un historial incoherente) y se puede invertir sin guardar la
+versión anterior completa.
+
+Las listas de igual longitud se comparan elemento a elemento; si cambia su
+longitud se reemplaza la lista entera.
+"""
+
+import copy
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+Patch = List[Dict[str, Any]]
+
+
+def _escape(key: str) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(before: Any, after: Any, path: str = "") -> Patch:
+    """Operaciones que convierten `before` en `after`."""
+    if before == after:
+        return []
+    if isinstance(before, dict) and isinstance(after, dict):
+        ops: Patch = []
+        for key, value in before.items():
+            key_path = f"{path}/{_escape(key)}"
+            if key not in after:
+                ops += [{"op": "test", "path": key_path, "value": value}, {"op": "remove", "path": key_path}]
+            else:
+                ops += diff(value, after[key], key_path)
+        for key, value in after.items():
+            if key not in before:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+        return ops
+    if isinstance(before, list) and isinstance(after, list) and len(before) == len(after):
+        ops = []
+        for index, (old, new) in enumerate(zip(before, after)):
+            ops += diff(old, new, f"{path}/{index}")
+        return ops
+    return [{"op": "test", "path": path, "value": before}, {"op": "replace", "path": path, "value": after}]
+
+
+def invert(patch: Patch) -> Patch:
+    """Parche que deshace `patch` (requiere los 'test' que genera `diff`)."""
+    groups: List[Patch] = []
+    previous: Dict[str, Any] = {}
+    for op in patch:
+        kind, path = op["op"], op["path"]
+        if kind == "test":
+            previous[path] = op["value"]
+        elif kind == "replace":
+            groups.append([{"op": "test", "path": path, "value": op["value"]},
+                           {"op": "replace", "path": path, "value": previous.pop(path)}])
+        elif kind == "remove":
+            groups.append([{"op": "add", "path": path, "value": previous.pop(path)}])
+        elif kind == "add":
+            groups.append([{"op": "test", "path": path, "value": op["value"]}, {"op": "remove", "path": path}])
+        else:
+            raise ValueError(f"Operación no reversible: {kind}")
+    return [op for group in reversed(groups) for op in group]
+
+
+def apply(document: Any, patch: Patch, in_place: bool = False) -> Any:
+    """
+    Aplica `patch` y devuelve el documento resultante. Lanza ValueError si un
+    'test' no coincide. Con `in_place` modifica `document` en lugar de copiarlo.
+    """
+    if not in_place:
+        document = copy.deepcopy(document)
+    for op in patch:
+        kind, path = op["op"], op["path"]
+        if path == "":
+            if kind == "test":
+                if document != op["value"]:
+                    raise ValueError("El documento no coincide con el 'test' del parche en la raíz.")
+            elif kind in ("add", "replace"):
+                document = copy.deepcopy(op["value"])
+            else:
+                raise ValueError(f"Operación '{kind}' no válida en la raíz del documento.")
+            continue
+
+        *parents, last = [_unescape(token) for token in path.split("/")[1:]]
+        target = document
+        for token in parents:
+            target = target[int(token)] if isinstance(target, list) else target[token]
+        key = int(last) if isinstance(target, list) else last
+
+        if kind == "test":
+            if target[key] != op["value"]:
+                raise ValueError(f"El documento no coincide con el 'test' del parche en '{path}'.")
+        elif kind == "replace":
+            target[key] = copy.deepcopy(op["value"])
+        elif kind == "add":
+            if isinstance(target, list):
+                target.insert(key, copy.deepcopy(op["value"]))
+            else:
+                target[key] = copy.deepcopy(op["value"])
+        elif kind == "remove":
+            del target[key]
+        else:
+            raise ValueError(f"Operación no soportada: {kind}")
+    return document
+
+
+def rewind(document: Any, history: Iterable[Tuple[Any, Optional[Patch]]], wanted: Iterable[Any]) -> Dict[Any, Any]:
+    """
+    Versiones anteriores de `document`. `history` lista, de la más antigua a
+    la actual, cada versión como (clave, parche que la produjo); devuelve las
+    versiones de `wanted` por clave, deshaciendo los parches desde `document`
+    (que no se modifica).
+    """
+    wanted = set(wanted)
+    document = copy.deepcopy(document)
+    versions = {}
+    for key, patch in reversed(list(history)):
+        if key in wanted:
+            versions[key] = copy.deepcopy(document)
+        if patch:
+            document = apply(document, invert(patch), in_place=True)
+    return versions
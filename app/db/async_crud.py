@@ -0,0 +1,356 @@
+# app/db/async_crud.py
+
+"""
+Equivalentes asíncronos (AsyncSession) de las operaciones de `crud` que se
+ejecutan en el event loop: la persistencia y el presupuesto del pipeline y
+las lecturas que sondea la GUI. Así una escritura en la base de datos no
+bloquea las corrutinas LLM en curso.
+"""
+
+import logging
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, func, literal_column, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models as db_models
+from app.core.config import settings
+from .crud import (
+    assign_item_ids,
+    build_item_events_insert,
+    build_item_revisions_insert,
+    build_item_upserts,
+    item_event_rows,
+    item_revision_rows,
+)
+from app.schemas import models as pydantic_models
+from app.schemas.enums import ItemStatus
+
+logger = logging.getLogger(__name__)
+
+
+async def save_items(db: AsyncSession, items: List[pydantic_models.Item]) -> List[uuid.UUID]:
+    """Guarda o actualiza los ítems y añade su historial y revisiones nuevos en una sola transacción (ver crud.save_items)."""
+    try:
+        returned_rows = []
+        for stmt, rows in build_item_upserts(items):
+            returned_rows.extend((await db.execute(stmt, rows)).all())
+        item_ids = assign_item_ids(items, returned_rows)
+        event_rows = item_event_rows(items)
+        if event_rows:
+            await db.execute(build_item_events_insert(), event_rows)
+        revision_rows = item_revision_rows(items, settings.payload_snapshot_interval)
+        if revision_rows:
+            await db.execute(build_item_revisions_insert(), revision_rows)
+        await db.commit()
+        logger.info(f"Successfully saved or updated {len(items)} items in the database.")
+        return item_ids
+
+    except Exception as e:
+        logger.error(f"Failed to save items to the database. Rolling back transaction. Error: {e}", exc_info=True)
+        await db.rollback()
+        raise
+
+
+async def get_item(db: AsyncSession, item_id: uuid.UUID) -> Optional[db_models.ItemModel]:
+    return await db.get(db_models.ItemModel, item_id)
+
+
+async def list_items(
+    db: AsyncSession, clauses: list, after: Optional[Tuple[datetime, uuid.UUID]] = None, limit: int = 100
+) -> List[tuple]:
+    """
+    Página del listado de ítems, del más reciente al más antiguo, paginada por
+    clave: `after` es el (created_at, id) del último ítem de la página anterior.
+    Cada página cuesta lo mismo a cualquier profundidad, a diferencia de OFFSET.
+    Devuelve filas (id, batch_id, status, created_at, asignatura, tema, nivel_cognitivo).
+    """
+    Item = db_models.ItemModel
+    stmt = select(
+        Item.id,
+        Item.batch_id,
+        Item.status,
+        Item.created_at,
+        Item.asignatura,
+        Item.tema,
+        Item.nivel_cognitivo,
+    ).where(*clauses)
+    if after is not None:
+        stmt = stmt.where(tuple_(Item.created_at, Item.id) < tuple_(*after))
+    result = await db.execute(stmt.order_by(Item.created_at.desc(), Item.id.desc()).limit(limit))
+    return list(result)
+
+
+async def get_item_events(db: AsyncSession, item_id: uuid.UUID) -> List[db_models.ItemEventModel]:
+    """Historial del ítem, en el orden en que se registró cada entrada."""
+    Event = db_models.ItemEventModel
+    result = await db.execute(select(Event).where(Event.item_id == item_id).order_by(Event.kind, Event.id))
+    return list(result.scalars())
+
+
+async def get_item_revisions(
+    db: AsyncSession, item_id: uuid.UUID, from_revision: int = 0, to_revision: Optional[int] = None
+) -> List[tuple]:
+    """(revision, stage_name, occurred_at, patch, tiene snapshot) de las revisiones del ítem, sin los snapshots."""
+    Revision = db_models.ItemRevisionModel
+    stmt = select(
+        Revision.revision, Revision.stage_name, Revision.occurred_at, Revision.patch, Revision.snapshot.isnot(None),
+    ).where(Revision.item_id == item_id, Revision.revision >= from_revision)
+    if to_revision is not None:
+        stmt = stmt.where(Revision.revision <= to_revision)
+    result = await db.execute(stmt.order_by(Revision.revision))
+    return list(result)
+
+
+async def get_revision_chain(db: AsyncSession, item_id: uuid.UUID, revision: int) -> List[tuple]:
+    """
+    (revision, patch, snapshot) desde el último snapshot anterior o igual a
+    `revision` hasta ella: lo necesario para reconstruir su payload.
+    """
+    Revision = db_models.ItemRevisionModel
+    last_snapshot = (
+        select(func.max(Revision.revision))
+        .where(Revision.item_id == item_id, Revision.revision <= revision, Revision.snapshot.isnot(None))
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(Revision.revision, Revision.patch, Revision.snapshot)
+        .where(Revision.item_id == item_id, Revision.revision.between(last_snapshot, revision))
+        .order_by(Revision.revision)
+    )
+    return list(result)
+
+
+async def get_items_by_batch_id(db: AsyncSession, batch_id: str) -> List[db_models.ItemModel]:
+    result = await db.execute(select(db_models.ItemModel).where(db_models.ItemModel.batch_id == batch_id))
+    return list(result.scalars())
+
+
+async def get_batch_status_counts(db: AsyncSession, batch_id: str):
+    """
+    Recuento de los ítems de un lote por estado, en una sola consulta
+    agregada: (total, procesados, exitosos, fallidos, tokens, coste).
+    """
+    Item = db_models.ItemModel
+    result = await db.execute(
+        select(
+            func.count(),
+            func.count().filter(Item.status != ItemStatus.PENDING.value),
+            func.count().filter(Item.status == ItemStatus.PERSISTENCE_SUCCESS.value),
+            func.count().filter(Item.status == ItemStatus.FATAL.value),
+            func.coalesce(func.sum(Item.token_usage), 0),
+            func.coalesce(func.sum(Item.cost_usd), 0.0),
+        ).where(Item.batch_id == batch_id)
+    )
+    return result.one()
+
+
+async def get_batch_item_statuses(db: AsyncSession, batch_id: str) -> List[tuple]:
+    """(id, temp_id, status) de cada ítem del lote, sin las columnas JSONB."""
+    Item = db_models.ItemModel
+    result = await db.execute(
+        select(Item.id, Item.temp_id, Item.status).where(Item.batch_id == batch_id)
+    )
+    return list(result)
+
+
+def item_filter_clauses(
+    batch_id: Optional[str] = None,
+    status: Optional[List[str]] = None,
+    tenant_id: Optional[str] = None,
+    asignatura: Optional[str] = None,
+    tema: Optional[str] = None,
+    nivel_cognitivo: Optional[str] = None,
+    tipo_reactivo: Optional[str] = None,
+    score_min: Optional[int] = None,
+    score_max: Optional[int] = None,
+) -> list:
+    """Condiciones WHERE de los filtros de listado, búsqueda y exportación de ítems (None = sin filtro)."""
+    Item = db_models.ItemModel
+    clauses = []
+    if batch_id:
+        clauses.append(Item.batch_id == batch_id)
+    if status:
+        clauses.append(Item.status.in_(status))
+    if tenant_id:
+        clauses.append(Item.tenant_id == tenant_id)
+    if asignatura:
+        clauses.append(Item.asignatura == asignatura)
+    if tema:
+        clauses.append(Item.tema == tema)
+    if nivel_cognitivo:
+        clauses.append(Item.nivel_cognitivo == nivel_cognitivo)
+    if tipo_reactivo:
+        clauses.append(Item.tipo_reactivo == tipo_reactivo)
+    if score_min is not None:
+        clauses.append(Item.score_total >= score_min)
+    if score_max is not None:
+        clauses.append(Item.score_total <= score_max)
+    return clauses
+
+
+# Columnas por las que se cuentan las facetas de la búsqueda.
+SEARCH_FACETS = ("asignatura", "tema", "nivel_cognitivo", "tipo_reactivo", "score_range")
+
+
+async def search_items(
+    db: AsyncSession,
+    query: str,
+    clauses: list,
+    score_ranges: List[Tuple[int, int]],
+    limit: int = 20,
+    offset: int = 0,
+    max_candidates: int = 2000,
+) -> Tuple[List[dict], List[tuple]]:
+    """
+    Búsqueda de texto completo en español (sintaxis de `websearch_to_tsquery`:
+    palabras, "frase exacta", OR, -excluir) sobre `search_vector`, en una sola
+    consulta. Las coincidencias se limitan a `max_candidates`, y sobre ellas se
+    ordenan por relevancia y se cuentan las facetas con GROUPING SETS, leyendo
+    solo las columnas generadas (el payload se lee únicamente para la página).
+
+    Devuelve (resultados de la página, filas de facetas). Cada fila de facetas
+    es (faceta, valor, recuento); la faceta None es el total de coincidencias.
+    """
+    Item = db_models.ItemModel
+    tsquery = func.websearch_to_tsquery(literal_column("'spanish'"), query)
+    score_range = case(
+        *[(Item.score_total.between(low, high), f"{low}-{high}") for low, high in score_ranges],
+        else_=None,
+    )
+    candidates = (
+        select(
+            Item.id, Item.batch_id, Item.status, Item.asignatura, Item.tema, Item.nivel_cognitivo,
+            Item.tipo_reactivo, Item.score_total, score_range.label("score_range"),
+            func.ts_rank_cd(Item.search_vector, tsquery).label("rank"),
+        )
+        .where(Item.search_vector.op("@@")(tsquery), *clauses)
+        .limit(max_candidates)
+        .cte("candidates")
+        .prefix_with("MATERIALIZED")
+    )
+
+    page = select(candidates).order_by(candidates.c.rank.desc(), candidates.c.id).limit(limit).offset(offset).subquery()
+    hits = (
+        select(page, Item.payload["cuerpo_item"]["enunciado_pregunta"].astext.label("enunciado_pregunta"))
+        .join(Item, Item.id == page.c.id)
+        .order_by(page.c.rank.desc(), page.c.id)
+        .subquery("hits")
+    )
+
+    facet_columns = [candidates.c[name] for name in SEARCH_FACETS]
+    facets = (
+        select(*facet_columns, func.grouping(*facet_columns).label("grouping"), func.count().label("count"))
+        .group_by(func.grouping_sets(*[tuple_(column) for column in facet_columns], tuple_()))
+        .subquery("facets")
+    )
+
+    result = await db.execute(
+        select(
+            select(func.coalesce(func.json_agg(hits.table_valued()), literal_column("'[]'::json"))).scalar_subquery(),
+            select(func.coalesce(func.json_agg(facets.table_valued()), literal_column("'[]'::json"))).scalar_subquery(),
+        )
+    )
+    hit_rows, facet_rows = result.one()
+
+    # GROUPING() marca con un bit a 1 cada columna agregada: la faceta de la
+    # fila es la única columna con su bit a 0 (todas a 1 = total).
+    all_bits = (1 << len(SEARCH_FACETS)) - 1
+    counts = []
+    for row in facet_rows:
+        if row["grouping"] == all_bits:
+            counts.append((None, None, row["count"]))
+            continue
+        for position, name in enumerate(SEARCH_FACETS):
+            if not row["grouping"] & (1 << (len(SEARCH_FACETS) - 1 - position)):
+                counts.append((name, row[name], row["count"]))
+    return hit_rows, counts
+
+
+async def get_batch_payloads(db: AsyncSession, batch_id: str, status: Optional[List[str]] = None) -> List[dict]:
+    """Payloads de los ítems de un lote en una sola consulta, en orden de creación."""
+    Item = db_models.ItemModel
+    result = await db.execute(
+        select(Item.payload)
+        .where(Item.payload.isnot(None), *item_filter_clauses(batch_id=batch_id, status=status))
+        .order_by(Item.created_at, Item.id)
+    )
+    return list(result.scalars())
+
+
+async def stream_items_for_export(db: AsyncSession, clauses: list, chunk_rows: int):
+    """
+    Filas (id, batch_id, status, tenant_id, created_at, payload) de los ítems
+    que cumplen `clauses`, leídas con un cursor de servidor por trozos de
+    `chunk_rows`: la memoria no depende del número de filas.
+    """
+    Item = db_models.ItemModel
+    stmt = (
+        select(Item.id, Item.batch_id, Item.status, Item.tenant_id, Item.created_at, Item.payload)
+        .where(Item.payload.isnot(None), *clauses)
+        .order_by(Item.created_at, Item.id)
+        .execution_options(yield_per=chunk_rows)
+    )
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_item_payloads(db: AsyncSession, item_ids: List[uuid.UUID]) -> List[tuple]:
+    """(id, temp_id, status, payload) de los ítems indicados."""
+    Item = db_models.ItemModel
+    result = await db.execute(
+        select(Item.id, Item.temp_id, Item.status, Item.payload).where(Item.id.in_(item_ids))
+    )
+    return list(result)
+
+
+async def get_batch_budget(db: AsyncSession, batch_id: str) -> Optional[db_models.BatchBudgetModel]:
+    return await db.get(db_models.BatchBudgetModel, batch_id)
+
+
+async def get_batch_budget_limits(db: AsyncSession, batch_ids: List[str]) -> dict:
+    """Límites registrados por lote: batch_id -> (max_tokens, max_cost_usd)."""
+    Budget = db_models.BatchBudgetModel
+    result = await db.execute(
+        select(Budget.batch_id, Budget.max_tokens, Budget.max_cost_usd).where(Budget.batch_id.in_(batch_ids))
+    )
+    return {batch_id: (max_tokens, max_cost_usd) for batch_id, max_tokens, max_cost_usd in result}
+
+
+async def record_batch_spend(db: AsyncSession, spend: dict, completed: bool = False):
+    """Registra el gasto acumulado de cada lote (ver crud.record_batch_spend)."""
+    rows = [
+        {"b_batch_id": batch_id, "b_tokens": tokens, "b_cost": cost}
+        for batch_id, (tokens, cost) in spend.items()
+    ]
+    if not rows:
+        return
+    budgets_table = db_models.BatchBudgetModel.__table__
+    values = {"tokens_used": bindparam("b_tokens"), "cost_usd": bindparam("b_cost")}
+    if completed:
+        values["completed_at"] = func.now()
+    await db.execute(
+        update(budgets_table).where(budgets_table.c.batch_id == bindparam("b_batch_id")).values(**values),
+        rows,
+    )
+    await db.commit()
+
+
+async def sync_item_statuses(db: AsyncSession, items: List[pydantic_models.Item]):
+    """Actualiza el estado de los ítems registrados que no llegaron a persistirse (ver crud.sync_item_statuses)."""
+    rows = [
+        {"b_id": item.item_id, "b_status": item.status.value}
+        for item in items
+        if item.item_id is not None
+    ]
+    if not rows:
+        return
+    items_table = db_models.ItemModel.__table__
+    await db.execute(
+        update(items_table).where(items_table.c.id == bindparam("b_id")).values(status=bindparam("b_status")),
+        rows,
+    )
+    await db.commit()
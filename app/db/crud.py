@@ -2,88 +2,169 @@
 
 import logging
 import uuid
-from typing import List, Optional
+from datetime import timedelta
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, case, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from . import models as db_models
+from app.core import json_patch
+from app.core.config import settings
 from app.schemas import models as pydantic_models
 
 logger = logging.getLogger(__name__)
 
-def save_items(db: Session, items: List[pydantic_models.Item]) -> List[db_models.ItemModel]:
+def item_column_values(item_pydantic: pydantic_models.Item) -> dict:
     """
-    Guarda o actualiza una lista de ítems en la base de datos de forma transaccional.
-    Para los campos JSONB, espera objetos Python (dicts/lists), no strings JSON.
+    Valores de las columnas de `items` para un ítem del pipeline (sin `id`).
+    Para los campos JSONB se devuelven objetos Python (dicts/lists), no strings JSON.
     """
-    db_items_to_return = []
-
-    for item_pydantic in items:
-        item_id_uuid: Optional[uuid.UUID] = item_pydantic.item_id
-        temp_id_uuid: uuid.UUID = item_pydantic.temp_id
-
-        # --- PREPARACIÓN DE DATOS PARA JSONB ---
-        # Se convierten los modelos Pydantic a diccionarios/listas de Python.
-        # NO se usa json.dumps(). SQLAlchemy se encargará de la serialización.
-        findings_data = [f.model_dump(mode="json") for f in item_pydantic.findings] if item_pydantic.findings else []
-        audits_data = [a.model_dump(mode="json") for a in item_pydantic.audits] if item_pydantic.audits else []
-        change_log_data = [cl.model_dump(mode="json") for cl in item_pydantic.change_log] if item_pydantic.change_log else []
-        generation_params_data = item_pydantic.generation_params if item_pydantic.generation_params is not None else {}
-        payload_data = item_pydantic.payload.model_dump(mode="json") if item_pydantic.payload else None
-        final_evaluation_data = (
-            item_pydantic.payload.final_evaluation.model_dump(mode="json")
-            if item_pydantic.payload and item_pydantic.payload.final_evaluation
+    payload = item_pydantic.payload
+    return {
+        "temp_id": item_pydantic.temp_id,
+        "batch_id": item_pydantic.batch_id,
+        "status": item_pydantic.status.value,  # Usar .value para el enum
+        "token_usage": item_pydantic.token_usage,
+        "cost_usd": item_pydantic.cost_usd,
+        # El historial va a `item_events` (ver item_event_rows), no al payload.
+        "payload": payload.model_dump(mode="json", exclude={"revision_log"}) if payload else None,
+        "final_evaluation": (
+            payload.final_evaluation.model_dump(mode="json")
+            if payload and payload.final_evaluation
             else None
+        ),
+        "generation_params": item_pydantic.generation_params if item_pydantic.generation_params is not None else {},
+        "tenant_id": item_pydantic.tenant_id,
+    }
+
+
+def build_item_upserts(items: List[pydantic_models.Item]) -> List[Tuple[Any, List[dict]]]:
+    """
+    Sentencias `INSERT ... ON CONFLICT (id) DO UPDATE ... RETURNING id, temp_id`
+    para guardar `items`, con sus filas de parámetros. Los ítems con `item_id`
+    se actualizan (o insertan con ese ID) y los nuevos reciben el ID que genera
+    la DB; cada grupo se envía como un único executemany, que SQLAlchemy
+    agrupa en INSERTs multi-fila ("insertmanyvalues").
+    """
+    existing_rows = [{"id": item.item_id, **item_column_values(item)} for item in items if item.item_id]
+    new_rows = [item_column_values(item) for item in items if not item.item_id]
+
+    items_table = db_models.ItemModel.__table__
+    upserts = []
+    for rows in (existing_rows, new_rows):
+        if not rows:
+            continue
+        stmt = pg_insert(items_table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[items_table.c.id],
+            set_={column: stmt.excluded[column] for column in rows[0] if column != "id"},
+        ).returning(items_table.c.id, items_table.c.temp_id)
+        upserts.append((stmt, rows))
+    return upserts
+
+
+def assign_item_ids(items: List[pydantic_models.Item], returned_rows) -> List[uuid.UUID]:
+    """Copia a cada ítem el ID definitivo devuelto por RETURNING (emparejado por temp_id)."""
+    ids_by_temp_id = {temp_id: item_id for item_id, temp_id in returned_rows}
+    for item in items:
+        item.item_id = ids_by_temp_id.get(item.temp_id, item.item_id)
+    return [item.item_id for item in items]
+
+
+def item_event_rows(items: List[pydantic_models.Item]) -> List[dict]:
+    """
+    Filas de `item_events` con la auditoría, los hallazgos y las correcciones
+    de los ítems (ya con `item_id`). Cada fila se identifica por el `entry_id`
+    de su entrada; `seq` es solo su posición en la lista del ítem.
+    """
+    rows = []
+    for item in items:
+        base = {"item_id": item.item_id, "batch_id": item.batch_id}
+        for seq, entry in enumerate(item.audits):
+            rows.append({
+                **base, "kind": "revision", "entry_id": entry.entry_id, "seq": seq, "stage_name": entry.stage_name,
+                "status": entry.status.value, "code": None, "duration_ms": entry.duration_ms,
+                "tokens_used": entry.tokens_used, "occurred_at": entry.timestamp,
+                "data": entry.model_dump(mode="json"),
+            })
+        for kind, entries in (("finding", item.findings), ("correction", item.change_log)):
+            for seq, entry in enumerate(entries):
+                rows.append({
+                    **base, "kind": kind, "entry_id": entry.entry_id, "seq": seq, "stage_name": None, "status": None,
+                    "code": entry.codigo_error, "duration_ms": None, "tokens_used": None, "occurred_at": None,
+                    "data": entry.model_dump(mode="json"),
+                })
+    return rows
+
+
+def build_item_events_insert():
+    """
+    `INSERT ... ON CONFLICT DO NOTHING` de `item_events`: las entradas ya
+    guardadas (mismo ítem y `entry_id`) se omiten, así que volver a guardar un
+    ítem solo añade su historial nuevo, aunque sus listas se hayan recortado.
+    """
+    return pg_insert(db_models.ItemEventModel.__table__).on_conflict_do_nothing(
+        index_elements=["item_id", "entry_id"]
+    )
+
+
+def item_revision_rows(items: List[pydantic_models.Item], snapshot_interval: int) -> List[dict]:
+    """
+    Filas de `item_revisions` con el historial del payload de los ítems (ya con
+    `item_id`). La revisión 0 y cada `snapshot_interval` revisiones llevan el
+    payload completo, reconstruido deshaciendo los parches desde el actual.
+    """
+    rows = []
+    for item in items:
+        if not item.payload_revisions or not item.item_id or item.payload is None:
+            continue
+        snapshots = json_patch.rewind(
+            item.payload.model_dump(mode="json", exclude={"revision_log"}),
+            [(rev.revision, rev.patch) for rev in item.payload_revisions],
+            [rev.revision for rev in item.payload_revisions if rev.revision % max(snapshot_interval, 1) == 0],
         )
+        for rev in item.payload_revisions:
+            rows.append({
+                "item_id": item.item_id,
+                "revision": rev.revision,
+                "stage_name": rev.stage_name,
+                "patch": rev.patch,
+                "snapshot": snapshots.get(rev.revision),
+                "occurred_at": rev.timestamp,
+            })
+    return rows
 
-        # Lógica de "Upsert": buscar para actualizar, o crear si no existe.
-        db_item = db.query(db_models.ItemModel).filter_by(id=item_id_uuid).first() if item_id_uuid else None
-
-        if db_item:
-            # --- ACTUALIZAR ÍTEM EXISTENTE ---
-            logger.debug(f"Updating existing item with ID: {item_id_uuid}")
-            db_item.temp_id = temp_id_uuid
-            db_item.batch_id = item_pydantic.batch_id
-            db_item.status = item_pydantic.status.value # Usar .value para el enum
-            db_item.token_usage = item_pydantic.token_usage
-            db_item.payload = payload_data
-            db_item.final_evaluation = final_evaluation_data
-            db_item.findings = findings_data
-            db_item.audits = audits_data
-            db_item.change_log = change_log_data
-            db_item.generation_params = generation_params_data
-        else:
-            # --- CREAR NUEVO ÍTEM ---
-            logger.debug(f"Creating new item (temp_id: {temp_id_uuid})")
-            db_item = db_models.ItemModel(
-                # El 'id' será generado por la DB
-                temp_id=temp_id_uuid,
-                batch_id=item_pydantic.batch_id,
-                status=item_pydantic.status.value, # Usar .value para el enum
-                token_usage=item_pydantic.token_usage,
-                payload=payload_data,
-                final_evaluation=final_evaluation_data,
-                findings=findings_data,
-                audits=audits_data,
-                change_log=change_log_data,
-                generation_params=generation_params_data,
-            )
-            db.add(db_item)
-
-        db_items_to_return.append(db_item)
 
-    try:
-        # Se realiza el commit para toda la lista de ítems en una sola transacción.
-        db.commit()
-        logger.info(f"Successfully saved or updated {len(db_items_to_return)} items in the database.")
+def build_item_revisions_insert():
+    """`INSERT ... ON CONFLICT DO NOTHING` de `item_revisions`: solo se añaden las revisiones nuevas."""
+    return pg_insert(db_models.ItemRevisionModel.__table__).on_conflict_do_nothing(
+        index_elements=["item_id", "revision"]
+    )
 
-        # Después del commit, los nuevos ítems tendrán su ID asignado por la DB.
-        # Se refrescan los objetos para obtener esos nuevos valores.
-        for i, db_item in enumerate(db_items_to_return):
-            db.refresh(db_item)
-            # Se actualiza el objeto Pydantic original con el ID definitivo.
-            items[i].item_id = db_item.id
 
-        return db_items_to_return
+def save_items(db: Session, items: List[pydantic_models.Item]) -> List[uuid.UUID]:
+    """
+    Guarda o actualiza una lista de ítems en la base de datos de forma transaccional,
+    con un upsert por conjuntos en lugar de un SELECT y un refresh por ítem, y
+    añade su historial nuevo a `item_events` y sus revisiones nuevas a `item_revisions`.
+    Para los campos JSONB, espera objetos Python (dicts/lists), no strings JSON.
+    Devuelve los IDs definitivos, que también se asignan a cada `item.item_id`.
+    """
+    try:
+        returned_rows = []
+        for stmt, rows in build_item_upserts(items):
+            returned_rows.extend(db.execute(stmt, rows).all())
+        item_ids = assign_item_ids(items, returned_rows)
+        event_rows = item_event_rows(items)
+        if event_rows:
+            db.execute(build_item_events_insert(), event_rows)
+        revision_rows = item_revision_rows(items, settings.payload_snapshot_interval)
+        if revision_rows:
+            db.execute(build_item_revisions_insert(), revision_rows)
+        db.commit()
+        logger.info(f"Successfully saved or updated {len(items)} items in the database.")
+        return item_ids
 
     except Exception as e:
         logger.error(f"Failed to save items to the database. Rolling back transaction. Error: {e}", exc_info=True)
@@ -109,3 +190,615 @@ def get_items_by_batch_id(db: Session, batch_id: str) -> List[db_models.ItemMode
     """Obtiene todos los ítems asociados con un batch_id específico."""
     logger.debug(f"Querying for items with batch_id: {batch_id}")
     return db.query(db_models.ItemModel).filter(db_models.ItemModel.batch_id == batch_id).all()
+
+
+# ---------------------------------------------------------------------------
+# Cola durable de trabajos del pipeline
+# ---------------------------------------------------------------------------
+
+def enqueue_pipeline_job(
+    db: Session,
+    items: List[pydantic_models.Item],
+    stage_index: Optional[int] = None,
+    stage_name: Optional[str] = None,
+) -> db_models.PipelineJobModel:
+    """
+    Registra los ítems inicializados (estado 'pending') y encola el trabajo
+    que los procesará, todo en una sola transacción. En el modo distribuido
+    el trabajo se encola en la cola de la primera etapa.
+    """
+    try:
+        for item in items:
+            if item.item_id is None:
+                item.item_id = uuid.uuid4()
+            db.add(db_models.ItemModel(
+                id=item.item_id,
+                temp_id=item.temp_id,
+                batch_id=item.batch_id,
+                status=item.status.value,
+                payload=None,
+                generation_params=item.generation_params or {},
+                tenant_id=item.tenant_id,
+            ))
+
+        job = db_models.PipelineJobModel(
+            batch_id=items[0].batch_id,
+            status="queued",
+            items=[item.model_dump(mode="json") for item in items],
+            stage_index=stage_index,
+            stage_name=stage_name,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        logger.info(f"Enqueued pipeline job {job.id} for batch {job.batch_id} with {len(items)} items.")
+        return job
+    except Exception as e:
+        logger.error(f"Failed to enqueue pipeline job. Rolling back transaction. Error: {e}", exc_info=True)
+        db.rollback()
+        raise
+
+
+def claim_pipeline_job(
+    db: Session,
+    worker_id: str,
+    lease_seconds: int,
+    stage_names: Optional[List[str]] = None,
+) -> Optional[db_models.PipelineJobModel]:
+    """
+    Reclama el trabajo más antiguo disponible (en cola, o en ejecución con el
+    lease vencido) usando FOR UPDATE SKIP LOCKED para no competir con otros workers.
+    Si se indican `stage_names`, solo se reclaman trabajos de esas etapas.
+    """
+    Job = db_models.PipelineJobModel
+    query = db.query(Job).filter(
+        or_(
+            Job.status == "queued",
+            and_(Job.status == "cancelling", Job.lease_owner.is_(None)),
+            and_(Job.status.in_(["running", "cancelling"]), Job.lease_expires_at < func.now()),
+        )
+    )
+    if stage_names is not None:
+        query = query.filter(Job.stage_name.in_(stage_names))
+    job = (
+        query
+        .order_by(Job.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.commit()
+        return None
+
+    job.status = "cancelling" if job.status == "cancelling" else "running"
+    job.lease_owner = worker_id
+    job.attempts = (job.attempts or 0) + 1
+    job.heartbeat_at = func.now()
+    job.lease_expires_at = func.now() + timedelta(seconds=lease_seconds)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def renew_job_lease(db: Session, job_id: uuid.UUID, worker_id: str, lease_seconds: int) -> Optional[str]:
+    """
+    Extiende el lease de un trabajo propio (heartbeat) y devuelve su estado,
+    o None si el worker ya no es su dueño.
+    """
+    Job = db_models.PipelineJobModel
+    updated = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.lease_owner == worker_id)
+        .update(
+            {"heartbeat_at": func.now(), "lease_expires_at": func.now() + timedelta(seconds=lease_seconds)},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    if not updated:
+        return None
+    return db.query(Job.status).filter(Job.id == job_id).scalar()
+
+
+def finish_pipeline_job(
+    db: Session,
+    job_id: uuid.UUID,
+    worker_id: str,
+    status: str,
+    error: Optional[str] = None,
+) -> int:
+    """
+    Marca un trabajo propio como terminado ('done', 'failed', 'cancelled') o
+    lo devuelve a la cola ('queued'). Devuelve el número de filas
+    actualizadas: 0 si el lease ya pasó a otro worker, cuyo trabajo no se toca.
+    """
+    Job = db_models.PipelineJobModel
+    updated = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.lease_owner == worker_id)
+        .update(
+            {"status": status, "error": error, "lease_owner": None, "lease_expires_at": None},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated
+
+
+def advance_pipeline_job(
+    db: Session,
+    job_id: uuid.UUID,
+    worker_id: str,
+    items: List[pydantic_models.Item],
+    next_stage_index: int,
+    next_stage_name: str,
+    context: dict,
+) -> Optional[db_models.PipelineJobModel]:
+    """
+    Modo distribuido: cierra el trabajo de la etapa actual y encola el de la
+    siguiente etapa en la misma transacción, actualizando el estado de los ítems.
+    Devuelve None, sin cambiar nada, si el lease ya pasó a otro worker: su
+    nuevo dueño es quien encola la siguiente etapa.
+    """
+    Job = db_models.PipelineJobModel
+    current = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.lease_owner == worker_id)
+        .with_for_update()
+        .populate_existing()
+        .one_or_none()
+    )
+    if current is None:
+        db.rollback()
+        return None
+    # Una cancelación solicitada durante la etapa (o heredada) pasa a la siguiente.
+    cancelling = current.status == "cancelling" or bool(context.get("cancel_reason"))
+    current.status = "done"
+    current.lease_owner = None
+    current.lease_expires_at = None
+
+    next_job = db_models.PipelineJobModel(
+        batch_id=current.batch_id,
+        status="cancelling" if cancelling else "queued",
+        items=[item.model_dump(mode="json") for item in items],
+        stage_index=next_stage_index,
+        stage_name=next_stage_name,
+        context=context,
+    )
+    db.add(next_job)
+    sync_item_statuses(db, items, commit=False)
+    db.commit()
+    return next_job
+
+
+def get_queue_depths(db: Session) -> List[dict]:
+    """
+    Profundidad de cada cola (por etapa; 'pipeline' para los trabajos del modo
+    'queue'): trabajos en cola, en ejecución y antigüedad del más antiguo.
+    """
+    Job = db_models.PipelineJobModel
+    queue = func.coalesce(Job.stage_name, "pipeline")
+    waiting = or_(Job.status == "queued", and_(Job.status == "cancelling", Job.lease_owner.is_(None)))
+    rows = (
+        db.query(
+            queue.label("queue"),
+            func.count().filter(waiting).label("queued"),
+            func.count().filter(Job.lease_owner.isnot(None)).label("running"),
+            func.extract("epoch", func.now() - func.min(Job.created_at).filter(waiting)).label("oldest"),
+        )
+        .filter(Job.status.in_(["queued", "running", "cancelling"]))
+        .group_by(queue)
+        .all()
+    )
+    return [
+        {
+            "queue": row.queue,
+            "queued": row.queued,
+            "running": row.running,
+            "oldest_queued_seconds": float(row.oldest) if row.oldest is not None else None,
+        }
+        for row in rows
+    ]
+
+
+def request_job_cancellation(db: Session, batch_id: str) -> bool:
+    """
+    Solicita la cancelación de los trabajos de un lote. Los que siguen en cola
+    se cancelan directamente; los que están en ejecución pasan a 'cancelling'
+    y su worker los detiene en el siguiente heartbeat. En el modo distribuido
+    un trabajo de etapa en cola pasa a 'cancelling' para que un worker
+    registre el estado final de sus ítems.
+    """
+    Job = db_models.PipelineJobModel
+    stage_jobs = (
+        db.query(Job)
+        .filter(Job.batch_id == batch_id, Job.status == "queued", Job.stage_name.isnot(None))
+        .update({"status": "cancelling"}, synchronize_session=False)
+    )
+    queued = (
+        db.query(Job)
+        .filter(Job.batch_id == batch_id, Job.status == "queued")
+        .update({"status": "cancelled"}, synchronize_session=False)
+    )
+    if queued:
+        db.query(db_models.ItemModel).filter(
+            db_models.ItemModel.batch_id == batch_id,
+            db_models.ItemModel.status == "pending",
+        ).update({"status": "skipped"}, synchronize_session=False)
+    running = (
+        db.query(Job)
+        .filter(Job.batch_id == batch_id, Job.status == "running")
+        .update({"status": "cancelling"}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(stage_jobs or queued or running)
+
+
+def sync_item_statuses(db: Session, items: List[pydantic_models.Item], commit: bool = True):
+    """
+    Actualiza el estado de las filas de ítems ya registradas que no llegaron a
+    persistirse (p. ej. FATAL antes de 'persist'), para que el lote pueda completarse.
+    """
+    rows = [
+        {"b_id": item.item_id, "b_status": item.status.value}
+        for item in items
+        if item.item_id is not None
+    ]
+    if not rows:
+        return
+    items_table = db_models.ItemModel.__table__
+    db.execute(
+        update(items_table)
+        .where(items_table.c.id == bindparam("b_id"))
+        .values(status=bindparam("b_status")),
+        rows,
+    )
+    if commit:
+        db.commit()
+
+
+def batch_has_pending_jobs(db: Session, batch_id: str) -> bool:
+    """True si el lote tiene trabajos en cola o en ejecución."""
+    Job = db_models.PipelineJobModel
+    return db.query(
+        db.query(Job)
+        .filter(Job.batch_id == batch_id, Job.status.in_(["queued", "running", "cancelling"]))
+        .exists()
+    ).scalar()
+
+
+# ---------------------------------------------------------------------------
+# Agrupación de solicitudes de generación idénticas
+# ---------------------------------------------------------------------------
+
+def get_generation_request(db: Session, request_key: str) -> Optional[db_models.GenerationRequestModel]:
+    return db.get(db_models.GenerationRequestModel, request_key)
+
+
+def claim_generation_request(
+    db: Session,
+    request_key: str,
+    params_hash: str,
+    batch_id: str,
+    num_items: int,
+    expire_seconds: int,
+) -> db_models.GenerationRequestModel:
+    """
+    Registra la solicitud con su lote de forma atómica (INSERT ... ON CONFLICT).
+    Una entrada existente solo se reemplaza si tiene más de `expire_seconds`;
+    si otra solicitud idéntica se adelantó, se devuelve la suya y el llamador
+    la reconoce porque su batch_id es distinto.
+    """
+    Request = db_models.GenerationRequestModel
+    stmt = pg_insert(Request).values(
+        request_key=request_key,
+        params_hash=params_hash,
+        batch_id=batch_id,
+        num_items=num_items,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Request.request_key],
+        set_={
+            "params_hash": stmt.excluded.params_hash,
+            "batch_id": stmt.excluded.batch_id,
+            "num_items": stmt.excluded.num_items,
+            "created_at": func.now(),
+        },
+        where=Request.created_at < func.now() - timedelta(seconds=expire_seconds),
+    )
+    db.execute(stmt)
+    db.commit()
+    return (
+        db.query(Request)
+        .filter(Request.request_key == request_key)
+        .populate_existing()
+        .one()
+    )
+
+
+def release_generation_request(db: Session, request_key: str, batch_id: str):
+    """Elimina el registro de una solicitud cuyo lote no llegó a iniciarse."""
+    Request = db_models.GenerationRequestModel
+    db.query(Request).filter(
+        Request.request_key == request_key, Request.batch_id == batch_id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+# ---------------------------------------------------------------------------
+# Inventario de ítems pregenerados
+# ---------------------------------------------------------------------------
+
+# Estados con los que un ítem del inventario puede entregarse.
+INVENTORY_STOCK_STATUSES = ("persistence_success", "evaluation_complete")
+
+
+def record_inventory_demand(db: Session, combo_key: str, combo: dict, generation_params: dict):
+    """Cuenta una solicitud de la combinación y guarda sus parámetros como plantilla."""
+    Demand = db_models.InventoryDemandModel
+    stmt = pg_insert(Demand).values(
+        combo_key=combo_key,
+        combo=combo,
+        generation_params=generation_params,
+        request_count=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Demand.combo_key],
+        set_={
+            "generation_params": stmt.excluded.generation_params,
+            "request_count": Demand.request_count + 1,
+            "last_requested_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def get_inventory_shortfalls(
+    db: Session, min_requests: int, window_days: int, target_stock: int, cooldown_seconds: float
+) -> List[Tuple[db_models.InventoryDemandModel, int]]:
+    """
+    Combinaciones populares (al menos `min_requests` solicitudes, la última
+    dentro de `window_days`) cuya reserva está por debajo de `target_stock`.
+    La reserva cuenta los ítems aún no entregados y los que siguen en
+    generación. Se omiten las combinaciones con un lote de inventario más
+    reciente que `cooldown_seconds`, para no insistir si sus lotes fallan.
+    Devuelve (demanda, reserva actual), las más solicitadas primero.
+    """
+    Demand = db_models.InventoryDemandModel
+    Batch = db_models.InventoryBatchModel
+    Delivery = db_models.InventoryDeliveryModel
+    Item = db_models.ItemModel
+    stock = (
+        db.query(func.count(Item.id))
+        .join(Batch, Batch.batch_id == Item.batch_id)
+        .filter(
+            Batch.combo_key == Demand.combo_key,
+            or_(
+                and_(
+                    Item.status.in_(INVENTORY_STOCK_STATUSES),
+                    ~exists().where(Delivery.source_item_id == Item.id),
+                ),
+                Item.status == "pending",
+            ),
+        )
+        .correlate(Demand)
+        .scalar_subquery()
+    )
+    rows = (
+        db.query(Demand, stock)
+        .filter(
+            Demand.request_count >= min_requests,
+            Demand.last_requested_at >= func.now() - timedelta(days=window_days),
+            stock < target_stock,
+            ~exists().where(
+                Batch.combo_key == Demand.combo_key,
+                Batch.created_at > func.now() - timedelta(seconds=cooldown_seconds),
+            ),
+        )
+        .order_by(Demand.request_count.desc())
+        .all()
+    )
+    return [(demand, current_stock) for demand, current_stock in rows]
+
+
+def register_inventory_batch(db: Session, batch_id: str, combo_key: str):
+    db.add(db_models.InventoryBatchModel(batch_id=batch_id, combo_key=combo_key))
+    db.commit()
+
+
+def serve_inventory_items(
+    db: Session, combo_key: str, items: List[pydantic_models.Item], tenant_id: str
+) -> bool:
+    """
+    Rellena los ítems inicializados de una solicitud con copias de ítems de la
+    reserva de su combinación que el cliente no haya recibido antes (primero
+    los menos entregados). Todo o nada: si no hay suficientes, no se entrega
+    ninguno y devuelve False. La restricción única de las entregas evita que
+    dos solicitudes simultáneas del mismo cliente reciban el mismo ítem.
+    """
+    Batch = db_models.InventoryBatchModel
+    Delivery = db_models.InventoryDeliveryModel
+    Item = db_models.ItemModel
+
+    deliveries = (
+        db.query(Delivery.source_item_id, func.count(Delivery.id).label("n"))
+        .group_by(Delivery.source_item_id)
+        .subquery()
+    )
+    delivered_to_tenant = db.query(Delivery.source_item_id).filter(Delivery.tenant_id == tenant_id)
+    sources = (
+        db.query(Item)
+        .join(Batch, Batch.batch_id == Item.batch_id)
+        .outerjoin(deliveries, deliveries.c.source_item_id == Item.id)
+        .filter(
+            Batch.combo_key == combo_key,
+            Item.status.in_(INVENTORY_STOCK_STATUSES),
+            Item.payload.isnot(None),
+            Item.id.notin_(delivered_to_tenant),
+        )
+        .order_by(func.coalesce(deliveries.c.n, 0), Item.created_at)
+        .limit(len(items))
+        .all()
+    )
+    if len(sources) < len(items):
+        db.rollback()
+        return False
+
+    try:
+        copies = []
+        for source, item in zip(sources, items):
+            copy_id = uuid.uuid4()
+            inserted = db.execute(
+                pg_insert(Delivery)
+                .values(source_item_id=source.id, tenant_id=tenant_id, item_id=copy_id, batch_id=item.batch_id)
+                .on_conflict_do_nothing(constraint="uq_inventory_deliveries_item_tenant")
+                .returning(Delivery.id)
+            ).first()
+            if inserted is None:
+                db.rollback()
+                return False
+            copies.append(db_models.ItemModel(
+                id=copy_id,
+                temp_id=item.temp_id,
+                batch_id=item.batch_id,
+                status=pydantic_models.ItemStatus.PERSISTENCE_SUCCESS.value,
+                payload={**source.payload, "item_id": str(copy_id)},
+                prompt_v=source.prompt_v,
+                token_usage=0,
+                cost_usd=0.0,
+                final_evaluation=source.final_evaluation,
+                generation_params=item.generation_params or {},
+                tenant_id=tenant_id,
+            ))
+        db.add_all(copies)
+        db.flush()
+        # Cada copia hereda el historial y las revisiones de su ítem de origen.
+        Event = db_models.ItemEventModel
+        history_columns = ["kind", "entry_id", "seq", "stage_name", "status", "code", "duration_ms", "tokens_used", "occurred_at", "data"]
+        db.execute(
+            pg_insert(Event.__table__).from_select(
+                ["item_id", "batch_id", *history_columns],
+                select(
+                    bindparam("b_copy_id", type_=Event.item_id.type), bindparam("b_batch_id", type_=Event.batch_id.type),
+                    *[Event.__table__.c[column] for column in history_columns],
+                ).where(Event.item_id == bindparam("b_source_id")).order_by(Event.id),
+            ),
+            [
+                {"b_copy_id": copy.id, "b_batch_id": copy.batch_id, "b_source_id": source.id}
+                for source, copy in zip(sources, copies)
+            ],
+        )
+        Revision = db_models.ItemRevisionModel
+        revision_columns = ["revision", "stage_name", "patch", "snapshot", "occurred_at"]
+        db.execute(
+            pg_insert(Revision.__table__).from_select(
+                ["item_id", *revision_columns],
+                select(
+                    bindparam("b_copy_id", type_=Revision.item_id.type),
+                    *[Revision.__table__.c[column] for column in revision_columns],
+                ).where(Revision.item_id == bindparam("b_source_id")),
+            ),
+            [{"b_copy_id": copy.id, "b_source_id": source.id} for source, copy in zip(sources, copies)],
+        )
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to serve items from inventory. Rolling back transaction. Error: {e}", exc_info=True)
+        db.rollback()
+        raise
+
+    for item, copy in zip(items, copies):
+        item.item_id = copy.id
+        item.status = pydantic_models.ItemStatus.PERSISTENCE_SUCCESS
+    logger.info(f"Served {len(items)} items from inventory ({combo_key}) to tenant {tenant_id}.")
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Control de admisión
+# ---------------------------------------------------------------------------
+
+def get_pending_item_counts(db: Session) -> dict:
+    """Ítems registrados y aún pendientes de procesar, por cliente (None = sin X-Tenant-ID)."""
+    Item = db_models.ItemModel
+    rows = (
+        db.query(Item.tenant_id, func.count(Item.id))
+        .filter(Item.status == "pending")
+        .group_by(Item.tenant_id)
+        .all()
+    )
+    return {tenant_id: count for tenant_id, count in rows}
+
+
+def count_recently_completed_items(db: Session, window_seconds: int) -> int:
+    """
+    Ítems que terminaron el pipeline en los últimos `window_seconds`, para
+    medir el throughput reciente. No cuenta las copias servidas desde el inventario.
+    """
+    Item = db_models.ItemModel
+    Delivery = db_models.InventoryDeliveryModel
+    return (
+        db.query(func.count(Item.id))
+        .filter(
+            Item.status != "pending",
+            Item.updated_at >= func.now() - timedelta(seconds=window_seconds),
+            ~exists().where(Delivery.item_id == Item.id),
+        )
+        .scalar()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Presupuesto de tokens y coste
+# ---------------------------------------------------------------------------
+
+# Un lote sin terminar deja de reservar su máximo pasado este tiempo (p. ej. si
+# su proceso murió sin registrar el gasto final).
+BUDGET_RESERVATION_HOURS = 24
+
+
+def create_batch_budget(
+    db: Session,
+    batch_id: str,
+    tenant_id: Optional[str],
+    max_tokens: Optional[int],
+    max_cost_usd: Optional[float],
+):
+    db.execute(
+        pg_insert(db_models.BatchBudgetModel)
+        .values(batch_id=batch_id, tenant_id=tenant_id, max_tokens=max_tokens, max_cost_usd=max_cost_usd)
+        .on_conflict_do_nothing(index_elements=["batch_id"])
+    )
+    db.commit()
+
+
+def delete_batch_budget(db: Session, batch_id: str):
+    db.query(db_models.BatchBudgetModel).filter(db_models.BatchBudgetModel.batch_id == batch_id).delete()
+    db.commit()
+
+
+def get_tenant_month_spend(db: Session, tenant_id: str, since) -> Tuple[int, float]:
+    """
+    Tokens y coste del cliente desde `since`. Los lotes en curso cuentan por
+    su máximo, para que varios lotes simultáneos no superen juntos el límite.
+    """
+    Budget = db_models.BatchBudgetModel
+    reserving = and_(
+        Budget.completed_at.is_(None),
+        Budget.created_at >= func.now() - timedelta(hours=BUDGET_RESERVATION_HOURS),
+    )
+    tokens, cost = (
+        db.query(
+            func.coalesce(func.sum(case(
+                (reserving, func.greatest(Budget.tokens_used, func.coalesce(Budget.max_tokens, 0))),
+                else_=Budget.tokens_used,
+            )), 0),
+            func.coalesce(func.sum(case(
+                (reserving, func.greatest(Budget.cost_usd, func.coalesce(Budget.max_cost_usd, 0.0))),
+                else_=Budget.cost_usd,
+            )), 0.0),
+        )
+        .filter(Budget.tenant_id == tenant_id, Budget.created_at >= since)
+        .one()
+    )
+    return int(tokens), float(cost)
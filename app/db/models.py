@@ -1,7 +1,7 @@
 # app/db/models.py
 
-from sqlalchemy import Column, String, Integer, TIMESTAMP, text
-from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy import BigInteger, Column, Computed, ForeignKey, Index, String, Integer, Float, Text, TIMESTAMP, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID as PGUUID
 from sqlalchemy.dialects.postgresql import JSONB  # Ensure JSONB is imported
 
 from sqlalchemy.ext.declarative import declarative_base
@@ -12,6 +12,21 @@ Base = declarative_base()
 
 class ItemModel(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        # (batch_id, status): el sondeo del estado de un lote cuenta por estado sin leer las filas.
+        Index("idx_items_batch_id_status", "batch_id", "status"),
+        # Paginación por clave (created_at, id) del listado, sin filtro o con cada filtro.
+        Index("idx_items_created_at_id", "created_at", "id"),
+        Index("idx_items_status_created_at_id", "status", "created_at", "id"),
+        Index("idx_items_batch_id_created_at_id", "batch_id", "created_at", "id"),
+        Index("idx_items_col_asignatura_created_at_id", "asignatura", "created_at", "id"),
+        Index("idx_items_col_tema_created_at_id", "tema", "created_at", "id"),
+        Index("idx_items_col_nivel_cognitivo_created_at_id", "nivel_cognitivo", "created_at", "id"),
+        # Búsqueda de texto completo y facetas de GET /items/search.
+        Index("idx_items_search_vector", "search_vector", postgresql_using="gin"),
+        Index("idx_items_tipo_reactivo", "tipo_reactivo"),
+        Index("idx_items_score_total", "score_total"),
+    )
 
     id = Column(
         PGUUID(as_uuid=True),
@@ -22,19 +37,221 @@ class ItemModel(Base):
     temp_id = Column(
         PGUUID(as_uuid=True), nullable=False, server_default=text("gen_random_uuid()")
     )
-    batch_id = Column(String, nullable=False, index=True)
+    batch_id = Column(String, nullable=False)
     status = Column(String, nullable=False, default="pending")
-    payload = Column(JSONB, nullable=False)
-    findings = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
-    audits = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
-    change_log = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    # Nulo mientras el ítem está encolado y aún no se ha generado.
+    # Sin `revision_log`: el historial, los hallazgos y las correcciones del
+    # ítem están en `item_events` (ItemEventModel).
+    payload = Column(JSONB, nullable=True)
     prompt_v = Column(String, nullable=True)
     token_usage = Column(Integer, nullable=True)
+    cost_usd = Column(Float, nullable=True)
     final_evaluation = Column(JSONB, nullable=True)
     generation_params = Column(JSONB, nullable=True)
+    # Cliente (cabecera X-Tenant-ID) que solicitó el ítem; nulo en el inventario.
+    tenant_id = Column(String, nullable=True, index=True)
     created_at = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
     )
     updated_at = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
     )
+    # Columnas generadas por Postgres a partir del payload (no se escriben):
+    # el texto buscable en español, con el enunciado (A) por delante del
+    # estímulo (B) y las opciones (C), y los campos de filtro y faceta.
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'enunciado_pregunta', '')), 'A') || "
+            "setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'estimulo', '')), 'B') || "
+            "setweight(jsonb_to_tsvector('spanish', coalesce(jsonb_path_query_array(payload, '$.cuerpo_item.opciones[*].texto'), "
+            "'[]'::jsonb), '[\"string\"]'), 'C')",
+            persisted=True,
+        ),
+    )
+    asignatura = Column(Text, Computed("payload -> 'dominio' ->> 'asignatura'", persisted=True))
+    tema = Column(Text, Computed("payload -> 'dominio' ->> 'tema'", persisted=True))
+    nivel_cognitivo = Column(Text, Computed("payload ->> 'nivel_cognitivo'", persisted=True))
+    tipo_reactivo = Column(Text, Computed("payload -> 'formato' ->> 'tipo_reactivo'", persisted=True))
+    score_total = Column(Integer, Computed("(final_evaluation ->> 'score_total')::integer", persisted=True))
+
+
+class ItemEventModel(Base):
+    """
+    Historial de un ítem, solo de inserción: una fila por entrada de su
+    auditoría ('revision'), hallazgo ('finding') o corrección ('correction').
+    `seq` es la posición de la entrada en su lista del ítem; la restricción
+    única hace que volver a guardar un ítem solo inserte las entradas nuevas.
+    Las columnas de etapa, estado, código, duración y tokens permiten agregar
+    por etapa en SQL sin leer `data`, que guarda la entrada completa.
+    """
+    __tablename__ = "item_events"
+    __table_args__ = (
+        Index("uq_item_events_item_entry_id", "item_id", "entry_id", unique=True),
+        Index("idx_item_events_stage_name_status", "stage_name", "status"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    item_id = Column(PGUUID(as_uuid=True), ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
+    batch_id = Column(String, nullable=False, index=True)
+    # revision | finding | correction
+    kind = Column(String, nullable=False)
+    # Identificador estable de la entrada (clave de deduplicación al volver a guardar).
+    entry_id = Column(PGUUID(as_uuid=True), nullable=False, server_default=text("gen_random_uuid()"))
+    # Posición de la entrada en la lista del ítem al guardarla.
+    seq = Column(Integer, nullable=False)
+    stage_name = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    # codigo_error de los hallazgos y correcciones.
+    code = Column(String, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    tokens_used = Column(Integer, nullable=True)
+    # Momento de la transición (solo las entradas de auditoría lo registran).
+    occurred_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    data = Column(JSONB, nullable=False)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class ItemRevisionModel(Base):
+    """
+    Revisiones del payload de un ítem, solo de inserción: el parche JSON de
+    cada etapa que lo cambió y, en la revisión 0 y cada
+    PAYLOAD_SNAPSHOT_INTERVAL revisiones, el payload completo (`snapshot`).
+    Ver app.pipelines.payload_versions.
+    """
+    __tablename__ = "item_revisions"
+
+    item_id = Column(PGUUID(as_uuid=True), ForeignKey("items.id", ondelete="CASCADE"), primary_key=True)
+    revision = Column(Integer, primary_key=True)
+    stage_name = Column(String, nullable=True)
+    patch = Column(JSONB, nullable=False)
+    # none_as_null: sin snapshot se guarda NULL de SQL, no el JSON `null`.
+    snapshot = Column(JSONB(none_as_null=True), nullable=True)
+    occurred_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+class PipelineJobModel(Base):
+    """
+    Trabajo durable del pipeline. Los procesos `app.worker` lo reclaman con
+    SELECT ... FOR UPDATE SKIP LOCKED y mantienen un lease con heartbeats.
+    En el modo distribuido cada trabajo corresponde a una sola etapa.
+    """
+    __tablename__ = "pipeline_jobs"
+
+    id = Column(
+        PGUUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+        nullable=False,
+    )
+    batch_id = Column(String, nullable=False, index=True)
+    # queued | running | cancelling | done | failed | cancelled
+    status = Column(String, nullable=False, default="queued", index=True)
+    items = Column(JSONB, nullable=False)
+    # Modo distribuido: etapa que atiende este trabajo y estado compartido del
+    # lote entre etapas (cuotas, plazo, cancelación). Nulos en el modo 'queue'.
+    stage_index = Column(Integer, nullable=True)
+    stage_name = Column(String, nullable=True, index=True)
+    context = Column(JSONB, nullable=True)
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    heartbeat_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
+class GenerationRequestModel(Base):
+    """
+    Solicitudes de generación recientes, para agrupar las idénticas en un solo
+    lote. La clave es el hash de los parámetros normalizados ('params:...') o
+    la cabecera Idempotency-Key enviada por el cliente ('key:...').
+    """
+    __tablename__ = "generation_requests"
+
+    request_key = Column(String, primary_key=True)
+    params_hash = Column(String, nullable=False)
+    batch_id = Column(String, nullable=False, index=True)
+    num_items = Column(Integer, nullable=False)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+# --- Inventario de ítems pregenerados ---
+
+class InventoryDemandModel(Base):
+    """
+    Frecuencia de solicitudes por combinación (asignatura, tema, nivel
+    educativo, nivel cognitivo, formato). Guarda los parámetros de la última
+    solicitud para pregenerar ítems de esa combinación.
+    """
+    __tablename__ = "inventory_demand"
+
+    combo_key = Column(String, primary_key=True)
+    combo = Column(JSONB, nullable=False)
+    generation_params = Column(JSONB, nullable=False)
+    request_count = Column(Integer, nullable=False, server_default=text("0"))
+    last_requested_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class InventoryBatchModel(Base):
+    """Lotes generados para el inventario; sus ítems forman la reserva de la combinación."""
+    __tablename__ = "inventory_batches"
+
+    batch_id = Column(String, primary_key=True)
+    combo_key = Column(String, nullable=False, index=True)
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class InventoryDeliveryModel(Base):
+    """
+    Entregas de ítems del inventario. La restricción única garantiza que un
+    mismo ítem nunca se entrega dos veces al mismo cliente.
+    """
+    __tablename__ = "inventory_deliveries"
+    __table_args__ = (UniqueConstraint("source_item_id", "tenant_id", name="uq_inventory_deliveries_item_tenant"),)
+
+    id = Column(
+        PGUUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+        nullable=False,
+    )
+    source_item_id = Column(PGUUID(as_uuid=True), nullable=False, index=True)
+    tenant_id = Column(String, nullable=False)
+    item_id = Column(PGUUID(as_uuid=True), nullable=False)
+    batch_id = Column(String, nullable=False)
+    delivered_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class BatchBudgetModel(Base):
+    """
+    Presupuesto de tokens y coste de un lote y su gasto registrado. Las filas
+    sin `completed_at` reservan su máximo en el presupuesto mensual del cliente.
+    """
+    __tablename__ = "batch_budgets"
+
+    batch_id = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=True, index=True)
+    max_tokens = Column(Integer, nullable=True)
+    max_cost_usd = Column(Float, nullable=True)
+    tokens_used = Column(Integer, nullable=False, server_default=text("0"))
+    cost_usd = Column(Float, nullable=False, server_default=text("0"))
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+    completed_at = Column(TIMESTAMP(timezone=True), nullable=True)
@@ -1,21 +1,56 @@
 # app/db/session.py
 """
 Módulo de sesión de base de datos para SIGIE: crea engine y sesiones y permite iniciar la BD.
+
+Además del engine síncrono (workers, CLI, tareas en hilos) hay dos engines
+asíncronos sobre psycopg 3: uno para las peticiones de la API (`get_async_db`)
+y otro, con su propio pool, para el pipeline (`PipelineSessionLocal`). El
+pipeline abre sus sesiones cuando las necesita y nunca usa la sesión de una
+petición, que se cierra al terminar la respuesta.
 """
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import get_settings
 from app.db.models import Base
 
 settings = get_settings()
 
+DATABASE_URL = settings.database_url or settings.psql_database_url
+
 engine = create_engine(
-    settings.database_url or settings.psql_database_url,
+    DATABASE_URL,
     pool_pre_ping=True,
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_url(url: str) -> str:
+    """Usa el driver psycopg 3 (síncrono y asíncrono) aunque la URL no lo indique."""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgresql", "postgres", "postgresql+psycopg2"):
+        parsed = parsed.set(drivername="postgresql+psycopg")
+    return parsed.render_as_string(hide_password=False)
+
+
+async_engine = create_async_engine(
+    _async_url(DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+)
+pipeline_async_engine = create_async_engine(
+    _async_url(DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.db_pipeline_pool_size,
+    max_overflow=0,
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+PipelineSessionLocal = async_sessionmaker(pipeline_async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """
     Dependencia de FastAPI para obtener/terminar sesión de base de datos.
@@ -28,6 +63,17 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Dependencia de FastAPI con una AsyncSession del pool de la API."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engines():
+    await async_engine.dispose()
+    await pipeline_async_engine.dispose()
+
 def init_db():
     """
     Crea tablas en la base de datos si no existen.
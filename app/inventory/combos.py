@@ -0,0 +1,40 @@
+# app/inventory/combos.py
+
+"""
+Combinaciones de parámetros con las que se agrupa la demanda y la reserva del
+inventario: asignatura, tema, nivel educativo, nivel cognitivo y formato.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    return value
+
+
+def combo_from_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrae la combinación de una solicitud (`ItemGenerationParams` como dict).
+    Incluye el número de opciones: un ítem de 4 opciones no sirve para una
+    solicitud de 3.
+    """
+    dominio = params.get("dominio") or {}
+    audiencia = params.get("audiencia") or {}
+    formato = params.get("formato") or {}
+    return {
+        "asignatura": _normalize(dominio.get("asignatura")),
+        "tema": _normalize(dominio.get("tema")),
+        "nivel_educativo": _normalize(audiencia.get("nivel_educativo")),
+        "nivel_cognitivo": _normalize(params.get("nivel_cognitivo")),
+        "tipo_reactivo": _normalize(formato.get("tipo_reactivo")),
+        "numero_opciones": formato.get("numero_opciones"),
+    }
+
+
+def combo_key(combo: Dict[str, Any]) -> str:
+    encoded = json.dumps(combo, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
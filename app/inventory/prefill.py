@@ -0,0 +1,112 @@
+# app/inventory/prefill.py
+
+"""
+Reposición del inventario con la capacidad ociosa.
+
+Cuando no hay lotes en curso (modo 'background') o las colas de trabajos
+están vacías (modos 'queue' y 'distributed'), se genera un lote para la
+combinación popular con más demanda cuya reserva está por debajo de
+INVENTORY_TARGET_STOCK, usando los parámetros de su última solicitud y el
+pipeline normal. La API arranca este bucle si INVENTORY_ENABLED está activo.
+"""
+
+import asyncio
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.log import logger
+from app.db import crud
+from app.db.session import PipelineSessionLocal, SessionLocal
+from app.pipelines import live_status
+from app.pipelines.cancellation import active_batch_count
+from app.pipelines.runner import load_pipeline_config, run as run_pipeline_async
+from app.pipelines.utils.stage_helpers import initialize_items_for_pipeline
+from app.schemas.models import Item
+
+# Límite de `n_items` en ItemGenerationParams.
+MAX_ITEMS_PER_BATCH = 10
+
+
+def _has_idle_capacity(db: Session) -> bool:
+    if settings.pipeline_execution_mode == "background":
+        return active_batch_count() == 0
+    return all(depth["queued"] == 0 for depth in crud.get_queue_depths(db))
+
+
+def _plan_prefill_batch(db: Session) -> Optional[List[Item]]:
+    """Elige la combinación a reponer y registra su lote de inventario."""
+    if not _has_idle_capacity(db):
+        return None
+    shortfalls = crud.get_inventory_shortfalls(
+        db,
+        settings.inventory_min_requests,
+        settings.inventory_demand_window_days,
+        settings.inventory_target_stock,
+        settings.inventory_prefill_interval_seconds,
+    )
+    if not shortfalls:
+        return None
+
+    demand, stock = shortfalls[0]
+    n_items = min(settings.inventory_target_stock - stock, MAX_ITEMS_PER_BATCH)
+    items = initialize_items_for_pipeline(dict(demand.generation_params, n_items=n_items, priority="prefill"))
+    if not items:
+        return None
+    crud.register_inventory_batch(db, items[0].batch_id, demand.combo_key)
+    logger.info(
+        f"Inventory prefill: generating {n_items} items for {demand.combo} "
+        f"(stock {stock}/{settings.inventory_target_stock}, {demand.request_count} requests)."
+    )
+    return items
+
+
+async def prefill_once() -> int:
+    """Lanza como máximo un lote de reposición. Devuelve el número de ítems lanzados."""
+    db = SessionLocal()
+    try:
+        items = await asyncio.to_thread(_plan_prefill_batch, db)
+        if not items:
+            return 0
+
+        if settings.pipeline_execution_mode == "queue":
+            await asyncio.to_thread(crud.enqueue_pipeline_job, db, items)
+        elif settings.pipeline_execution_mode == "distributed":
+            config = load_pipeline_config(settings.pipeline_config_path)
+            if not config or not config.get("stages"):
+                logger.error("Inventory prefill: pipeline configuration not available.")
+                return 0
+            await asyncio.to_thread(
+                crud.enqueue_pipeline_job, db, items, 0, config["stages"][0]["name"]
+            )
+        else:
+            try:
+                await run_pipeline_async(
+                    pipeline_config_path=settings.pipeline_config_path,
+                    items_to_process=items,
+                    ctx={"async_session_factory": PipelineSessionLocal, "keep_live_status": True},
+                )
+                await asyncio.to_thread(crud.sync_item_statuses, db, items)
+            finally:
+                live_status.finish_batches({item.batch_id for item in items})
+        return len(items)
+    finally:
+        db.close()
+
+
+async def run_prefill_loop(stop: asyncio.Event):
+    logger.info("Inventory prefill loop started.")
+    while not stop.is_set():
+        try:
+            launched = await prefill_once()
+        except Exception as e:
+            logger.error(f"Inventory prefill failed: {e}", exc_info=True)
+            launched = 0
+        if launched:
+            continue
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.inventory_prefill_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Inventory prefill loop stopped.")
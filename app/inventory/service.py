@@ -0,0 +1,51 @@
+# app/inventory/service.py
+
+"""
+Inventario de ítems pregenerados para las combinaciones más solicitadas.
+
+Cada solicitud de generación suma a la demanda de su combinación
+(`inventory_demand`). Si la reserva de esa combinación tiene suficientes
+ítems que el cliente (cabecera X-Tenant-ID) no ha recibido antes, la
+solicitud se sirve al instante con copias de esos ítems, sin pasar por el
+pipeline. El bucle de `app.inventory.prefill` repone la reserva cuando hay
+capacidad ociosa.
+"""
+
+from typing import Any, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.log import logger
+from app.db import crud
+from app.inventory.combos import combo_from_params, combo_key
+from app.schemas.models import Item
+
+DEFAULT_TENANT_ID = "anonymous"
+
+
+def record_demand(db: Session, params: Dict[str, Any]):
+    """Registra la solicitud en la demanda de su combinación (si el inventario está activo)."""
+    if not settings.inventory_enabled:
+        return
+    combo = combo_from_params(params)
+    try:
+        crud.record_inventory_demand(db, combo_key(combo), combo, params)
+    except Exception as e:
+        # La demanda es solo una estadística: un fallo no debe bloquear la solicitud.
+        db.rollback()
+        logger.warning(f"No se pudo registrar la demanda del inventario: {e}")
+
+
+def serve_from_inventory(db: Session, params: Dict[str, Any], items: List[Item], tenant_id: str) -> bool:
+    """
+    Intenta servir los ítems inicializados de la solicitud desde la reserva.
+    Devuelve True si se sirvieron todos (quedan persistidos y completos).
+    """
+    if not settings.inventory_enabled:
+        return False
+    try:
+        return crud.serve_inventory_items(db, combo_key(combo_from_params(params)), items, tenant_id)
+    except Exception as e:
+        logger.warning(f"No se pudo servir la solicitud desde el inventario; se usará el pipeline: {e}")
+        return False
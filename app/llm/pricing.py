@@ -0,0 +1,46 @@
+# app/llm/pricing.py
+
+"""
+Tabla de precios de los modelos LLM (USD por millón de tokens de entrada y de
+salida), para estimar y registrar el coste de cada llamada. LLM_MODEL_PRICES
+amplía o corrige la tabla sin cambiar el código.
+"""
+
+from typing import Dict
+
+from app.core.config import settings
+
+DEFAULT_MODEL_PRICES: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+    "gemini-2.0-flash-lite": {"input": 0.075, "output": 0.30},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+}
+
+
+def get_model_prices() -> Dict[str, Dict[str, float]]:
+    return {**DEFAULT_MODEL_PRICES, **settings.llm_model_prices}
+
+
+def model_price(model: str) -> Dict[str, float]:
+    """
+    Precio del modelo. Un modelo sin precio conocido se valora como el más caro
+    de la tabla, para que el presupuesto nunca lo subestime.
+    """
+    prices = get_model_prices()
+    if model in prices:
+        return prices[model]
+    return max(prices.values(), key=lambda price: price.get("output", 0.0))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price = model_price(model)
+    return (prompt_tokens * price.get("input", 0.0) + completion_tokens * price.get("output", 0.0)) / 1_000_000
+
+
+def usage_cost(model: str, usage: Dict[str, int]) -> float:
+    """Coste de una llamada a partir del `usage` de LLMResponse."""
+    prompt_tokens = usage.get("prompt", 0) or 0
+    completion_tokens = usage.get("completion") or max((usage.get("total", 0) or 0) - prompt_tokens, 0)
+    return estimate_cost(model, prompt_tokens, completion_tokens)
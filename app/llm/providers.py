@@ -1,13 +1,17 @@
 # app/llm/providers.py
 
 from __future__ import annotations
+import asyncio
 import logging
 import json
+import time
 import uuid
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Type, Tuple
 
 from app.core.config import settings, Settings
+from app.pipelines.metrics import record_llm_call
+from .scheduler import LLMScheduler, ScheduleKey
 from .utils import make_retry
 
 # Dependencias de los proveedores de LLM
@@ -257,6 +261,42 @@ class GeminiClient(BaseLLMClient):
             tool_calls=tool_calls, success=success, error_message=error_message
         )
 
+# Planificador (por proceso y event loop) de las llamadas LLM simultáneas.
+_SCHEDULER: Optional[LLMScheduler] = None
+_SCHEDULER_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_CONCURRENCY_LIMIT_VALUE: Optional[int] = None
+# Llamadas en curso, incluidas las que esperan turno en el planificador.
+_IN_FLIGHT_CALLS = 0
+
+
+def set_concurrency_limit(limit: Optional[int]):
+    """Fija el número máximo de llamadas LLM simultáneas del proceso (None = LLM_MAX_CONCURRENCY)."""
+    global _SCHEDULER, _CONCURRENCY_LIMIT_VALUE
+    _CONCURRENCY_LIMIT_VALUE = limit or None
+    _SCHEDULER = None
+
+
+def get_concurrency_limit() -> Optional[int]:
+    return _CONCURRENCY_LIMIT_VALUE or settings.llm_max_concurrency
+
+
+def get_in_flight_llm_calls() -> int:
+    return _IN_FLIGHT_CALLS
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """Planificador del event loop actual; se recrea si cambia el loop (p. ej. con asyncio.run)."""
+    global _SCHEDULER, _SCHEDULER_LOOP
+    limit = get_concurrency_limit()
+    if not limit:
+        return None
+    loop = asyncio.get_running_loop()
+    if _SCHEDULER is None or _SCHEDULER_LOOP is not loop:
+        _SCHEDULER = LLMScheduler(limit, settings.llm_priority_weights)
+        _SCHEDULER_LOOP = loop
+    return _SCHEDULER
+
+
 async def generate_response(
     messages: List[Dict[str, Any]],
     model: Optional[str] = None,
@@ -264,8 +304,10 @@ async def generate_response(
     max_tokens: Optional[int] = None,
     provider: Optional[str] = None,
     tools: Optional[List[Dict[str, Any]]] = None,
+    schedule_key: Optional[ScheduleKey] = None,
     **kwargs: Any
 ) -> LLMResponse:
+    global _IN_FLIGHT_CALLS
     prov = provider or settings.llm_provider
     client = get_provider(prov)
 
@@ -274,7 +316,26 @@ async def generate_response(
     kwargs.pop("max_tokens", None)
     kwargs.pop("provider", None)
 
-    return await client.generate_response(
-        messages, model=model, temperature=temperature,
-        max_tokens=max_tokens, tools=tools, **kwargs
-    )
+    scheduler = get_scheduler()
+    _IN_FLIGHT_CALLS += 1
+    try:
+        if scheduler is None:
+            return await _timed_call(
+                client, messages, model=model, temperature=temperature,
+                max_tokens=max_tokens, tools=tools, **kwargs
+            )
+        async with scheduler.slot(schedule_key or ScheduleKey()):
+            return await _timed_call(
+                client, messages, model=model, temperature=temperature,
+                max_tokens=max_tokens, tools=tools, **kwargs
+            )
+    finally:
+        _IN_FLIGHT_CALLS -= 1
+
+
+async def _timed_call(client: "BaseLLMClient", messages: List[Dict[str, Any]], **kwargs: Any) -> LLMResponse:
+    """Llama al proveedor y registra su duración para el control de admisión."""
+    start_time = time.monotonic()
+    response = await client.generate_response(messages, **kwargs)
+    record_llm_call(time.monotonic() - start_time)
+    return response
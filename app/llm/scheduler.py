@@ -0,0 +1,148 @@
+# app/llm/scheduler.py
+
+"""
+Planificador de llamadas LLM con clases de prioridad y reparto justo.
+
+Con varios lotes en curso, las llamadas salían en el orden en que
+`asyncio.gather` creaba las corrutinas: un lote interactivo de la GUI
+esperaba detrás de un trabajo masivo. El planificador limita las llamadas
+simultáneas del proceso y, cuando hay cola, elige la siguiente con
+weighted fair queuing jerárquico:
+
+1. entre clases de prioridad ('interactive', 'bulk', 'prefill'), según los
+   pesos de LLM_PRIORITY_WEIGHTS;
+2. dentro de una clase, a partes iguales entre clientes (tenant_id);
+3. dentro de un cliente, a partes iguales entre lotes (batch_id);
+4. dentro de un lote, por orden de llegada.
+
+Cada nivel guarda un tiempo virtual por hijo que avanza 1/peso con cada
+llamada despachada; se atiende al hijo con el menor. Un hijo que vuelve a
+tener cola parte del mínimo de los activos, para que no acumule crédito
+mientras estuvo inactivo.
+"""
+
+from __future__ import annotations
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+PRIORITY_CLASSES = ("interactive", "bulk", "prefill")
+DEFAULT_PRIORITY = "interactive"
+
+
+def priority_rank(priority: str) -> int:
+    """Orden de urgencia de una clase (0 = la más urgente); las desconocidas van al final."""
+    return PRIORITY_CLASSES.index(priority) if priority in PRIORITY_CLASSES else len(PRIORITY_CLASSES)
+
+
+@dataclass(frozen=True)
+class ScheduleKey:
+    """Identifica a quién se atribuye una llamada LLM."""
+    priority: str = DEFAULT_PRIORITY
+    tenant_id: Optional[str] = None
+    batch_id: Optional[str] = None
+
+
+class _FairNode:
+    """Nodo del árbol de colas: reparte entre sus hijos por tiempo virtual."""
+
+    def __init__(
+        self,
+        weight_of: Callable[[object], float],
+        child_factory: Optional[Callable[[], "_FairNode"]],
+        keep_idle_children: bool = False,
+    ):
+        self._weight_of = weight_of
+        self._child_factory = child_factory
+        # Los hijos sin cola se eliminan salvo en niveles con un conjunto cerrado de claves.
+        self._keep_idle_children = keep_idle_children
+        self._children: Dict[object, object] = {}
+        self._vtime: Dict[object, float] = {}
+        self.size = 0
+
+    def push(self, path: tuple, waiter: asyncio.Future):
+        key, rest = path[0], path[1:]
+        child = self._children.get(key)
+        if child is None:
+            child = self._child_factory() if self._child_factory else deque()
+            self._children[key] = child
+        if self._is_empty(child):
+            active = [self._vtime[k] for k, c in self._children.items() if k != key and not self._is_empty(c)]
+            self._vtime[key] = max(self._vtime.get(key, 0.0), min(active, default=0.0))
+        if isinstance(child, _FairNode):
+            child.push(rest, waiter)
+        else:
+            child.append(waiter)
+        self.size += 1
+
+    def pop(self) -> asyncio.Future:
+        key = min((k for k, c in self._children.items() if not self._is_empty(c)), key=self._vtime.__getitem__)
+        child = self._children[key]
+        waiter = child.pop() if isinstance(child, _FairNode) else child.popleft()
+        self._vtime[key] += 1.0 / max(self._weight_of(key), 1e-9)
+        self.size -= 1
+        if self._is_empty(child) and not self._keep_idle_children:
+            del self._children[key]
+            del self._vtime[key]
+        return waiter
+
+    @staticmethod
+    def _is_empty(child) -> bool:
+        return (child.size if isinstance(child, _FairNode) else len(child)) == 0
+
+
+class LLMScheduler:
+    """Limita las llamadas LLM simultáneas y ordena la espera por prioridad y equidad."""
+
+    def __init__(self, max_concurrency: int, weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.weights = dict(weights or {})
+        self.running = 0
+        self._queue = _FairNode(
+            weight_of=lambda priority: self.weights.get(priority, 1.0),
+            child_factory=lambda: _FairNode(
+                weight_of=lambda tenant: 1.0,
+                child_factory=lambda: _FairNode(weight_of=lambda batch: 1.0, child_factory=None),
+            ),
+            keep_idle_children=True,
+        )
+
+    @property
+    def waiting(self) -> int:
+        return self._queue.size
+
+    async def acquire(self, key: ScheduleKey):
+        if self.running < self.max_concurrency and self._queue.size == 0:
+            self.running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.push((key.priority, key.tenant_id, key.batch_id), waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Si el hueco ya se había concedido, se devuelve.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.max_concurrency and self._queue.size:
+            waiter = self._queue.pop()
+            if waiter.done():  # Cancelado mientras esperaba.
+                continue
+            self.running += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: ScheduleKey):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
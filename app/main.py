@@ -1,13 +1,18 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # El simple acto de importar este módulo ejecutará la configuración de logging
 # (dictConfig) que está definida a nivel de módulo en log.py.
-from app.db.session import engine
+from app.db.session import dispose_async_engines, engine
 from app.db import models
 from app.api.items_router import router as items_router
 from app.core.config import settings
+from app.inventory.prefill import run_prefill_loop
+from app.pipelines.executors import shutdown_executors
 
 # --- IMPORTACIÓN CRUCIAL POR EFECTO SECUNDARIO ---
 # Esta importación asegura que todas las etapas del pipeline se registren
@@ -20,9 +25,24 @@ from app.pipelines import builtins
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reposición del inventario con la capacidad ociosa (si está activo).
+    stop_prefill = asyncio.Event()
+    prefill_task = asyncio.create_task(run_prefill_loop(stop_prefill)) if settings.inventory_enabled else None
+    yield
+    stop_prefill.set()
+    if prefill_task is not None:
+        prefill_task.cancel()
+        await asyncio.gather(prefill_task, return_exceptions=True)
+    shutdown_executors()
+    await dispose_async_engines()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -4,16 +4,29 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 import logging
 import asyncio
+from collections import Counter
 from typing import List, Dict, Any, Type, Optional
 from pydantic import BaseModel
 
 from app.schemas.models import Item, ItemStatus
 from app.pipelines.utils.stage_helpers import add_revision_log_entry, handle_missing_payload
 from app.pipelines.utils.llm_utils import call_llm_and_parse_json_result
+from app.pipelines.utils.micro_batcher import get_micro_batcher
+from app.pipelines.utils.overprovision import SURPLUS_CANDIDATE_COMMENT
+from app.pipelines.budget import CHARS_PER_TOKEN, get_budget
+from app.core.config import settings
+from app.pipelines.executors import run_cpu_bound
 
 class BaseStage(ABC):
     """Clase base abstracta para todas las etapas del pipeline."""
 
+    # Si es True, la etapa se ejecuta también sobre los ítems de un lote
+    # cancelado (p. ej. para dejar registrado su estado final).
+    runs_after_cancel: bool = False
+    # Perfil de recursos de la etapa ('llm', 'cpu' o 'db'). En el modo
+    # distribuido cada clase puede servirse con su propio pool de workers.
+    resource_class: str = "cpu"
+
     def __init__(self, stage_name: str, params: Dict[str, Any], ctx: Dict[str, Any]):
         self.stage_name = stage_name
         self.params = params
@@ -28,21 +41,89 @@ class BaseStage(ABC):
         """
         pass
 
+class CPUBoundStage(BaseStage):
+    """
+    Clase base para etapas síncronas y CPU-bound (p. ej. validadores).
+    Implementan `_process_items_sync`, que se ejecuta en el pool indicado por
+    la opción `executor` de la etapa ('process', 'thread' o 'inline') para no
+    bloquear el event loop. En modo 'process' la etapa se reconstruye en el
+    proceso hijo, sin `ctx`.
+    """
+
+    async def execute(self, items: List[Item]) -> List[Item]:
+        await run_cpu_bound(self, items)
+        return items
+
+    @abstractmethod
+    def _process_items_sync(self, items: List[Item]):
+        """Procesa los ítems en su lugar, de forma síncrona."""
+        pass
+
 class LLMStage(BaseStage):
     """
     Clase base abstracta para etapas que interactúan con un LLM.
     Encapsula la lógica común de preparación, llamada y procesamiento del LLM.
     """
     pydantic_schema: Optional[Type[BaseModel]] = None
+    resource_class = "llm"
+    # Estado que cuenta para la cuota de ítems solicitados cuando hay
+    # sobre-generación (ver app.pipelines.utils.overprovision).
+    quota_success_status: Optional[ItemStatus] = None
 
     async def execute(self, items: List[Item]) -> List[Item]:
         """
         Ejecución genérica para etapas LLM que procesan ítems uno por uno.
         """
+        quotas = self.ctx.get("item_quotas")
+        if quotas and self.quota_success_status and self.ctx.get("quota_stage") == self.stage_name:
+            await self._execute_with_quota(items, quotas)
+            return items
+
         tasks = [self._process_single_item(item) for item in items]
         await asyncio.gather(*tasks)
         return items
 
+    async def _execute_with_quota(self, items: List[Item], quotas: Dict[str, int]):
+        """
+        Procesa los ítems concurrentemente y cancela las llamadas pendientes de
+        un lote en cuanto este alcanza su cuota de ítems aprobados. Si varios
+        candidatos aprueban a la vez, los que exceden la cuota también se
+        descartan, de modo que se aceptan exactamente los solicitados.
+        """
+        tasks = {asyncio.create_task(self._process_single_item(item)): item for item in items}
+        order = {task: index for index, task in enumerate(tasks)}
+        passed: Counter = Counter()
+        pending = set(tasks)
+        cancelled: List[asyncio.Task] = []
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=order.get):
+                item = tasks[task]
+                if item.status != self.quota_success_status:
+                    continue
+                if item.batch_id in quotas and passed[item.batch_id] >= quotas[item.batch_id]:
+                    cancelled.append(task)
+                else:
+                    passed[item.batch_id] += 1
+
+            for task in list(pending):
+                batch_id = tasks[task].batch_id
+                if batch_id in quotas and passed[batch_id] >= quotas[batch_id]:
+                    task.cancel()
+                    pending.discard(task)
+                    cancelled.append(task)
+
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+            for task in cancelled:
+                item = tasks[task]
+                add_revision_log_entry(
+                    item, self.stage_name, ItemStatus.SKIPPED,
+                    f"{SURPLUS_CANDIDATE_COMMENT}: el lote ya alcanzó su cuota de {quotas[item.batch_id]} ítem(s)."
+                )
+            self.logger.info(f"Se cancelaron {len(cancelled)} candidato(s) excedentes en '{self.stage_name}'.")
+
     async def _process_single_item(self, item: Item):
         """Procesa un único ítem a través del flujo LLM."""
         if item.status == ItemStatus.FATAL:
@@ -65,15 +146,7 @@ class LLMStage(BaseStage):
             add_revision_log_entry(item, self.stage_name, ItemStatus.FATAL, comment)
             return
 
-        result_obj, llm_errors, tokens_used = await call_llm_and_parse_json_result(
-            prompt_name=prompt_name,
-            user_input_content=llm_input,
-            stage_name=self.stage_name,
-            item=item,
-            ctx=self.ctx,
-            expected_schema=self.pydantic_schema,
-            **self.params,
-        )
+        result_obj, llm_errors, tokens_used = await self._call_llm(item, prompt_name, llm_input)
 
         if llm_errors:
             error_summary = f"Fallo en la utilidad LLM: {llm_errors[0].descripcion_hallazgo}"
@@ -84,6 +157,40 @@ class LLMStage(BaseStage):
             summary = "El LLM no devolvió un resultado válido ni errores específicos."
             add_revision_log_entry(item, self.stage_name, ItemStatus.FATAL, summary, tokens_used=tokens_used)
 
+    async def _call_llm(self, item: Item, prompt_name: str, llm_input: str):
+        """
+        Llama al LLM para un ítem. Si la etapa tiene 'micro_batch' configurado,
+        la solicitud se agrupa con otras pendientes de la misma etapa; si el
+        micro-lote no devuelve un resultado válido para el ítem, se usa la ruta
+        individual. Si la llamada no cabe en el presupuesto del lote, el ítem va
+        directamente a la ruta individual, que aplica el modelo de respaldo o la rechaza.
+        """
+        batcher = get_micro_batcher(self.stage_name, prompt_name, self.pydantic_schema, self.params)
+        if batcher and self._fits_budget(item, llm_input):
+            batched_result = await batcher.submit(item, llm_input, self.ctx)
+            if batched_result is not None:
+                return batched_result
+
+        return await call_llm_and_parse_json_result(
+            prompt_name=prompt_name,
+            user_input_content=llm_input,
+            stage_name=self.stage_name,
+            item=item,
+            ctx=self.ctx,
+            expected_schema=self.pydantic_schema,
+            **self.params,
+        )
+
+    def _fits_budget(self, item: Item, llm_input: str) -> bool:
+        budget = get_budget(self.ctx, item)
+        if budget is None:
+            return True
+        return budget.fits_call(
+            self.params.get("model", settings.llm_model),
+            len(llm_input) // CHARS_PER_TOKEN,
+            self.params.get("max_tokens") or settings.llm_max_tokens,
+        )
+
     @abstractmethod
     def _prepare_llm_input(self, item: Item) -> str:
         """Prepara el input para el LLM. Debe ser implementado por la subclase."""
@@ -0,0 +1,219 @@
+# app/pipelines/budget.py
+
+"""
+Gobernador del presupuesto de tokens y coste de cada lote.
+
+`Item.token_usage` y `Item.cost_usd` acumulan el gasto real de cada ítem; el
+gasto de un lote es la suma de sus ítems, de modo que viaja con ellos entre
+etapas, workers y reintentos. Antes de cada llamada LLM se estima su coste
+(tokens del prompt ≈ caracteres / 4, más `max_tokens` de salida) y se
+reserva mientras está en curso. Si no cabe en lo que queda del presupuesto:
+
+1. se usa el `fallback_model` de la etapa, si lo tiene y cabe;
+2. si no, la llamada se rechaza con el hallazgo E907_BUDGET_EXCEEDED.
+
+Las etapas marcadas con `optional: true` en pipeline.yml se omiten por
+completo cuando la estimación de la etapa para los ítems del lote no cabe.
+
+El límite de cada lote (BUDGET_MAX_*_PER_ITEM por ítem solicitado, acotado
+por lo que le queda al cliente en el mes) se registra en `batch_budgets` al
+admitir la solicitud; los lotes sin registro (p. ej. `app.batch_cli`) usan
+solo el límite por ítem.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.log import logger
+from app.db import async_crud
+from app.llm.pricing import estimate_cost
+from app.pipelines.metrics import get_stage_tokens_per_item
+from app.schemas.item_schemas import FindingSchema
+from app.schemas.models import Item
+
+# Tokens por ítem supuestos para una etapa que este proceso aún no ha medido.
+DEFAULT_STAGE_TOKENS_PER_ITEM = 4000
+# Aproximación habitual de tokens a partir del texto del prompt.
+CHARS_PER_TOKEN = 4
+
+Reservation = Tuple[int, float]
+
+
+@dataclass
+class BatchBudget:
+    """Límites de un lote y reservas de sus llamadas LLM en curso."""
+    batch_id: str
+    max_tokens: Optional[int] = None
+    max_cost_usd: Optional[float] = None
+    items: List[Item] = field(default_factory=list, repr=False)
+    reserved_tokens: int = 0
+    reserved_cost_usd: float = 0.0
+    downgraded_calls: int = 0
+    refused_calls: int = 0
+
+    @property
+    def spent_tokens(self) -> int:
+        return sum(item.token_usage for item in self.items)
+
+    @property
+    def spent_cost_usd(self) -> float:
+        return sum(item.cost_usd for item in self.items)
+
+    def can_afford(self, tokens: int, cost_usd: float) -> bool:
+        if self.max_tokens and self.spent_tokens + self.reserved_tokens + tokens > self.max_tokens:
+            return False
+        if self.max_cost_usd and self.spent_cost_usd + self.reserved_cost_usd + cost_usd > self.max_cost_usd:
+            return False
+        return True
+
+    def fits_call(self, model: str, prompt_tokens: int, completion_tokens: int) -> bool:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        return self.can_afford(prompt_tokens + completion_tokens, cost)
+
+    def admit_call(
+        self, model: str, fallback_model: Optional[str], prompt_tokens: int, completion_tokens: int
+    ) -> Tuple[Optional[str], Optional[Reservation]]:
+        """
+        Decide con qué modelo se hace la llamada y reserva su coste estimado.
+        Devuelve (None, None) si no cabe ni con el modelo de respaldo.
+        """
+        tokens = prompt_tokens + completion_tokens
+        for candidate in (model, fallback_model):
+            if not candidate:
+                continue
+            cost = estimate_cost(candidate, prompt_tokens, completion_tokens)
+            if self.can_afford(tokens, cost):
+                if candidate != model:
+                    self.downgraded_calls += 1
+                    logger.info(f"Batch {self.batch_id}: presupuesto ajustado, '{model}' -> '{candidate}'.")
+                self.reserved_tokens += tokens
+                self.reserved_cost_usd += cost
+                return candidate, (tokens, cost)
+        self.refused_calls += 1
+        return None, None
+
+    def release(self, reservation: Optional[Reservation]):
+        if reservation:
+            self.reserved_tokens -= reservation[0]
+            self.reserved_cost_usd -= reservation[1]
+
+    def describe(self) -> str:
+        max_cost = f"{self.max_cost_usd:.4f}" if self.max_cost_usd else "∞"
+        return (
+            f"gastado {self.spent_tokens} tokens / {self.spent_cost_usd:.4f} USD "
+            f"de {self.max_tokens or '∞'} tokens / {max_cost} USD"
+        )
+
+
+def default_batch_limits(n_items: int) -> Tuple[Optional[int], Optional[float]]:
+    """Límites de un lote de `n_items` ítems según BUDGET_MAX_*_PER_ITEM (None = sin límite)."""
+    max_tokens = settings.budget_max_tokens_per_item * n_items or None
+    max_cost_usd = settings.budget_max_cost_usd_per_item * n_items or None
+    return max_tokens, max_cost_usd
+
+
+def month_start(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def tenant_monthly_limits(tenant_id: str) -> Tuple[Optional[int], Optional[float]]:
+    max_tokens = settings.budget_tenant_monthly_max_tokens or None
+    max_cost_usd = settings.budget_tenant_monthly_cost_usd_overrides.get(
+        tenant_id, settings.budget_tenant_monthly_max_cost_usd
+    ) or None
+    return max_tokens, max_cost_usd
+
+
+def _requested_items(items: List[Item]) -> int:
+    # Los candidatos sobre-generados no amplían el presupuesto del lote.
+    n_items = (items[0].generation_params or {}).get("n_items") if items else None
+    return int(n_items) if n_items else len(items)
+
+
+async def attach_budgets(items: List[Item], ctx: Dict[str, Any]):
+    """Crea en `ctx["budgets"]` el presupuesto de cada lote presente en `items`."""
+    by_batch: Dict[str, List[Item]] = {}
+    for item in items:
+        by_batch.setdefault(item.batch_id, []).append(item)
+
+    registered: Dict[str, Tuple[Optional[int], Optional[float]]] = {}
+    session_factory = ctx.get("async_session_factory")
+    if session_factory is not None:
+        try:
+            async with session_factory() as db:
+                registered = await async_crud.get_batch_budget_limits(db, list(by_batch))
+        except Exception as e:
+            logger.error(f"No se pudieron leer los presupuestos de los lotes: {e}")
+
+    budgets = {}
+    for batch_id, batch_items in by_batch.items():
+        max_tokens, max_cost_usd = registered.get(batch_id) or default_batch_limits(_requested_items(batch_items))
+        budgets[batch_id] = BatchBudget(batch_id, max_tokens, max_cost_usd, batch_items)
+    ctx["budgets"] = budgets
+
+
+def get_budget(ctx: Optional[Dict[str, Any]], item: Item) -> Optional[BatchBudget]:
+    return ((ctx or {}).get("budgets") or {}).get(item.batch_id)
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(message.get("content") or "")) for message in messages) // CHARS_PER_TOKEN
+
+
+def budget_exceeded_finding(budget: BatchBudget) -> FindingSchema:
+    return FindingSchema(
+        codigo_error="E907_BUDGET_EXCEEDED",
+        campo_con_error="llm_call",
+        descripcion_hallazgo=f"Llamada LLM omitida: no cabe en el presupuesto del lote ({budget.describe()}).",
+    )
+
+
+def stage_fits_budget(budget: BatchBudget, stage_name: str, model: str, n_items: int) -> bool:
+    """Preflight de una etapa opcional: ¿cabe su consumo estimado para `n_items` ítems?"""
+    tokens = int((get_stage_tokens_per_item(stage_name) or DEFAULT_STAGE_TOKENS_PER_ITEM) * n_items)
+    return budget.can_afford(tokens, estimate_cost(model, tokens // 2, tokens - tokens // 2))
+
+
+BatchSpend = Dict[str, Tuple[int, float]]
+
+
+def batch_spend(ctx: Dict[str, Any], spent_before: Optional[BatchSpend] = None) -> BatchSpend:
+    """
+    Gasto por lote (batch_id -> (tokens, coste)) de `ctx["budgets"]`, sumado a
+    `spent_before` (p. ej. el de las ventanas anteriores de una ejecución por ventanas).
+    """
+    spend = dict(spent_before or {})
+    for batch_id, budget in (ctx.get("budgets") or {}).items():
+        tokens, cost_usd = spend.get(batch_id, (0, 0.0))
+        spend[batch_id] = (tokens + budget.spent_tokens, cost_usd + budget.spent_cost_usd)
+    return spend
+
+
+async def record_spend(ctx: Dict[str, Any], spend: BatchSpend, completed: bool = False):
+    """Escribe `spend` en `batch_budgets`; con `completed` marca además los lotes como terminados."""
+    session_factory = ctx.get("async_session_factory")
+    if not spend or session_factory is None:
+        return
+    try:
+        async with session_factory() as db:
+            await async_crud.record_batch_spend(db, spend, completed=completed)
+    except Exception as e:
+        logger.error(f"No se pudo registrar el gasto de los lotes {list(spend)}: {e}")
+
+
+async def flush_budget_spend(
+    ctx: Dict[str, Any], completed: bool = False, spent_before: Optional[BatchSpend] = None
+):
+    """Registra en `batch_budgets` el gasto acumulado de los lotes del contexto (más `spent_before`)."""
+    budgets: Dict[str, BatchBudget] = ctx.get("budgets") or {}
+    await record_spend(ctx, batch_spend(ctx, spent_before), completed=completed)
+    for budget in budgets.values():
+        if budget.downgraded_calls or budget.refused_calls:
+            logger.info(
+                f"Batch {budget.batch_id}: {budget.describe()}; {budget.downgraded_calls} llamada(s) "
+                f"con modelo de respaldo, {budget.refused_calls} rechazada(s)."
+            )
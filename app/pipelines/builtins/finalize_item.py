@@ -19,6 +19,7 @@ class FinalizeItemStage(LLMStage):
     y le asigna un puntaje estructurado, sin modificar su contenido.
     """
     pydantic_schema = FinalEvaluationSchema
+    quota_success_status = ItemStatus.EVALUATION_COMPLETE
 
     def _prepare_llm_input(self, item: Item) -> str:
         """
@@ -33,7 +34,7 @@ class FinalizeItemStage(LLMStage):
         input_data = {
             "temp_id": str(item.temp_id),
             "item_a_evaluar": item.payload.model_dump(mode='json'),
-            "historial_de_cambios": [log.model_dump(mode='json') for log in item.change_log]
+            "historial_de_cambios": [log.model_dump(mode='json', exclude={'entry_id'}) for log in item.change_log]
         }
         return json.dumps(input_data, ensure_ascii=False)
 
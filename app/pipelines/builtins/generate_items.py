@@ -1,17 +1,25 @@
 # app/pipelines/builtins/generate_items.py
 
 from __future__ import annotations
+import asyncio
 import json
 import time
-from typing import List
+from typing import Any, Dict, List
 from pydantic import ValidationError
 
 from ..registry import register
 from app.schemas.models import Item, ItemStatus
 from app.schemas.item_schemas import ItemPayloadSchema
 from app.pipelines.abstractions import BaseStage
-from app.pipelines.utils.stage_helpers import add_revision_log_entry
+from app.pipelines.utils.stage_helpers import add_revision_log_entry, group_items_by_batch
 from app.pipelines.utils.llm_utils import call_llm_and_parse_json_result
+from app.pipelines.utils.repair import (
+    SCHEMA_ERROR_CODE,
+    format_validation_errors,
+    get_repair_config,
+    is_repairable,
+    repair_item_payload,
+)
 
 @register("generate_items")
 class GenerateItemsStage(BaseStage):
@@ -19,8 +27,15 @@ class GenerateItemsStage(BaseStage):
     Etapa inicial del pipeline que genera un lote de ítems.
     Hereda de BaseStage por su lógica única de "uno a muchos".
     """
+    resource_class = "llm"
 
     async def execute(self, items: List[Item]) -> List[Item]:
+        # Una ventana del runner puede mezclar ítems de varias solicitudes;
+        # cada lote se procesa por separado con sus propios parámetros.
+        await asyncio.gather(*(self._execute_batch(batch) for batch in group_items_by_batch(items)))
+        return items
+
+    async def _execute_batch(self, items: List[Item]) -> List[Item]:
         if not items:
             return items
 
@@ -36,7 +51,7 @@ class GenerateItemsStage(BaseStage):
             return items
 
         try:
-            llm_input = self._prepare_llm_input(representative_item)
+            llm_input = self._prepare_llm_input(representative_item, len(items))
         except ValueError as e:
             duration_ms = int((time.monotonic() - start_time) * 1000)
             self._set_status_for_all(items, ItemStatus.FATAL, str(e), duration_ms, tokens_used)
@@ -65,11 +80,15 @@ class GenerateItemsStage(BaseStage):
 
         return items
 
-    def _prepare_llm_input(self, item: Item) -> str:
-        """Prepara el input JSON para el LLM."""
+    def _prepare_llm_input(self, item: Item, n_items: int) -> str:
+        """
+        Prepara el input JSON para el LLM. Se solicita un ítem por cada
+        elemento del lote, que puede incluir candidatos sobre-generados.
+        """
         if not item.generation_params:
             raise ValueError(f"Ítem {item.temp_id} no tiene parámetros de generación.")
-        return json.dumps(item.generation_params, ensure_ascii=False)
+        params = dict(item.generation_params, n_items=n_items)
+        return json.dumps(params, ensure_ascii=False)
 
     async def _process_llm_result(self, items: List[Item], result_str: str, duration_ms: int, tokens_used: int):
         """Procesa la respuesta del LLM, validando y asignando cada payload."""
@@ -96,6 +115,9 @@ class GenerateItemsStage(BaseStage):
         avg_duration = duration_ms // len(items) if items else 0
         avg_tokens = tokens_used // len(items) if items else 0
 
+        repair_cfg = get_repair_config(self.params)
+        repair_tasks = []
+
         for i, payload_dict in enumerate(generated_payloads):
             target_item = items[i]
             try:
@@ -109,6 +131,14 @@ class GenerateItemsStage(BaseStage):
                     duration_ms=avg_duration, tokens_used=avg_tokens
                 )
             except ValidationError as e:
+                # Si hay reparación configurada, se intenta recuperar solo este ítem
+                # en lugar de perderlo o regenerar el lote completo.
+                if repair_cfg and isinstance(payload_dict, dict) and is_repairable(SCHEMA_ERROR_CODE, repair_cfg):
+                    repair_tasks.append(
+                        self._repair_generated_item(target_item, payload_dict, e, repair_cfg, avg_duration, avg_tokens)
+                    )
+                    continue
+
                 error_summary = f"Error de validación Pydantic para el ítem {i+1}: {e.errors()}"
                 add_revision_log_entry(
                     item=target_item, stage_name=self.stage_name,
@@ -116,6 +146,43 @@ class GenerateItemsStage(BaseStage):
                     duration_ms=avg_duration, tokens_used=avg_tokens
                 )
 
+        if repair_tasks:
+            await asyncio.gather(*repair_tasks)
+
+    async def _repair_generated_item(
+        self, item: Item, payload_dict: Dict[str, Any], error: ValidationError,
+        repair_cfg: Dict[str, Any], duration_ms: int, tokens_used: int
+    ):
+        """Intenta reparar un ítem generado que no cumple el esquema."""
+        errors = format_validation_errors(error)
+        repaired, repair_tokens, attempts = await repair_item_payload(
+            item=item,
+            broken_payload=payload_dict,
+            errors=errors,
+            codes=[SCHEMA_ERROR_CODE],
+            stage_name=self.stage_name,
+            ctx=self.ctx,
+            repair_cfg=repair_cfg,
+        )
+
+        if repaired:
+            item.payload = repaired
+            add_revision_log_entry(
+                item=item, stage_name=self.stage_name,
+                status=ItemStatus.GENERATION_SUCCESS,
+                comment=f"Ítem generado y reparado tras {attempts} intento(s). Errores originales: {errors}",
+                duration_ms=duration_ms, tokens_used=tokens_used + repair_tokens,
+                codes_found=[SCHEMA_ERROR_CODE],
+            )
+        else:
+            add_revision_log_entry(
+                item=item, stage_name=self.stage_name,
+                status=ItemStatus.FATAL,
+                comment=f"Error de validación Pydantic no reparado tras {attempts} intento(s): {errors}",
+                duration_ms=duration_ms, tokens_used=tokens_used + repair_tokens,
+                codes_found=[SCHEMA_ERROR_CODE],
+            )
+
     def _set_status_for_all(self, items: List[Item], status: ItemStatus, summary: str, duration_ms: int, tokens_used: int):
         """Helper para establecer el mismo estado de error para todo el lote."""
         avg_duration = duration_ms // len(items) if items else 0
@@ -3,10 +3,9 @@
 from __future__ import annotations
 from typing import List
 
-from sqlalchemy.orm import Session
 from ..registry import register
 from app.schemas.models import Item, ItemStatus
-from app.db import crud
+from app.db import async_crud
 from app.pipelines.abstractions import BaseStage
 from app.pipelines.utils.stage_helpers import add_revision_log_entry
 
@@ -16,6 +15,8 @@ class PersistStage(BaseStage):
     Etapa final del pipeline que persiste el estado de todos los ítems
     en la base de datos utilizando la capa CRUD.
     """
+    runs_after_cancel = True
+    resource_class = "db"
 
     async def execute(self, items: List[Item]) -> List[Item]:
         self.logger.info(f"Starting persistence stage for {len(items)} items.")
@@ -23,11 +24,12 @@ class PersistStage(BaseStage):
             return items
 
         # --- CORRECCIÓN ARQUITECTÓNICA ---
-        # Se obtiene la sesión de la base de datos desde el contexto de la etapa,
-        # que fue inyectado por el runner al inicio del pipeline.
-        db: Session = self.ctx.get("db_session")
+        # Se obtiene la fábrica de sesiones asíncronas del pipeline desde el
+        # contexto de la etapa; nunca la sesión de una petición HTTP, que ya
+        # se habrá cerrado cuando el pipeline llegue hasta aquí.
+        session_factory = self.ctx.get("async_session_factory")
 
-        if not db:
+        if not session_factory:
             # Este es un error crítico de configuración del pipeline.
             self.logger.critical("No se encontró la sesión de base de datos en el contexto de la etapa. No se puede persistir.")
             for item in items:
@@ -47,16 +49,18 @@ class PersistStage(BaseStage):
         try:
             self.logger.info(f"Attempting to persist {len(items_to_persist)} items to the database...")
 
-            # La capa CRUD se encarga de la transacción.
-            # Se le pasa la sesión de DB obtenida del contexto.
-            crud.save_items(db=db, items=items_to_persist)
+            # La capa CRUD se encarga de la transacción, sin bloquear el event loop.
+            async with session_factory() as db:
+                await async_crud.save_items(db=db, items=items_to_persist)
 
             # Después de una persistencia exitosa, actualiza el estado de cada ítem.
+            # Los ítems de un lote cancelado conservan su estado SKIPPED.
             for item in items_to_persist:
+                status = ItemStatus.SKIPPED if item.status == ItemStatus.SKIPPED else ItemStatus.PERSISTENCE_SUCCESS
                 add_revision_log_entry(
                     item=item,
                     stage_name=self.stage_name,
-                    status=ItemStatus.PERSISTENCE_SUCCESS,
+                    status=status,
                     comment=f"Ítem guardado/actualizado exitosamente en la base de datos con ID: {item.item_id}."
                 )
 
@@ -64,7 +68,7 @@ class PersistStage(BaseStage):
 
         except Exception as e:
             self.logger.critical(f"A critical error occurred during the persistence stage: {e}", exc_info=True)
-            # Si la transacción falla (crud.save_items lanza una excepción),
+            # Si la transacción falla (async_crud.save_items lanza una excepción),
             # actualiza el estado de los ítems afectados en memoria.
             for item in items_to_persist:
                 add_revision_log_entry(
@@ -67,6 +67,6 @@ class RefineItemStyleStage(BaseRefinerStage):
 
         # 3. Añadir hallazgos del validador suave como guía.
         if item.findings:
-            input_data["hallazgos_guia"] = [f.model_dump(mode="json") for f in item.findings]
+            input_data["hallazgos_guia"] = [f.model_dump(mode="json", exclude={"entry_id"}) for f in item.findings]
 
         return json.dumps(input_data, ensure_ascii=False)
@@ -1,17 +1,23 @@
 # app/pipelines/builtins/validate_hard.py
 
 from __future__ import annotations
+import asyncio
 import re
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 from ..registry import register
 from app.schemas.models import Item, ItemStatus
 from app.schemas.item_schemas import ItemPayloadSchema, RecursoGraficoSchema, FindingSchema
-from app.pipelines.abstractions import BaseStage
+from app.pipelines.abstractions import CPUBoundStage
 from app.pipelines.utils.stage_helpers import add_revision_log_entry
+from app.pipelines.utils.repair import get_repair_config, is_repairable, repair_item_payload
+
+# (código de error, campo, mensaje) del primer fallo de validación.
+StructuralError = Tuple[str, str, str]
+
 
 @register("validate_hard")
-class ValidateHardStage(BaseStage):
+class ValidateHardStage(CPUBoundStage):
     """
     Etapa de validación "dura" que realiza comprobaciones programáticas
     sobre la consistencia interna y estructural del payload del ítem.
@@ -19,6 +25,33 @@ class ValidateHardStage(BaseStage):
 
     async def execute(self, items: List[Item]) -> List[Item]:
         self.logger.info(f"Iniciando validación dura para {len(items)} ítems.")
+        repair_cfg = get_repair_config(self.params)
+        snapshots = [
+            (item, item.status, len(item.findings))
+            for item in items
+            if item.status != ItemStatus.FATAL
+        ]
+
+        # Las validaciones se ejecutan en el executor configurado; la
+        # reparación (llamadas LLM) se queda en el event loop.
+        await super().execute(items)
+
+        repair_tasks = []
+        if repair_cfg:
+            for item, previous_status, findings_before in snapshots:
+                if item.status != ItemStatus.FATAL or not item.payload:
+                    continue
+                new_codes = [f.codigo_error for f in item.findings[findings_before:]]
+                if new_codes and all(is_repairable(code, repair_cfg) for code in new_codes):
+                    repair_tasks.append(self._repair_item(item, previous_status, findings_before, repair_cfg))
+
+        if repair_tasks:
+            await asyncio.gather(*repair_tasks)
+
+        self.logger.info("Validación dura completada.")
+        return items
+
+    def _process_items_sync(self, items: List[Item]):
         for item in items:
             if item.status == ItemStatus.FATAL:
                 continue
@@ -31,28 +64,85 @@ class ValidateHardStage(BaseStage):
                 add_revision_log_entry(
                     item, self.stage_name, item.status, "OK. Las validaciones estructurales pasaron."
                 )
-        self.logger.info("Validación dura completada.")
-        return items
+
+    async def _repair_item(self, item: Item, previous_status: ItemStatus, findings_before: int, repair_cfg: Dict[str, Any]):
+        """
+        Envía el ítem y sus hallazgos estructurales al reparador y, si la
+        versión reparada supera de nuevo la validación dura, lo reincorpora.
+        """
+        new_findings = item.findings[findings_before:]
+        codes = [f.codigo_error for f in new_findings]
+        errors = [f"{f.campo_con_error}: {f.descripcion_hallazgo}" for f in new_findings]
+
+        repaired, tokens_used, attempts = await repair_item_payload(
+            item=item,
+            broken_payload=item.payload.model_dump(mode="json", exclude={"revision_log"}),
+            errors=errors,
+            codes=codes,
+            stage_name=self.stage_name,
+            ctx=self.ctx,
+            repair_cfg=repair_cfg,
+            revalidate=self._collect_structural_errors,
+        )
+
+        if repaired:
+            item.payload = repaired
+            del item.findings[findings_before:]
+            add_revision_log_entry(
+                item, self.stage_name, previous_status,
+                f"OK tras reparación dirigida en {attempts} intento(s).",
+                tokens_used=tokens_used, codes_found=codes,
+            )
+        else:
+            add_revision_log_entry(
+                item, self.stage_name, ItemStatus.FATAL,
+                f"FATAL: La reparación dirigida falló tras {attempts} intento(s).",
+                tokens_used=tokens_used, codes_found=codes,
+            )
+
+    def _collect_structural_errors(self, payload: ItemPayloadSchema) -> List[str]:
+        """
+        Revalida localmente un payload candidato de la reparación. No registra
+        hallazgos ni entradas del revision_log: el ítem real sigue en reparación.
+        """
+        error = self._find_structural_error(payload)
+        if error is None:
+            return []
+        _, field, message = error
+        return [f"{field}: FATAL: {message}"]
 
     def _validate_single_item(self, item: Item) -> bool:
         """
         Realiza una serie de validaciones. Devuelve True si todo está bien,
-        y False si alguna validación falla.
+        y False si alguna validación falla (registrando el error fatal).
         """
-        if not item.payload:
-            self._add_fatal_finding(item, "E952_PAYLOAD_AUSENTE", "N/A", "El payload del ítem está ausente.")
-            return False
+        error = self._find_structural_error(item.payload)
+        if error is None:
+            return True
+        self._add_fatal_finding(item, *error)
+        return False
 
-        payload = item.payload
-
-        if not self._validate_required_text_fields(item, payload): return False
-        if not self._validate_options_and_key(item, payload): return False
-        if not self._validate_unique_option_content(item, payload): return False
-        if not self._validate_completamiento(item, payload): return False
-        if not self._validate_ordenamiento(item, payload): return False
-        if not self._validate_graphic_resources(item, payload): return False
-
-        return True
+    def _find_structural_error(self, payload: Optional[ItemPayloadSchema]) -> Optional[StructuralError]:
+        """
+        Devuelve el primer error estructural del payload como (código, campo,
+        mensaje), o None si todas las validaciones pasan. Sin efectos secundarios.
+        """
+        if not payload:
+            return ("E952_PAYLOAD_AUSENTE", "N/A", "El payload del ítem está ausente.")
+
+        checks = (
+            self._validate_required_text_fields,
+            self._validate_options_and_key,
+            self._validate_unique_option_content,
+            self._validate_completamiento,
+            self._validate_ordenamiento,
+            self._validate_graphic_resources,
+        )
+        for check in checks:
+            error = check(payload)
+            if error is not None:
+                return error
+        return None
 
     def _add_finding(self, item: Item, code: str, field: str, description: str):
         """Helper para añadir un hallazgo a la lista del ítem."""
@@ -68,64 +158,54 @@ class ValidateHardStage(BaseStage):
         self._add_finding(item, code, field, f"FATAL: {message}")
         add_revision_log_entry(item, self.stage_name, ItemStatus.FATAL, f"FATAL: {message}", codes_found=[code])
 
-    def _validate_required_text_fields(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_required_text_fields(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         if not payload.cuerpo_item.enunciado_pregunta or not payload.cuerpo_item.enunciado_pregunta.strip():
-            self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", "cuerpo_item.enunciado_pregunta", "El campo 'enunciado_pregunta' no puede estar vacío.")
-            return False
+            return ("E001_SCHEMA_INVALIDO", "cuerpo_item.enunciado_pregunta", "El campo 'enunciado_pregunta' no puede estar vacío.")
         for i, opt in enumerate(payload.cuerpo_item.opciones):
             if not opt.texto or not opt.texto.strip():
-                self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", f"cuerpo_item.opciones[{i}].texto", f"El texto de la opción '{opt.id}' no puede estar vacío.")
-                return False
-        return True
+                return ("E001_SCHEMA_INVALIDO", f"cuerpo_item.opciones[{i}].texto", f"El texto de la opción '{opt.id}' no puede estar vacío.")
+        return None
 
-    def _validate_options_and_key(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_options_and_key(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         option_ids = {opt.id for opt in payload.cuerpo_item.opciones}
         if len(option_ids) != len(payload.cuerpo_item.opciones):
-            self._add_fatal_finding(item, "E011_ID_OPCION_DUPLICADO", "cuerpo_item.opciones", "Se encontraron IDs de opción duplicados.")
-            return False
+            return ("E011_ID_OPCION_DUPLICADO", "cuerpo_item.opciones", "Se encontraron IDs de opción duplicados.")
 
         correct_option_id = payload.clave_y_diagnostico.respuesta_correcta_id
         if correct_option_id not in option_ids:
-            self._add_fatal_finding(item, "E013_ID_CLAVE_NO_COINCIDE", "clave_y_diagnostico.respuesta_correcta_id", f"La respuesta correcta declarada ('{correct_option_id}') no existe en las opciones.")
-            return False
+            return ("E013_ID_CLAVE_NO_COINCIDE", "clave_y_diagnostico.respuesta_correcta_id", f"La respuesta correcta declarada ('{correct_option_id}') no existe en las opciones.")
 
         correct_flags = [retro.es_correcta for retro in payload.clave_y_diagnostico.retroalimentacion_opciones if retro.es_correcta]
         if len(correct_flags) != 1:
-            self._add_fatal_finding(item, "E012_CONTEO_CLAVE_INCORRECTO", "clave_y_diagnostico.retroalimentacion_opciones", f"Se encontraron {len(correct_flags)} opciones marcadas como correctas, se esperaba 1.")
-            return False
+            return ("E012_CONTEO_CLAVE_INCORRECTO", "clave_y_diagnostico.retroalimentacion_opciones", f"Se encontraron {len(correct_flags)} opciones marcadas como correctas, se esperaba 1.")
 
-        return True
+        return None
 
-    def _validate_unique_option_content(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_unique_option_content(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         option_texts = [opt.texto.strip() for opt in payload.cuerpo_item.opciones if opt.texto]
         if len(option_texts) != len(set(option_texts)):
-            self._add_fatal_finding(item, "E014_OPCION_DUPLICADA", "cuerpo_item.opciones", "Se encontraron dos o más opciones con el mismo texto.")
-            return False
-        return True
+            return ("E014_OPCION_DUPLICADA", "cuerpo_item.opciones", "Se encontraron dos o más opciones con el mismo texto.")
+        return None
 
-    def _validate_completamiento(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_completamiento(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         if payload.formato.tipo_reactivo == "completamiento":
             holes = payload.cuerpo_item.enunciado_pregunta.count("___")
             if holes > 0:
                 if payload.cuerpo_item.estimulo and "___" in payload.cuerpo_item.estimulo:
-                    self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", "cuerpo_item.estimulo", "Los huecos de completamiento ('___') solo deben aparecer en 'enunciado_pregunta'.")
-                    return False
+                    return ("E001_SCHEMA_INVALIDO", "cuerpo_item.estimulo", "Los huecos de completamiento ('___') solo deben aparecer en 'enunciado_pregunta'.")
                 for i, opt in enumerate(payload.cuerpo_item.opciones):
                     segments = opt.texto.split(' | ')
                     if len(segments) != holes:
-                        self._add_fatal_finding(item, "E030_COMPLETAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"El número de segmentos ({len(segments)}) en la opción '{opt.id}' no coincide con los huecos ({holes}).")
-                        return False
-        return True
+                        return ("E030_COMPLETAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"El número de segmentos ({len(segments)}) en la opción '{opt.id}' no coincide con los huecos ({holes}).")
+        return None
 
-    def _validate_ordenamiento(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_ordenamiento(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         if payload.formato.tipo_reactivo == "ordenamiento":
             if not payload.cuerpo_item.estimulo:
-                self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", "cuerpo_item.stimulo", "Ítems de ordenamiento requieren un estímulo con la lista de elementos.")
-                return False
+                return ("E001_SCHEMA_INVALIDO", "cuerpo_item.stimulo", "Ítems de ordenamiento requieren un estímulo con la lista de elementos.")
             elements = re.findall(r"^\s*\d+\.", payload.cuerpo_item.estimulo, re.MULTILINE)
             if not elements:
-                self._add_fatal_finding(item, "E031_ORDENAMIENTO_INCONSISTENTE", "cuerpo_item.stimulo", "El estímulo para el ítem de ordenamiento no contiene una lista numerada.")
-                return False
+                return ("E031_ORDENAMIENTO_INCONSISTENTE", "cuerpo_item.stimulo", "El estímulo para el ítem de ordenamiento no contiene una lista numerada.")
 
             n_elements = len(elements)
             expected_nums = set(range(1, n_elements + 1))
@@ -134,14 +214,12 @@ class ValidateHardStage(BaseStage):
                 try:
                     nums = {int(n.strip()) for n in opt.texto.split(',')}
                     if nums != expected_nums:
-                        self._add_fatal_finding(item, "E031_ORDENAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"La opción '{opt.id}' no es una permutación válida de los {n_elements} elementos.")
-                        return False
+                        return ("E031_ORDENAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"La opción '{opt.id}' no es una permutación válida de los {n_elements} elementos.")
                 except (ValueError, AttributeError):
-                    self._add_fatal_finding(item, "E031_ORDENAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"La opción '{opt.id}' ('{opt.texto}') no tiene un formato de permutación válido.")
-                    return False
-        return True
+                    return ("E031_ORDENAMIENTO_INCONSISTENTE", f"cuerpo_item.opciones[{i}].texto", f"La opción '{opt.id}' ('{opt.texto}') no tiene un formato de permutación válido.")
+        return None
 
-    def _validate_graphic_resources(self, item: Item, payload: ItemPayloadSchema) -> bool:
+    def _validate_graphic_resources(self, payload: ItemPayloadSchema) -> Optional[StructuralError]:
         resources_to_check = []
         if payload.cuerpo_item.recurso_grafico:
             resources_to_check.append((payload.cuerpo_item.recurso_grafico, "cuerpo_item.recurso_grafico"))
@@ -152,9 +230,7 @@ class ValidateHardStage(BaseStage):
         for resource, path in resources_to_check:
             if not isinstance(resource, RecursoGraficoSchema): continue
             if not resource.tipo or not isinstance(resource.tipo, str):
-                self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", path, "Recurso gráfico con campo 'tipo' ausente o inválido.")
-                return False
+                return ("E001_SCHEMA_INVALIDO", path, "Recurso gráfico con campo 'tipo' ausente o inválido.")
             if not resource.contenido or not isinstance(resource.contenido, str):
-                self._add_fatal_finding(item, "E001_SCHEMA_INVALIDO", path, "Recurso gráfico con campo 'contenido' ausente o inválido.")
-                return False
-        return True
+                return ("E001_SCHEMA_INVALIDO", path, "Recurso gráfico con campo 'contenido' ausente o inválido.")
+        return None
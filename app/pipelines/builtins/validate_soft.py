@@ -7,7 +7,7 @@ import time
 
 from ..registry import register
 from app.schemas.models import Item, ItemStatus
-from app.pipelines.abstractions import BaseStage
+from app.pipelines.abstractions import CPUBoundStage
 from app.pipelines.utils.stage_helpers import add_revision_log_entry
 from app.schemas.item_schemas import FindingSchema, ItemPayloadSchema
 
@@ -18,7 +18,7 @@ FORBIDDEN_OPTIONS = {"todas las anteriores", "ninguna de las anteriores", "a y b
 MIN_ACCESSIBILITY_DESC_LENGTH = 15
 
 @register("validate_soft")
-class ValidateSoftStage(BaseStage):
+class ValidateSoftStage(CPUBoundStage):
     """
     Etapa de validación "suave" que revisa la calidad del estilo y la
     presentación del contenido, añadiendo hallazgos no fatales.
@@ -26,6 +26,11 @@ class ValidateSoftStage(BaseStage):
 
     async def execute(self, items: List[Item]) -> List[Item]:
         self.logger.info(f"Iniciando etapa de validación suave para {len(items)} ítems.")
+        await super().execute(items)
+        self.logger.info("Etapa de validación suave completada.")
+        return items
+
+    def _process_items_sync(self, items: List[Item]):
         for item in items:
             if item.status == ItemStatus.FATAL:
                 continue
@@ -40,9 +45,6 @@ class ValidateSoftStage(BaseStage):
             # que ya fue actualizada para ser homogénea. El cálculo de tiempo aquí es
             # una buena práctica para futuras métricas a nivel de etapa.
 
-        self.logger.info("Etapa de validación suave completada.")
-        return items
-
     def _validate_single_item(self, item: Item):
         """Realiza una serie de validaciones suaves en un único ítem."""
         if not item.payload:
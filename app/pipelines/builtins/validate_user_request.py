@@ -1,6 +1,7 @@
 # app/pipelines/stages/validate_user_request.py
 
 from __future__ import annotations
+import asyncio
 import json
 import time
 from typing import List, Dict, Any
@@ -11,7 +12,7 @@ from ..registry import register
 from app.schemas.models import Item, ItemStatus
 from app.schemas.item_schemas import ItemGenerationParams
 from app.pipelines.abstractions import BaseStage
-from app.pipelines.utils.stage_helpers import add_revision_log_entry
+from app.pipelines.utils.stage_helpers import add_revision_log_entry, group_items_by_batch
 from app.pipelines.utils.llm_utils import call_llm_and_parse_json_result
 
 class ValidatorResponse(BaseModel):
@@ -23,8 +24,15 @@ class ValidateRequestStage(BaseStage):
     """
     Etapa inicial que valida la solicitud de generación de un usuario.
     """
+    resource_class = "llm"
 
     async def execute(self, items: List[Item]) -> List[Item]:
+        # Una ventana del runner puede mezclar ítems de varias solicitudes;
+        # cada lote se procesa por separado con sus propios parámetros.
+        await asyncio.gather(*(self._execute_batch(batch) for batch in group_items_by_batch(items)))
+        return items
+
+    async def _execute_batch(self, items: List[Item]) -> List[Item]:
         if not items: return []
 
         self.logger.info(f"Starting user request validation for batch {items[0].batch_id}...")
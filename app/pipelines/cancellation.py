@@ -0,0 +1,121 @@
+# app/pipelines/cancellation.py
+
+"""
+Cancelación cooperativa y plazos (deadlines) por lote.
+
+Cada ejecución del runner registra un CancellationToken para sus batch_id.
+El runner lo consulta entre etapas y, si se cancela durante una etapa,
+cancela las corrutinas en curso (incluidas las llamadas al proveedor LLM).
+"""
+
+from __future__ import annotations
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+from app.core.log import logger
+
+
+class CancellationToken:
+    """Token de cancelación compartido por las etapas de una ejecución."""
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self._event = asyncio.Event()
+        # Event loop de quienes esperan el token (se fija en `wait`).
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reason: Optional[str] = None
+        self.deadline: Optional[float] = time.monotonic() + deadline_seconds if deadline_seconds else None
+
+    def cancel(self, reason: str = "Cancelado por el usuario."):
+        """
+        Cancela el token. Puede llamarse desde otro hilo (p. ej. un endpoint
+        síncrono en el threadpool): asyncio.Event no es thread-safe, así que
+        en ese caso la cancelación se programa en el loop de los que esperan.
+        """
+        loop = self._loop
+        if loop is not None and loop is not _running_loop() and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self.cancel, reason)
+                return
+            except RuntimeError:
+                # El loop se cerró entretanto: ya no hay nadie esperando.
+                pass
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("Se superó el plazo máximo del lote.")
+        return self._event.is_set()
+
+    async def wait(self):
+        """Espera hasta que el token se cancele o venza su plazo."""
+        self._loop = asyncio.get_running_loop()
+        if self.deadline is None:
+            await self._event.wait()
+            return
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=max(0.0, self.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.cancel("Se superó el plazo máximo del lote.")
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+_ACTIVE_TOKENS: Dict[str, CancellationToken] = {}
+
+
+def register_batches(batch_ids: Iterable[str], token: CancellationToken):
+    for batch_id in batch_ids:
+        _ACTIVE_TOKENS[batch_id] = token
+
+
+def unregister_batches(batch_ids: Iterable[str]):
+    for batch_id in batch_ids:
+        _ACTIVE_TOKENS.pop(batch_id, None)
+
+
+def is_batch_active(batch_id: str) -> bool:
+    return batch_id in _ACTIVE_TOKENS
+
+
+def active_batch_count() -> int:
+    """Número de lotes en ejecución en este proceso."""
+    return len(_ACTIVE_TOKENS)
+
+
+def cancel_batch(batch_id: str, reason: str = "Cancelado por el usuario.") -> bool:
+    """Solicita la cancelación de un lote en ejecución. Devuelve False si no está activo."""
+    token = _ACTIVE_TOKENS.get(batch_id)
+    if token is None:
+        return False
+    logger.info(f"Cancelación solicitada para el lote {batch_id}: {reason}")
+    token.cancel(reason)
+    return True
+
+
+async def run_until_cancelled(coro, token: CancellationToken) -> bool:
+    """
+    Ejecuta la corrutina de una etapa compitiendo contra el token.
+    Devuelve True si terminó, o False si se canceló (la corrutina se cancela
+    y se espera su limpieza). Las excepciones de la etapa se propagan.
+    """
+    stage_task = asyncio.ensure_future(coro)
+    waiter = asyncio.ensure_future(token.wait())
+    done, _ = await asyncio.wait({stage_task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+
+    if stage_task in done:
+        waiter.cancel()
+        stage_task.result()
+        return True
+
+    stage_task.cancel()
+    await asyncio.gather(stage_task, return_exceptions=True)
+    return False
@@ -0,0 +1,152 @@
+# app/pipelines/executors.py
+
+"""
+Ejecutores para las etapas CPU-bound del pipeline.
+
+Las validaciones (comparaciones con SequenceMatcher, expresiones regulares)
+son síncronas; ejecutadas dentro de `async def execute` bloquean el event loop
+que atiende la API y las demás corrutinas LLM en curso. Con la opción
+`executor` de la etapa en pipeline.yml se elige dónde se ejecutan:
+
+- 'process': pool de procesos compartido. Los ítems viajan en trozos como JSON
+  compacto y los resultados se copian de vuelta sobre los objetos originales.
+  En builds free-threaded (sin GIL) se usa un pool de hilos en su lugar.
+- 'thread': pool de hilos compartido, sin serialización.
+- 'inline': en el propio event loop (comportamiento anterior).
+"""
+
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional
+
+from app.core.config import settings
+from app.core.log import logger
+from app.schemas.models import Item
+
+if TYPE_CHECKING:
+    from app.pipelines.abstractions import CPUBoundStage
+
+EXECUTOR_KINDS = {"process", "thread", "inline"}
+DEFAULT_CHUNK_SIZE = 64
+
+# 'spawn' evita heredar hilos, conexiones y el event loop del proceso padre.
+_MP_START_METHOD = "spawn"
+
+_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+_THREAD_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def is_free_threaded() -> bool:
+    """True si el intérprete se ejecuta sin GIL (PEP 703)."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _max_workers() -> int:
+    return settings.cpu_executor_max_workers or os.cpu_count() or 1
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _PROCESS_POOL
+    if _PROCESS_POOL is None:
+        _PROCESS_POOL = ProcessPoolExecutor(
+            max_workers=_max_workers(),
+            mp_context=multiprocessing.get_context(_MP_START_METHOD),
+        )
+        logger.info(f"Pool de procesos para etapas CPU-bound iniciado con {_max_workers()} workers.")
+    return _PROCESS_POOL
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _THREAD_POOL
+    if _THREAD_POOL is None:
+        _THREAD_POOL = ThreadPoolExecutor(max_workers=_max_workers(), thread_name_prefix="sigie-cpu")
+    return _THREAD_POOL
+
+
+def shutdown_executors():
+    """Cierra los pools compartidos (p. ej. al apagar la aplicación)."""
+    global _PROCESS_POOL, _THREAD_POOL
+    if _PROCESS_POOL is not None:
+        _PROCESS_POOL.shutdown(cancel_futures=True)
+        _PROCESS_POOL = None
+    if _THREAD_POOL is not None:
+        _THREAD_POOL.shutdown(cancel_futures=True)
+        _THREAD_POOL = None
+
+
+def resolve_executor_kind(kind: Optional[str]) -> str:
+    """Normaliza la opción `executor`; 'process' pasa a 'thread' en builds sin GIL."""
+    kind = (kind or "inline").lower()
+    if kind not in EXECUTOR_KINDS:
+        logger.warning(f"Executor desconocido '{kind}', se usa 'inline'. Opciones: {sorted(EXECUTOR_KINDS)}")
+        return "inline"
+    if kind == "process" and is_free_threaded():
+        return "thread"
+    return kind
+
+
+def _process_chunk(stage_cls, stage_name: str, params: dict, serialized_items: List[str]) -> List[str]:
+    """Punto de entrada en el proceso hijo: reconstruye la etapa y procesa un trozo."""
+    items = _deserialize(serialized_items)
+    stage = stage_cls(stage_name, params, {})
+    stage._process_items_sync(items)
+    return _serialize(items)
+
+
+def _copy_back(target: Item, source: Item):
+    """Copia el resultado sobre el objeto original (el runner conserva esa referencia)."""
+    for field_name in Item.model_fields:
+        setattr(target, field_name, getattr(source, field_name))
+
+
+def _chunks(items: List[Item], size: int) -> List[List[Item]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def run_cpu_bound(stage: "CPUBoundStage", items: List[Item]):
+    """Ejecuta `stage._process_items_sync` sobre los ítems con el executor configurado."""
+    if not items:
+        return
+    kind = resolve_executor_kind(stage.params.get("executor"))
+    if kind == "inline":
+        stage._process_items_sync(items)
+        return
+
+    loop = asyncio.get_running_loop()
+    chunk_size = max(1, int(stage.params.get("chunk_size", DEFAULT_CHUNK_SIZE)))
+    chunks = _chunks(items, chunk_size)
+
+    if kind == "thread":
+        pool: Executor = get_thread_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, stage._process_items_sync, chunk) for chunk in chunks))
+        return
+
+    await asyncio.gather(*(_run_chunk_in_process(stage, chunk) for chunk in chunks))
+
+
+def _serialize(items: List[Item]) -> List[str]:
+    return [item.model_dump_json() for item in items]
+
+
+def _deserialize(serialized_items: List[str]) -> List[Item]:
+    return [Item.model_validate_json(data) for data in serialized_items]
+
+
+async def _run_chunk_in_process(stage: "CPUBoundStage", chunk: List[Item]):
+    """
+    Envía un trozo al pool de procesos. La (de)serialización se hace en el
+    pool de hilos para que tampoco ocupe el event loop con lotes grandes.
+    """
+    loop = asyncio.get_running_loop()
+    threads = get_thread_pool()
+    serialized = await loop.run_in_executor(threads, _serialize, chunk)
+    results = await loop.run_in_executor(
+        get_process_pool(), _process_chunk, type(stage), stage.stage_name, stage.params, serialized
+    )
+    for original, processed in zip(chunk, await loop.run_in_executor(threads, _deserialize, results)):
+        _copy_back(original, processed)
@@ -0,0 +1,221 @@
+# app/pipelines/live_status.py
+
+"""
+Estado en vivo de los lotes que se ejecutan en este proceso.
+
+El runner registra los ítems de cada lote al empezar y `add_revision_log_entry`
+anota cada transición, de modo que `GET /items/batch/{batch_id}` responde sin
+consultar la base de datos mientras el lote está en curso (antes de 'persist'
+sus ítems aún no tienen fila). Al terminar la ejecución el lote se retira y el
+endpoint vuelve a SQL.
+
+La memoria está acotada: como mucho LIVE_STATUS_MAX_BATCHES lotes, y un lote
+sin transiciones durante LIVE_STATUS_TTL_SECONDS (p. ej. porque su ejecución
+murió sin terminar) se descarta. El almacén es local al proceso: en los modos
+'queue' y 'distributed' el pipeline corre en los workers y el endpoint sigue
+leyendo de la base de datos.
+
+Los suscriptores de un lote (SSE y WebSocket de `app.api.batch_events`)
+reciben cada transición como evento y, al persistirse un ítem, su payload.
+Las transiciones pueden llegar desde hilos del pool de CPU: los eventos se
+entregan en el event loop de cada suscriptor.
+"""
+
+from __future__ import annotations
+import asyncio
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+from app.core.config import settings
+from app.schemas.enums import ItemStatus
+from app.schemas.models import Item
+from app.pipelines.utils.overprovision import is_surplus_candidate
+
+# Estados con los que un ítem ya no avanza en el pipeline.
+DONE_STATUSES = {ItemStatus.PERSISTENCE_SUCCESS, ItemStatus.FATAL, ItemStatus.SKIPPED}
+
+
+@dataclass
+class ItemLiveStatus:
+    temp_id: uuid.UUID
+    item_id: Optional[uuid.UUID]
+    status: ItemStatus
+    token_usage: int = 0
+    cost_usd: float = 0.0
+    # Candidato sobre-generado que la etapa de cuota descartó.
+    surplus: bool = False
+
+
+@dataclass
+class BatchLiveStatus:
+    """Último estado conocido de cada ítem del lote y progreso por etapa."""
+    batch_id: str
+    items: Dict[uuid.UUID, ItemLiveStatus] = field(default_factory=dict)
+    # Etapa -> {temp_id: último estado del ítem en esa etapa}, en orden de ejecución.
+    stages: Dict[str, Dict[uuid.UUID, ItemStatus]] = field(default_factory=dict)
+    current_stage: Optional[str] = None
+    max_tokens: Optional[int] = None
+    max_cost_usd: Optional[float] = None
+
+    def record(self, item: Item, stage_name: Optional[str] = None) -> bool:
+        """Anota el estado del ítem; devuelve True si cambió respecto a lo anotado."""
+        previous = self.items.get(item.temp_id)
+        changed = previous is None or previous.status != item.status or previous.item_id != item.item_id
+        self.items[item.temp_id] = ItemLiveStatus(
+            temp_id=item.temp_id,
+            item_id=item.item_id,
+            status=item.status,
+            token_usage=item.token_usage,
+            cost_usd=item.cost_usd,
+            surplus=is_surplus_candidate(item),
+        )
+        if stage_name:
+            stage = self.stages.setdefault(stage_name, {})
+            changed = changed or stage.get(item.temp_id) != item.status
+            stage[item.temp_id] = item.status
+            self.current_stage = stage_name
+        return changed
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Recuentos y resultados del lote; un ítem cuenta como procesado al llegar
+        a un estado final. Los candidatos excedentes descartados no cuentan como
+        ítems del lote, pero su gasto sí.
+        """
+        items = list(self.items.values())
+        kept = [item for item in items if not item.surplus]
+        return {
+            "total_items": len(kept),
+            "processed_items": sum(1 for item in kept if item.status in DONE_STATUSES),
+            "successful_items": sum(1 for item in kept if item.status == ItemStatus.PERSISTENCE_SUCCESS),
+            "failed_items": sum(1 for item in kept if item.status == ItemStatus.FATAL),
+            "results": [
+                {"item_id": item.item_id, "temp_id": item.temp_id, "status": item.status.value}
+                for item in kept
+            ],
+            "current_stage": self.current_stage,
+            "stages": [
+                {
+                    "stage_name": stage_name,
+                    "processed_items": len(statuses),
+                    "failed_items": sum(1 for status in statuses.values() if status == ItemStatus.FATAL),
+                }
+                for stage_name, statuses in self.stages.items()
+            ],
+            "tokens_used": sum(item.token_usage for item in items),
+            "cost_usd": sum(item.cost_usd for item in items),
+            "max_tokens": self.max_tokens,
+            "max_cost_usd": self.max_cost_usd,
+        }
+
+
+_LOCK = threading.Lock()
+_BATCHES: TTLCache = TTLCache(maxsize=settings.live_status_max_batches, ttl=settings.live_status_ttl_seconds)
+# batch_id -> colas de los suscriptores, con el event loop de cada una.
+_SUBSCRIBERS: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+
+def track_items(items: Iterable[Item], budgets: Optional[Dict[str, Any]] = None):
+    """Registra (o amplía) los lotes de `items`; `budgets` es `ctx["budgets"]` si ya existe."""
+    with _LOCK:
+        for item in items:
+            batch = _BATCHES.get(item.batch_id)
+            if batch is None:
+                batch = BatchLiveStatus(item.batch_id)
+            batch.record(item)
+            budget = (budgets or {}).get(item.batch_id)
+            if budget is not None:
+                batch.max_tokens, batch.max_cost_usd = budget.max_tokens, budget.max_cost_usd
+            # Reasignar renueva el TTL del lote.
+            _BATCHES[item.batch_id] = batch
+
+
+def record_transition(item: Item, stage_name: str):
+    """Anota el nuevo estado del ítem si su lote se sigue en este proceso y lo notifica."""
+    with _LOCK:
+        batch = _BATCHES.get(item.batch_id)
+        if batch is None:
+            return
+        changed = batch.record(item, stage_name)
+        _BATCHES[item.batch_id] = batch
+        if not changed or item.batch_id not in _SUBSCRIBERS:
+            return
+        _publish(item.batch_id, item_event("transition", item, stage_name))
+        if item.status == ItemStatus.PERSISTENCE_SUCCESS and item.payload:
+            _publish(item.batch_id, item_event("item", item, stage_name))
+
+
+def item_event(event: str, item: Item, stage_name: Optional[str] = None) -> Dict[str, Any]:
+    """Evento de un ítem: 'transition' (cambio de estado) o 'item' (con su payload)."""
+    data = {
+        "temp_id": str(item.temp_id),
+        "item_id": str(item.item_id) if item.item_id else None,
+        "stage_name": stage_name,
+        "status": item.status.value,
+    }
+    if event == "item":
+        data["payload"] = item.payload.model_dump(mode="json")
+    return {"event": event, "data": data}
+
+
+def status_event(summary: Dict[str, Any], is_complete: bool = False) -> Dict[str, Any]:
+    """Evento 'status' a partir de BatchLiveStatus.summary (sin los resultados por ítem)."""
+    data = {key: value for key, value in summary.items() if key != "results"}
+    data["is_complete"] = is_complete
+    return {"event": "status", "data": data}
+
+
+def _publish(batch_id: str, event: Optional[Dict[str, Any]]):
+    """Entrega el evento (None = fin del lote) a los suscriptores; requiere _LOCK."""
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    for loop, queue in _SUBSCRIBERS.get(batch_id, []):
+        if loop is running_loop:
+            queue.put_nowait(event)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+def subscribe(batch_id: str) -> asyncio.Queue:
+    """Cola con los eventos del lote a partir de ahora; None marca el fin de su ejecución."""
+    queue: asyncio.Queue = asyncio.Queue()
+    with _LOCK:
+        _SUBSCRIBERS.setdefault(batch_id, []).append((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(batch_id: str, queue: asyncio.Queue):
+    with _LOCK:
+        subscribers = [entry for entry in _SUBSCRIBERS.get(batch_id, []) if entry[1] is not queue]
+        if subscribers:
+            _SUBSCRIBERS[batch_id] = subscribers
+        else:
+            _SUBSCRIBERS.pop(batch_id, None)
+
+
+def record_stage_items(items: Iterable[Item], stage_name: str):
+    """Anota el estado de los ítems al terminar una etapa (p. ej. si se procesaron en otro proceso)."""
+    for item in items:
+        record_transition(item, stage_name)
+
+
+def finish_batches(batch_ids: Iterable[str]):
+    with _LOCK:
+        for batch_id in batch_ids:
+            batch = _BATCHES.pop(batch_id, None)
+            if batch is not None and batch_id in _SUBSCRIBERS:
+                _publish(batch_id, status_event(batch.summary(), is_complete=True))
+                _publish(batch_id, None)
+
+
+def get_batch_summary(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Resumen del lote si está en curso en este proceso (ver BatchLiveStatus.summary)."""
+    with _LOCK:
+        batch = _BATCHES.get(batch_id)
+        return batch.summary() if batch is not None else None
@@ -0,0 +1,93 @@
+# app/pipelines/metrics.py
+
+"""
+Métricas de rendimiento por etapa (proceso local): ítems procesados, tiempo
+acumulado y throughput. El runner las registra al terminar cada etapa.
+
+Además de los acumulados se mantiene una media móvil exponencial (EWMA) de la
+duración de cada etapa y de las llamadas LLM, que refleja el rendimiento
+reciente y alimenta el control de admisión, y de los tokens por ítem de cada
+etapa, que usa el presupuesto para estimar las etapas opcionales.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Peso de la observación más reciente en las medias móviles.
+EWMA_ALPHA = 0.2
+
+
+def _ewma(previous: Optional[float], value: float) -> float:
+    return value if previous is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * previous
+
+
+@dataclass
+class StageMetrics:
+    runs: int = 0
+    items: int = 0
+    seconds: float = 0.0
+    ewma_run_seconds: Optional[float] = None
+    ewma_tokens_per_item: Optional[float] = None
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+
+_STAGE_METRICS: Dict[str, StageMetrics] = {}
+_LLM_CALL_SECONDS: Optional[float] = None
+
+
+def record_stage_run(stage_name: str, n_items: int, seconds: float, tokens: int = 0):
+    metrics = _STAGE_METRICS.setdefault(stage_name, StageMetrics())
+    metrics.runs += 1
+    metrics.items += n_items
+    metrics.seconds += seconds
+    metrics.ewma_run_seconds = _ewma(metrics.ewma_run_seconds, seconds)
+    if tokens and n_items:
+        metrics.ewma_tokens_per_item = _ewma(metrics.ewma_tokens_per_item, tokens / n_items)
+
+
+def get_stage_tokens_per_item(stage_name: str) -> Optional[float]:
+    """Tokens recientes (EWMA) por ítem de la etapa, o None si no consumió tokens aún."""
+    metrics = _STAGE_METRICS.get(stage_name)
+    return metrics.ewma_tokens_per_item if metrics else None
+
+
+def record_llm_call(seconds: float):
+    global _LLM_CALL_SECONDS
+    _LLM_CALL_SECONDS = _ewma(_LLM_CALL_SECONDS, seconds)
+
+
+def get_llm_call_seconds() -> Optional[float]:
+    """Duración reciente (EWMA) de una llamada LLM, o None sin mediciones."""
+    return _LLM_CALL_SECONDS
+
+
+def get_recent_batch_seconds() -> Optional[float]:
+    """
+    Duración reciente de un lote de principio a fin: suma de la EWMA de cada
+    etapa. None si este proceso aún no ha ejecutado etapas.
+    """
+    durations = [m.ewma_run_seconds for m in _STAGE_METRICS.values() if m.ewma_run_seconds is not None]
+    return sum(durations) if durations else None
+
+
+def get_stage_throughput() -> Dict[str, Dict[str, float]]:
+    """Resumen por etapa: ejecuciones, ítems, segundos e ítems por segundo."""
+    return {
+        name: {
+            "runs": m.runs,
+            "items": m.items,
+            "seconds": round(m.seconds, 3),
+            "items_per_second": round(m.items_per_second, 2),
+        }
+        for name, m in _STAGE_METRICS.items()
+    }
+
+
+def reset_stage_metrics():
+    global _LLM_CALL_SECONDS
+    _STAGE_METRICS.clear()
+    _LLM_CALL_SECONDS = None
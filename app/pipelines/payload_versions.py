@@ -0,0 +1,69 @@
+# app/pipelines/payload_versions.py
+
+"""
+Historial de versiones del payload de cada ítem.
+
+El runner toma el payload de los ítems antes de cada etapa y, al terminar,
+anota en `item.payload_revisions` el parche JSON de lo que la etapa cambió
+(generación, reparación, refinadores...). La primera revisión (0) es el
+payload generado, con parche vacío: no hace falta guardarlo aparte, porque
+los parches son reversibles y se reconstruye desde el payload final.
+
+Al persistir, cada revisión se guarda en `item_revisions` y cada
+PAYLOAD_SNAPSHOT_INTERVAL revisiones (y en la 0) se guarda además el payload
+completo, de modo que reconstruir cualquier revisión aplica como mucho
+PAYLOAD_SNAPSHOT_INTERVAL - 1 parches.
+"""
+
+import copy
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core import json_patch
+from app.schemas.item_schemas import PayloadRevisionSchema
+from app.schemas.models import Item
+
+
+def payload_document(item: Item) -> Optional[Dict[str, Any]]:
+    """Payload tal como se persiste (sin `revision_log`), o None si aún no hay."""
+    return item.payload.model_dump(mode="json", exclude={"revision_log"}) if item.payload else None
+
+
+def capture(items: Iterable[Item]) -> Dict[Any, Optional[Dict[str, Any]]]:
+    """Payload de cada ítem (por temp_id) antes de ejecutar una etapa."""
+    return {item.temp_id: payload_document(item) for item in items}
+
+
+def record_stage_changes(items: Iterable[Item], before: Dict[Any, Optional[Dict[str, Any]]], stage_name: str):
+    """Anota una revisión en los ítems cuyo payload cambió en la etapa."""
+    now = datetime.utcnow()
+    for item in items:
+        after = payload_document(item)
+        if after is None:
+            continue
+        previous = before.get(item.temp_id)
+        if previous is None:
+            # La etapa generó el payload: revisión inicial.
+            item.payload_revisions = [PayloadRevisionSchema(revision=0, stage_name=stage_name, timestamp=now)]
+            continue
+        if not item.payload_revisions:
+            # Payload anterior al historial (p. ej. un ítem reprocesado): pasa a ser la revisión 0.
+            item.payload_revisions.append(PayloadRevisionSchema(revision=0, stage_name=stage_name, timestamp=now))
+        patch = json_patch.diff(previous, after)
+        if patch:
+            item.payload_revisions.append(
+                PayloadRevisionSchema(
+                    revision=item.payload_revisions[-1].revision + 1,
+                    stage_name=stage_name,
+                    timestamp=now,
+                    patch=patch,
+                )
+            )
+
+
+def reconstruct(snapshot: Dict[str, Any], patches: List[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Payload de una revisión a partir del snapshot anterior y los parches posteriores a él."""
+    document = copy.deepcopy(snapshot)
+    for patch in patches:
+        document = json_patch.apply(document, patch, in_place=True)
+    return document
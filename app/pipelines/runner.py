@@ -1,39 +1,123 @@
 # app/pipelines/runner.py
 
+import asyncio
+import time
 import yaml
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional
 
 from app.schemas.models import Item, ItemStatus
 from app.core.log import logger
+from app.pipelines import live_status, payload_versions
 from app.pipelines.abstractions import BaseStage
-from app.pipelines.utils.stage_helpers import initialize_items_for_pipeline
+from app.pipelines.utils.stage_helpers import (
+    add_revision_log_entry,
+    initialize_items_for_pipeline,
+    record_stage_skip,
+)
+from app.pipelines.utils.conditions import compile_condition
+from app.pipelines.utils.repair import get_repair_stats
+from app.pipelines.utils.overprovision import (
+    DEFAULT_QUOTA_STAGE,
+    add_overprovisioned_candidates,
+    record_outcomes,
+)
 from app.pipelines.registry import get_full_registry
+from app.pipelines.metrics import record_stage_run
+from app.pipelines.budget import BatchSpend, attach_budgets, batch_spend, flush_budget_spend, record_spend, stage_fits_budget
+from app.core.config import settings
+from app.pipelines.cancellation import (
+    CancellationToken,
+    register_batches,
+    run_until_cancelled,
+    unregister_batches,
+)
+
+_TERMINAL_STATUSES = {ItemStatus.FATAL, ItemStatus.SKIPPED}
+DEFAULT_WINDOW_SIZE = 100
+
+def load_pipeline_config(pipeline_config_path: str) -> Optional[Dict[str, Any]]:
+    """Carga el archivo YAML del pipeline. Devuelve None si no existe o es inválido."""
+    try:
+        with open(pipeline_config_path, "r") as f:
+            config = yaml.safe_load(f)
+        logger.info(f"Pipeline config loaded from '{pipeline_config_path}'. Found {len(config.get('stages', []))} stages.")
+        return config
+    except FileNotFoundError:
+        logger.error(f"Archivo de configuración del pipeline no encontrado en: {pipeline_config_path}")
+    except yaml.YAMLError as e:
+        logger.error(f"Error al parsear el archivo de configuración del pipeline: {e}")
+    return None
+
+
+def prepare_run(config: Dict[str, Any], items: List[Item], ctx: Dict[str, Any]):
+    """Aplica la sobre-generación de candidatos configurada antes de la primera etapa."""
+    overprovisioning = config.get("overprovisioning") or {}
+    if overprovisioning.get("enabled"):
+        ctx["item_quotas"] = add_overprovisioned_candidates(items, overprovisioning)
+        ctx["quota_stage"] = overprovisioning.get("quota_stage", DEFAULT_QUOTA_STAGE)
+
+
+def log_repair_stats(ctx: Dict[str, Any]):
+    """Registra las tasas de reparación por código de error de la ejecución."""
+    repair_stats = get_repair_stats(ctx)
+    if repair_stats:
+        logger.info(f"Tasas de reparación por código de error: {repair_stats}")
+
+
+def finish_run(config: Dict[str, Any], items: List[Item], token: CancellationToken, ctx: Dict[str, Any]):
+    """Actualiza el historial de aprobación y registra el resultado de la ejecución."""
+    if (config.get("overprovisioning") or {}).get("enabled"):
+        record_outcomes(items)
+
+    log_repair_stats(ctx)
+
+    if token.cancelled:
+        logger.warning(f"--- Pipeline cancelled: {token.reason} ---")
+    else:
+        logger.info("--- Pipeline finished successfully ---")
+
 
 async def run(
     pipeline_config_path: str,
     user_params: Optional[Dict[str, Any]] = None,
     items_to_process: Optional[List[Item]] = None,
     ctx: Optional[Dict[str, Any]] = None,
+    item_source: Optional[Iterable[Item]] = None,
+    window_size: Optional[int] = None,
+    config: Optional[Dict[str, Any]] = None,
 ):
     """
     Orquesta la ejecución de un pipeline definido en un archivo YAML.
     Recibe el registro de etapas como una dependencia inyectada.
+
+    Con `item_source` (p. ej. `iter_items_for_pipeline`) el pipeline se
+    ejecuta por ventanas de `window_size` ítems (o `window_size` de
+    pipeline.yml): cada ventana recorre todas las etapas, incluida la
+    persistencia, y se libera antes de materializar la siguiente, de modo que
+    la memoria no depende del tamaño del trabajo.
+
+    Si se pasa `config` (ya cargada y, p. ej., con etapas filtradas) no se lee
+    `pipeline_config_path`.
+
+    Con `ctx["keep_live_status"]` el lote sigue en el estado en vivo al
+    terminar: el llamador lo retira con `live_status.finish_batches` después
+    de sincronizar en SQL el estado de los ítems.
     """
     stage_registry = get_full_registry()
 
     if ctx is None:
         ctx = {}
 
-    try:
-        with open(pipeline_config_path, "r") as f:
-            config = yaml.safe_load(f)
-        pipeline_stages_config = config.get("stages", [])
-        logger.info(f"Pipeline config loaded from '{pipeline_config_path}'. Found {len(pipeline_stages_config)} stages.")
-    except FileNotFoundError:
-        logger.error(f"Archivo de configuración del pipeline no encontrado en: {pipeline_config_path}")
+    if config is None:
+        config = load_pipeline_config(pipeline_config_path)
+    if config is None:
         return
-    except yaml.YAMLError as e:
-        logger.error(f"Error al parsear el archivo de configuración del pipeline: {e}")
+    pipeline_stages_config = config.get("stages", [])
+
+    if item_source is not None:
+        size = window_size or config.get("window_size") or DEFAULT_WINDOW_SIZE
+        await _run_windowed(config, item_source, ctx, stage_registry, int(size))
         return
 
     if not items_to_process:
@@ -48,47 +132,300 @@ async def run(
         logger.warning("No hay ítems para procesar en el pipeline.")
         return
 
+    prepare_run(config, items, ctx)
+    await attach_budgets(items, ctx)
+    # El estado en vivo del lote se sirve desde memoria hasta que termine la ejecución.
+    live_status.track_items(items, ctx.get("budgets"))
+
+    # Token de cancelación cooperativa, con plazo opcional por lote.
+    token: CancellationToken = ctx.get("cancel_token") or CancellationToken(config.get("deadline_seconds"))
+    ctx["cancel_token"] = token
+    batch_ids = {item.batch_id for item in items}
+    register_batches(batch_ids, token)
+
+    try:
+        await _run_stages(pipeline_stages_config, items, ctx, stage_registry, token)
+    finally:
+        unregister_batches(batch_ids)
+        if not ctx.get("keep_live_status"):
+            live_status.finish_batches(batch_ids)
+        await flush_budget_spend(ctx, completed=True)
+
+    finish_run(config, items, token, ctx)
+
+
+async def _run_windowed(
+    config: Dict[str, Any],
+    item_source: Iterable[Item],
+    ctx: Dict[str, Any],
+    stage_registry: Dict[str, Any],
+    window_size: int,
+):
+    """
+    Ejecuta el pipeline por ventanas de tamaño fijo. El plazo del lote
+    (`deadline_seconds`) se aplica a cada ventana; una cancelación externa
+    (`ctx["cancel_token"]`) detiene la ventana en curso y las siguientes.
+    Si `ctx["on_window_complete"]` está definido, recibe cada ventana terminada.
+    El gasto de cada lote se acumula entre ventanas y se registra al terminar
+    cada una; al final los lotes se marcan como terminados.
+    """
+    outer_token: Optional[CancellationToken] = ctx.get("cancel_token")
+    on_window_complete = ctx.get("on_window_complete")
+    source = iter(item_source)
+    windows = total_items = 0
+    token = CancellationToken()
+    spend: BatchSpend = {}
+
+    try:
+        while not (outer_token and outer_token.cancelled):
+            window = list(islice(source, window_size))
+            if not window:
+                break
+            windows += 1
+            total_items += len(window)
+            logger.info(f"--- Window {windows}: {len(window)} items ({total_items} so far) ---")
+
+            token = CancellationToken(config.get("deadline_seconds"))
+            ctx["cancel_token"] = token
+            propagate = asyncio.create_task(_propagate_cancel(outer_token, token)) if outer_token else None
+
+            prepare_run(config, window, ctx)
+            await attach_budgets(window, ctx)
+            batch_ids = {item.batch_id for item in window}
+            live_status.track_items(window, ctx.get("budgets"))
+            register_batches(batch_ids, token)
+            try:
+                await _run_stages(config.get("stages", []), window, ctx, stage_registry, token)
+            finally:
+                unregister_batches(batch_ids)
+                live_status.finish_batches(batch_ids)
+                if propagate:
+                    propagate.cancel()
+                await flush_budget_spend(ctx, spent_before=spend)
+                spend = batch_spend(ctx, spend)
+
+            if (config.get("overprovisioning") or {}).get("enabled"):
+                record_outcomes(window)
+            if on_window_complete:
+                on_window_complete(window)
+            # La ventana ya está persistida: se libera antes de leer la siguiente.
+            del window
+    finally:
+        await record_spend(ctx, spend, completed=True)
+
+    if outer_token is not None:
+        ctx["cancel_token"] = outer_token
+    logger.info(f"Windowed run processed {total_items} items in {windows} window(s).")
+    finish_run(config, [], outer_token if outer_token and outer_token.cancelled else token, ctx)
+
+
+async def _propagate_cancel(source: CancellationToken, target: CancellationToken):
+    await source.wait()
+    target.cancel(source.reason)
+
+
+async def run_stage(
+    config: Dict[str, Any],
+    stage_index: int,
+    items: List[Item],
+    ctx: Dict[str, Any],
+    cancelled_items: Optional[List[Item]] = None,
+) -> Optional[List[Item]]:
+    """
+    Ejecuta una única etapa del pipeline (modo distribuido: cada etapa la
+    atiende su propio pool de workers). Si el lote ya estaba cancelado se
+    pasan sus ítems cancelados en `cancelled_items`. Devuelve los ítems
+    cancelados (o None si el lote sigue activo).
+    """
+    token: CancellationToken = ctx["cancel_token"]
+    if token.cancelled and cancelled_items is None:
+        cancelled_items = _skip_remaining_items(items, token.reason)
+
+    # El gasto viaja con los ítems: el presupuesto se reconstruye en cada etapa.
+    await attach_budgets(items, ctx)
+    batch_ids = {item.batch_id for item in items}
+    register_batches(batch_ids, token)
+    try:
+        stage_config = config.get("stages", [])[stage_index]
+        await _execute_stage(stage_config, items, ctx, get_full_registry(), token, cancelled_items)
+    finally:
+        unregister_batches(batch_ids)
+        await flush_budget_spend(ctx)
+
+    if token.cancelled and cancelled_items is None:
+        cancelled_items = _skip_remaining_items(items, token.reason)
+    return cancelled_items
+
+
+def next_stage_index(config: Dict[str, Any], stage_index: int, cancelled: bool = False) -> Optional[int]:
+    """
+    Índice de la siguiente etapa a encolar, o None si el pipeline terminó.
+    En un lote cancelado solo quedan las etapas con `runs_after_cancel`.
+    """
+    stage_registry = get_full_registry()
+    stages = config.get("stages", [])
+    for index in range(stage_index + 1, len(stages)):
+        stage_class = stage_registry.get(stages[index].get("name"))
+        if stage_class is None:
+            continue
+        if not cancelled or stage_class.runs_after_cancel:
+            return index
+    return None
+
+
+def get_stage_resource_class(stage_name: str) -> str:
+    """Clase de recursos ('llm', 'cpu', 'db') de una etapa registrada."""
+    stage_class = get_full_registry().get(stage_name)
+    return stage_class.resource_class if stage_class else "cpu"
+
+
+def _skip_remaining_items(items: List[Item], reason: str) -> List[Item]:
+    """Marca como SKIPPED los ítems que aún no han terminado y los devuelve."""
+    remaining = [item for item in items if item.status not in _TERMINAL_STATUSES]
+    for item in remaining:
+        add_revision_log_entry(item, "pipeline", ItemStatus.SKIPPED, f"Lote cancelado: {reason}")
+    return remaining
+
+
+async def _run_stages(
+    pipeline_stages_config: List[Dict[str, Any]],
+    items: List[Item],
+    ctx: Dict[str, Any],
+    stage_registry: Dict[str, Any],
+    token: CancellationToken,
+):
+    """Ejecuta las etapas en orden, comprobando la cancelación entre etapas."""
+    cancelled_items: Optional[List[Item]] = None
+
     logger.info(f"--- Starting Pipeline Run for {len(items)} items ---")
 
     for stage_config in pipeline_stages_config:
-        stage_name = stage_config.get("name")
-        stage_params = stage_config.get("params", {})
-        listen_to_status = stage_config.get("listen_to_status_pattern")
+        if token.cancelled and cancelled_items is None:
+            cancelled_items = _skip_remaining_items(items, token.reason)
 
-        if not stage_name:
-            logger.warning("Configuración de etapa sin nombre, omitiendo.")
-            continue
+        await _execute_stage(stage_config, items, ctx, stage_registry, token, cancelled_items)
 
-        try:
-            stage_class = stage_registry.get(stage_name)
-            if not stage_class:
-                raise KeyError(f"Stage '{stage_name}' not found in the provided registry.")
+    if token.cancelled and cancelled_items is None:
+        _skip_remaining_items(items, token.reason)
 
-            stage_instance: BaseStage = stage_class(stage_name, stage_params, ctx)
-        except KeyError as e:
-            logger.error(f"Error: {e}")
-            continue
 
-        # Filtra los ítems según el patrón de estado.
-        items_for_stage = [item for item in items if item.status != ItemStatus.FATAL]
-        if listen_to_status:
-            items_for_stage = [
-                item for item in items_for_stage if item.status.value.startswith(listen_to_status)
-            ]
+async def _execute_stage(
+    stage_config: Dict[str, Any],
+    items: List[Item],
+    ctx: Dict[str, Any],
+    stage_registry: Dict[str, Any],
+    token: CancellationToken,
+    cancelled_items: Optional[List[Item]],
+):
+    """Ejecuta una etapa sobre los ítems que le corresponden según su configuración."""
+    stage_name = stage_config.get("name")
+    stage_params = stage_config.get("params", {})
+    listen_to_status = stage_config.get("listen_to_status_pattern")
+    when_spec = stage_config.get("when")
+    optional = bool(stage_config.get("optional"))
+
+    if not stage_name:
+        logger.warning("Configuración de etapa sin nombre, omitiendo.")
+        return
 
-        if not items_for_stage:
-            logger.info(f"Omitiendo etapa '{stage_name}': no hay ítems que procesar con el patrón '{listen_to_status}'.")
-            continue
+    try:
+        stage_class = stage_registry.get(stage_name)
+        if not stage_class:
+            raise KeyError(f"Stage '{stage_name}' not found in the provided registry.")
 
-        logger.info(f"Executing stage: '{stage_name}'. Items to process: {len(items_for_stage)}.")
+        stage_instance: BaseStage = stage_class(stage_name, stage_params, ctx)
+    except KeyError as e:
+        logger.error(f"Error: {e}")
+        return
 
+    condition = None
+    if when_spec is not None:
         try:
-            # Las etapas modifican los objetos Item en su lugar.
+            condition, condition_desc = compile_condition(when_spec)
+        except ValueError as e:
+            logger.error(f"Condición 'when' inválida en la etapa '{stage_name}', omitiendo etapa: {e}")
+            return
+
+    if token.cancelled:
+        # Tras una cancelación solo se ejecutan las etapas que registran el
+        # estado final (p. ej. 'persist'), sobre los ítems cancelados.
+        if not stage_class.runs_after_cancel:
+            return
+        items_for_stage = [item for item in cancelled_items if item.payload]
+        if items_for_stage:
             await stage_instance.execute(items_for_stage)
-        except Exception as e:
-            logger.error(f"Error inesperado durante la ejecución de la etapa '{stage_name}': {e}", exc_info=True)
-            for item in items_for_stage:
-                item.status = ItemStatus.FATAL
-                item.status_comment = f"Error no manejado en la etapa {stage_name}: {e}"
+        return
 
-    logger.info("--- Pipeline finished successfully ---")
+    # Filtra los ítems según el patrón de estado. Los candidatos excedentes
+    # cancelados (SKIPPED) tampoco continúan.
+    items_for_stage = [item for item in items if item.status not in _TERMINAL_STATUSES]
+    if listen_to_status:
+        items_for_stage = [
+            item for item in items_for_stage if item.status.value.startswith(listen_to_status)
+        ]
+
+    # Evalúa la condición 'when' por ítem; los que no la cumplen se omiten
+    # sin gastar una llamada a la etapa y quedan registrados como SKIPPED.
+    if condition:
+        runnable, skipped = [], []
+        for item in items_for_stage:
+            (runnable if condition(item) else skipped).append(item)
+        for item in skipped:
+            record_stage_skip(item, stage_name, f"Condición 'when' no cumplida: {condition_desc}")
+        items_for_stage = runnable
+        if skipped:
+            ctx.setdefault("skipped_by_stage", {})[stage_name] = len(skipped)
+            logger.info(f"Etapa '{stage_name}': {len(skipped)} ítem(s) omitidos por la condición '{condition_desc}'.")
+
+    # Una etapa opcional se omite en los lotes cuyo presupuesto no alcanza
+    # para el consumo estimado de la etapa.
+    if optional and items_for_stage:
+        items_for_stage = _skip_over_budget(stage_name, stage_params, items_for_stage, ctx)
+
+    if not items_for_stage:
+        logger.info(f"Omitiendo etapa '{stage_name}': no hay ítems que procesar con el patrón '{listen_to_status}'.")
+        return
+
+    logger.info(f"Executing stage: '{stage_name}'. Items to process: {len(items_for_stage)}.")
+
+    tokens_before = sum(item.token_usage for item in items_for_stage)
+    payloads_before = payload_versions.capture(items_for_stage)
+    start_time = time.monotonic()
+    try:
+        # Las etapas modifican los objetos Item en su lugar. Si el lote se
+        # cancela mientras tanto, se cancelan sus corrutinas en curso.
+        completed = await run_until_cancelled(stage_instance.execute(items_for_stage), token)
+        if not completed:
+            logger.warning(f"Etapa '{stage_name}' interrumpida: {token.reason}")
+        tokens_used = sum(item.token_usage for item in items_for_stage) - tokens_before
+        record_stage_run(stage_name, len(items_for_stage), time.monotonic() - start_time, tokens_used)
+    except Exception as e:
+        logger.error(f"Error inesperado durante la ejecución de la etapa '{stage_name}': {e}", exc_info=True)
+        for item in items_for_stage:
+            item.status = ItemStatus.FATAL
+            item.status_comment = f"Error no manejado en la etapa {stage_name}: {e}"
+    # Recoge también los cambios hechos fuera de add_revision_log_entry (p. ej. en el pool de procesos).
+    live_status.record_stage_items(items_for_stage, stage_name)
+    payload_versions.record_stage_changes(items_for_stage, payloads_before, stage_name)
+
+
+def _skip_over_budget(
+    stage_name: str, stage_params: Dict[str, Any], items: List[Item], ctx: Dict[str, Any]
+) -> List[Item]:
+    """Omite la etapa opcional para los ítems de los lotes sin presupuesto suficiente."""
+    budgets = ctx.get("budgets") or {}
+    model = stage_params.get("model", settings.llm_model)
+    by_batch: Dict[str, List[Item]] = {}
+    for item in items:
+        by_batch.setdefault(item.batch_id, []).append(item)
+
+    runnable: List[Item] = []
+    for batch_id, batch_items in by_batch.items():
+        budget = budgets.get(batch_id)
+        if budget is None or stage_fits_budget(budget, stage_name, model, len(batch_items)):
+            runnable.extend(batch_items)
+            continue
+        for item in batch_items:
+            record_stage_skip(item, stage_name, f"Etapa opcional omitida por presupuesto: {budget.describe()}.")
+        logger.warning(f"Etapa opcional '{stage_name}' omitida en el lote {batch_id} por presupuesto ({budget.describe()}).")
+    return runnable
@@ -0,0 +1,145 @@
+# app/pipelines/utils/conditions.py
+
+"""
+Condiciones declarativas (`when:`) para decidir, ítem por ítem, si una etapa
+del pipeline debe ejecutarse.
+
+Ejemplos válidos en pipeline.yml:
+
+    when: "findings_count > 0"
+
+    when:
+      findings_count: "> 0"
+      codes_any: ["W1*", "E10*"]
+
+    when:
+      - "score_total < 80"
+      - codes_none: ["E9*"]
+
+Todas las condiciones de una lista o diccionario deben cumplirse (AND).
+"""
+
+from __future__ import annotations
+import fnmatch
+import operator
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.schemas.models import Item
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+_COMPARISON = re.compile(r"^\s*(?:(?P<metric>[a-z_]+)\s*)?(?P<op><=|>=|==|!=|<|>)\s*(?P<value>-?\d+(?:\.\d+)?)\s*$")
+
+
+def _findings_count(item: Item) -> Optional[float]:
+    return len(item.findings)
+
+
+def _score_total(item: Item) -> Optional[float]:
+    if item.payload and item.payload.final_evaluation:
+        return item.payload.final_evaluation.score_total
+    return None
+
+
+def _token_usage(item: Item) -> Optional[float]:
+    return item.token_usage
+
+
+# Métricas numéricas disponibles para las comparaciones.
+_METRICS: Dict[str, Callable[[Item], Optional[float]]] = {
+    "findings_count": _findings_count,
+    "score_total": _score_total,
+    "token_usage": _token_usage,
+}
+
+ItemPredicate = Callable[[Item], bool]
+
+
+def _item_codes(item: Item) -> List[str]:
+    return [f.codigo_error for f in item.findings]
+
+
+def _compile_comparison(metric: str, expression: str) -> ItemPredicate:
+    if metric not in _METRICS:
+        raise ValueError(f"Métrica desconocida en 'when': '{metric}'. Disponibles: {list(_METRICS)}")
+
+    match = _COMPARISON.match(expression)
+    if not match or (match.group("metric") and match.group("metric") != metric):
+        raise ValueError(f"Comparación inválida para '{metric}': '{expression}'")
+
+    compare = _OPERATORS[match.group("op")]
+    threshold = float(match.group("value"))
+    get_value = _METRICS[metric]
+
+    def predicate(item: Item) -> bool:
+        value = get_value(item)
+        # Si la métrica no está disponible (p. ej. aún no hay evaluación final),
+        # la condición no se cumple.
+        return value is not None and compare(value, threshold)
+
+    return predicate
+
+
+def _compile_codes(key: str, patterns: Any) -> ItemPredicate:
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+        raise ValueError(f"'{key}' espera una lista de patrones de códigos, se recibió: {patterns!r}")
+
+    def matches_any(item: Item) -> bool:
+        return any(fnmatch.fnmatchcase(code, pattern) for code in _item_codes(item) for pattern in patterns)
+
+    if key == "codes_any":
+        return matches_any
+    return lambda item: not matches_any(item)
+
+
+def _compile_expression(expression: str) -> ItemPredicate:
+    match = _COMPARISON.match(expression)
+    if not match or not match.group("metric"):
+        raise ValueError(f"Expresión 'when' inválida: '{expression}'. Formato esperado: '<métrica> <op> <valor>'.")
+    return _compile_comparison(match.group("metric"), expression)
+
+
+def _compile_mapping(mapping: Dict[str, Any]) -> List[ItemPredicate]:
+    predicates: List[ItemPredicate] = []
+    for key, value in mapping.items():
+        if key in ("codes_any", "codes_none"):
+            predicates.append(_compile_codes(key, value))
+        else:
+            predicates.append(_compile_comparison(key, str(value)))
+    return predicates
+
+
+def compile_condition(spec: Any) -> Tuple[ItemPredicate, str]:
+    """
+    Compila la especificación `when:` de una etapa en un predicado sobre ítems.
+    Devuelve el predicado y una descripción legible para el log de auditoría.
+    Lanza ValueError si la especificación no es válida.
+    """
+    specs = spec if isinstance(spec, list) else [spec]
+    predicates: List[ItemPredicate] = []
+
+    for entry in specs:
+        if isinstance(entry, str):
+            predicates.append(_compile_expression(entry))
+        elif isinstance(entry, dict):
+            predicates.extend(_compile_mapping(entry))
+        else:
+            raise ValueError(f"Condición 'when' no soportada: {entry!r}")
+
+    if not predicates:
+        raise ValueError("La condición 'when' está vacía.")
+
+    def condition(item: Item) -> bool:
+        return all(predicate(item) for predicate in predicates)
+
+    return condition, str(spec)
@@ -8,6 +8,9 @@ from pydantic import BaseModel, ValidationError
 
 # Dependencias del sistema
 from app.llm.providers import generate_response
+from app.llm.pricing import usage_cost
+from app.llm.scheduler import DEFAULT_PRIORITY, ScheduleKey
+from app.pipelines.budget import budget_exceeded_finding, estimate_prompt_tokens, get_budget
 from app.schemas.item_schemas import FindingSchema
 from app.schemas.models import Item
 from app.prompts import load_prompt
@@ -17,6 +20,20 @@ from .search_tools import WebSearchTool
 
 logger = logging.getLogger(__name__)
 
+# Parámetros de configuración de la etapa (pipeline.yml) que no deben
+# reenviarse al proveedor LLM.
+STAGE_ONLY_PARAMS = {"prompt", "repair", "micro_batch", "fallback_model"}
+
+
+def _llm_call_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in kwargs.items() if k not in STAGE_ONLY_PARAMS}
+
+
+def schedule_key_for(item: Item) -> ScheduleKey:
+    """Clase de prioridad, cliente y lote a los que el planificador atribuye las llamadas del ítem."""
+    priority = (item.generation_params or {}).get("priority") or DEFAULT_PRIORITY
+    return ScheduleKey(priority=priority, tenant_id=item.tenant_id, batch_id=item.batch_id)
+
 async def call_llm_and_parse_json_result(
     prompt_name: str,
     user_input_content: str,
@@ -29,6 +46,8 @@ async def call_llm_and_parse_json_result(
 
     total_tokens_used = 0
     response_text = ""
+    fallback_model = kwargs.get("fallback_model")
+    kwargs = _llm_call_kwargs(kwargs)
     try:
         prompt_data = load_prompt(prompt_name)
 
@@ -51,10 +70,29 @@ async def call_llm_and_parse_json_result(
         provider_name = kwargs.pop("provider", settings.llm_provider)
         model_name = kwargs.pop("model", settings.llm_model)
 
-        llm_response = await generate_response(messages=messages, provider=provider_name, model=model_name, **kwargs)
+        # Preflight del presupuesto del lote: modelo de respaldo o rechazo.
+        budget = get_budget(ctx, item)
+        reservation = None
+        if budget is not None:
+            model_name, reservation = budget.admit_call(
+                model_name, fallback_model, estimate_prompt_tokens(messages),
+                kwargs.get("max_tokens") or settings.llm_max_tokens,
+            )
+            if model_name is None:
+                return None, [budget_exceeded_finding(budget)], total_tokens_used
+
+        try:
+            llm_response = await generate_response(
+                messages=messages, provider=provider_name, model=model_name,
+                schedule_key=schedule_key_for(item), **kwargs
+            )
+        finally:
+            if budget is not None:
+                budget.release(reservation)
         tokens_used = llm_response.usage.get("total", 0)
         total_tokens_used += tokens_used
         item.token_usage += tokens_used
+        item.cost_usd += usage_cost(model_name, llm_response.usage)
 
         if not llm_response.success:
             error_msg = llm_response.error_message or "Error desconocido del proveedor LLM."
@@ -96,6 +134,8 @@ async def call_llm_with_tools(
 ) -> Tuple[Optional[BaseModel], Optional[List[FindingSchema]], int]:
 
     total_tokens_used = 0
+    fallback_model = kwargs.get("fallback_model")
+    kwargs = _llm_call_kwargs(kwargs)
     try:
         prompt_data = load_prompt(prompt_name)
 
@@ -121,10 +161,28 @@ async def call_llm_with_tools(
         for i in range(max_iterations):
             logger.info(f"[{stage_name}] Item {item.temp_id}: Iteración del agente {i+1}/{max_iterations}")
 
-            llm_response = await generate_response(messages=messages, tools=tools, **kwargs)
+            model_name = kwargs.get("model") or settings.llm_model
+            budget = get_budget(ctx, item)
+            reservation = None
+            if budget is not None:
+                model_name, reservation = budget.admit_call(
+                    model_name, fallback_model, estimate_prompt_tokens(messages),
+                    kwargs.get("max_tokens") or settings.llm_max_tokens,
+                )
+                if model_name is None:
+                    return None, [budget_exceeded_finding(budget)], total_tokens_used
+
+            try:
+                llm_response = await generate_response(
+                    messages=messages, tools=tools, schedule_key=schedule_key_for(item), **{**kwargs, "model": model_name}
+                )
+            finally:
+                if budget is not None:
+                    budget.release(reservation)
             tokens_used = llm_response.usage.get("total", 0)
             total_tokens_used += tokens_used
             item.token_usage += tokens_used
+            item.cost_usd += usage_cost(model_name, llm_response.usage)
 
             if not llm_response.success:
                 raise Exception(f"La llamada al LLM falló: {llm_response.error_message}")
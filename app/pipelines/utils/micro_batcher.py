@@ -0,0 +1,288 @@
+# app/pipelines/utils/micro_batcher.py
+
+"""
+Micro-batching de etapas LLM por ítem.
+
+Las etapas como 'refine_item_style' o 'finalize_item' envían una solicitud por
+ítem y cada una repite el mismo prompt de sistema. El MicroBatcher agrupa las
+solicitudes pendientes de la misma (etapa, prompt, modelo, parámetros), incluso
+de lotes distintos que se ejecutan en paralelo, espera unos milisegundos o
+hasta reunir K ítems y envía una única solicitud multi-ítem que debe responder
+con un arreglo JSON. Cada resultado se enruta a su ítem por `temp_id`; los
+elementos ausentes o inválidos vuelven a la ruta de un solo ítem.
+
+Antes de enviar, cada ítem reserva su parte estimada en el presupuesto de su
+lote; los que no caben con el modelo de la etapa siguen la ruta individual,
+que aplica el `fallback_model` o el rechazo E907. `max_tokens` se escala por
+el número de ítems del micro-lote.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from app.core.config import settings
+from app.schemas.item_schemas import FindingSchema
+from app.schemas.models import Item
+from app.llm.scheduler import priority_rank
+from app.pipelines.budget import CHARS_PER_TOKEN, get_budget
+from app.pipelines.utils.llm_utils import STAGE_ONLY_PARAMS, call_llm_and_parse_json_result, schedule_key_for
+from app.pipelines.utils.parsers import parse_payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20
+
+BATCH_INSTRUCTION = (
+    "Procesa cada elemento de 'items' de forma independiente, siguiendo exactamente las "
+    "instrucciones anteriores. Responde con un arreglo JSON que contenga un resultado por "
+    "elemento, cada uno con el mismo 'temp_id' que recibiste."
+)
+
+LLMCallResult = Tuple[Optional[BaseModel], Optional[List[FindingSchema]], int]
+
+
+@dataclass
+class _PendingRequest:
+    item: Item
+    llm_input: Dict[str, Any]
+    future: asyncio.Future
+    ctx: Dict[str, Any]
+
+
+class MicroBatcher:
+    """Agrupa solicitudes por ítem de una misma etapa en solicitudes multi-ítem."""
+
+    def __init__(
+        self,
+        stage_name: str,
+        prompt_name: str,
+        expected_schema: Type[BaseModel],
+        llm_params: Dict[str, Any],
+        max_size: int = DEFAULT_MAX_SIZE,
+        max_wait_ms: int = DEFAULT_MAX_WAIT_MS,
+    ):
+        self.stage_name = stage_name
+        self.prompt_name = prompt_name
+        self.expected_schema = expected_schema
+        self.llm_params = llm_params
+        self.max_size = max_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[_PendingRequest] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+        self.stats = {"batches": 0, "batched_items": 0, "fallbacks": 0}
+
+    async def submit(self, item: Item, llm_input: str, ctx: Dict[str, Any]) -> Optional[LLMCallResult]:
+        """
+        Encola la solicitud de un ítem y espera su resultado. Devuelve None si
+        el ítem debe procesarse por la ruta individual.
+        """
+        try:
+            parsed_input = json.loads(llm_input)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(parsed_input, dict) or "temp_id" not in parsed_input:
+            return None
+
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(item=item, llm_input=parsed_input, future=loop.create_future(), ctx=ctx)
+        self._pending.append(request)
+
+        if len(self._pending) >= self.max_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush_now)
+
+        return await request.future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_ms / 1000, self._flush_now)
+        # Las solicitudes canceladas (p. ej. candidatos excedentes) no se envían.
+        batch = [req for req in batch if not req.future.done()]
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            # Si todos sus ítems se cancelan (o ya tienen resultado), la llamada se cancela.
+            for req in batch:
+                req.future.add_done_callback(lambda _, task=task, batch=batch: self._cancel_if_abandoned(task, batch))
+
+    @staticmethod
+    def _cancel_if_abandoned(task: asyncio.Task, batch: List[_PendingRequest]):
+        if not task.done() and all(req.future.done() for req in batch):
+            task.cancel()
+
+    def _admit(self, batch: List[_PendingRequest]) -> Tuple[List[_PendingRequest], list]:
+        """
+        Reserva en el presupuesto de cada lote la parte estimada de cada ítem.
+        Los ítems que no caben con el modelo de la etapa vuelven a la ruta
+        individual (modelo de respaldo o E907); devuelve los admitidos y sus reservas.
+        """
+        model = self.llm_params.get("model", settings.llm_model)
+        completion_tokens = self.llm_params.get("max_tokens") or settings.llm_max_tokens
+        admitted, reservations = [], []
+        for req in batch:
+            if req.future.done():
+                continue
+            budget = get_budget(req.ctx, req.item)
+            if budget is not None:
+                prompt_tokens = len(json.dumps(req.llm_input, ensure_ascii=False)) // CHARS_PER_TOKEN
+                if not budget.fits_call(model, prompt_tokens, completion_tokens):
+                    self._resolve(req, None)
+                    continue
+                _, reservation = budget.admit_call(model, None, prompt_tokens, completion_tokens)
+                reservations.append((budget, reservation))
+            admitted.append(req)
+        return admitted, reservations
+
+    async def _send(self, batch: List[_PendingRequest]):
+        if len(batch) == 1:
+            # No hay nada que agrupar: el ítem sigue la ruta individual.
+            if not batch[0].future.done():
+                batch[0].future.set_result(None)
+            return
+
+        batch, reservations = self._admit(batch)
+        try:
+            await self._send_admitted(batch)
+        finally:
+            for budget, reservation in reservations:
+                budget.release(reservation)
+
+    async def _send_admitted(self, batch: List[_PendingRequest]):
+        if len(batch) < 2:
+            for req in batch:
+                self._resolve(req, None)
+            return
+
+        # El micro-lote hereda la prioridad, el cliente y el contexto de su ítem más urgente.
+        urgent_request = min(batch, key=lambda req: priority_rank(schedule_key_for(req.item).priority))
+        urgent = urgent_request.item
+        # Ítem contable de la llamada compartida: su gasto se reparte después
+        # entre los ítems (y así entre los presupuestos de sus lotes), que ya
+        # reservaron su parte en `_admit`.
+        accounting_item = Item(
+            batch_id=f"micro-batch:{self.stage_name}",
+            tenant_id=urgent.tenant_id,
+            generation_params={"priority": schedule_key_for(urgent).priority},
+        )
+        llm_input = json.dumps(
+            {"instruccion_lote": BATCH_INSTRUCTION, "items": [req.llm_input for req in batch]},
+            ensure_ascii=False,
+        )
+        llm_params = dict(self.llm_params)
+        # Cada ítem necesita su propia salida: un solo `max_tokens` truncaría la respuesta.
+        llm_params["max_tokens"] = (llm_params.get("max_tokens") or settings.llm_max_tokens) * len(batch)
+        try:
+            result_text, llm_errors, tokens_used = await call_llm_and_parse_json_result(
+                prompt_name=self.prompt_name,
+                user_input_content=llm_input,
+                stage_name=self.stage_name,
+                item=accounting_item,
+                ctx=urgent_request.ctx,
+                expected_schema=None,
+                **llm_params,
+            )
+        except Exception as e:
+            logger.error(f"[{self.stage_name}] Fallo del micro-lote: {e}", exc_info=True)
+            result_text, llm_errors, tokens_used = None, [], 0
+
+        tokens_share = tokens_used // len(batch)
+        cost_share = accounting_item.cost_usd / len(batch)
+        self.stats["batches"] += 1
+        self.stats["batched_items"] += len(batch)
+
+        results_by_id = {} if llm_errors or not result_text else self._parse_results(result_text)
+        for req in batch:
+            req.item.token_usage += tokens_share
+            req.item.cost_usd += cost_share
+            result = results_by_id.get(str(req.item.temp_id))
+            self._resolve(req, (result, None, tokens_share) if result is not None else None)
+
+        logger.info(
+            f"[{self.stage_name}] Micro-lote de {len(batch)} ítems enviado en una sola solicitud "
+            f"({len(results_by_id)} resultados válidos, {tokens_used} tokens)."
+        )
+
+    def _parse_results(self, result_text: str) -> Dict[str, BaseModel]:
+        try:
+            data = parse_payload(result_text)
+        except json.JSONDecodeError:
+            return {}
+        if isinstance(data, dict):
+            data = data.get("items", [])
+        if not isinstance(data, list):
+            return {}
+
+        results: Dict[str, BaseModel] = {}
+        for element in data:
+            if not isinstance(element, dict) or "temp_id" not in element:
+                continue
+            try:
+                results[str(element["temp_id"])] = self.expected_schema.model_validate(element)
+            except ValidationError:
+                continue
+        return results
+
+    def _resolve(self, request: _PendingRequest, result: Optional[LLMCallResult]):
+        if result is None:
+            self.stats["fallbacks"] += 1
+        if not request.future.done():
+            request.future.set_result(result)
+
+
+_BATCHERS: Dict[Tuple[str, str, str], MicroBatcher] = {}
+
+
+def get_micro_batcher(
+    stage_name: str,
+    prompt_name: str,
+    expected_schema: Optional[Type[BaseModel]],
+    params: Dict[str, Any],
+) -> Optional[MicroBatcher]:
+    """
+    Devuelve el MicroBatcher compartido para la combinación (etapa, prompt,
+    parámetros LLM), o None si la etapa no tiene 'micro_batch' configurado.
+    """
+    batch_cfg = params.get("micro_batch")
+    if not batch_cfg or expected_schema is None:
+        return None
+    if batch_cfg is True:
+        batch_cfg = {}
+
+    llm_params = {k: v for k, v in params.items() if k not in STAGE_ONLY_PARAMS}
+    key = (stage_name, prompt_name, json.dumps(llm_params, sort_keys=True, default=str))
+    batcher = _BATCHERS.get(key)
+    if batcher is None:
+        batcher = MicroBatcher(
+            stage_name=stage_name,
+            prompt_name=prompt_name,
+            expected_schema=expected_schema,
+            llm_params=llm_params,
+            max_size=int(batch_cfg.get("max_size", DEFAULT_MAX_SIZE)),
+            max_wait_ms=int(batch_cfg.get("max_wait_ms", DEFAULT_MAX_WAIT_MS)),
+        )
+        _BATCHERS[key] = batcher
+    return batcher
+
+
+def get_micro_batch_stats() -> Dict[str, Dict[str, int]]:
+    """Estadísticas acumuladas por etapa: micro-lotes enviados, ítems agrupados y retornos a la ruta individual."""
+    stats: Dict[str, Dict[str, int]] = {}
+    for batcher in _BATCHERS.values():
+        stage_stats = stats.setdefault(batcher.stage_name, {"batches": 0, "batched_items": 0, "fallbacks": 0})
+        for key, value in batcher.stats.items():
+            stage_stats[key] += value
+    return stats
@@ -0,0 +1,101 @@
+# app/pipelines/utils/overprovision.py
+
+"""
+Sobre-generación de candidatos para alcanzar el número de ítems solicitado
+en una sola ronda.
+
+Se generan n + k candidatos, donde k se estima a partir de la tasa histórica
+de aprobación por (asignatura, nivel_cognitivo, tipo_reactivo). La etapa de
+cuota (por defecto 'finalize_item') cancela los candidatos excedentes en
+cuanto n ítems la han superado.
+"""
+
+from __future__ import annotations
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.schemas.enums import ItemStatus
+from app.schemas.models import Item
+from app.core.log import logger
+
+DEFAULT_QUOTA_STAGE = "finalize_item"
+DEFAULT_MAX_EXTRA = 3
+DEFAULT_PASS_RATE = 0.85
+# Peso (en observaciones) de la tasa por defecto frente al historial real.
+PRIOR_WEIGHT = 5
+
+PASSED_STATUSES = {ItemStatus.EVALUATION_COMPLETE, ItemStatus.PERSISTENCE_SUCCESS}
+# Comentario con el que la etapa de cuota marca (SKIPPED) los candidatos excedentes.
+SURPLUS_CANDIDATE_COMMENT = "Candidato excedente cancelado"
+
+PassRateKey = Tuple[str, str, str]
+
+# Historial de resultados por combinación (proceso local): [aprobados, total].
+_PASS_HISTORY: Dict[PassRateKey, List[int]] = defaultdict(lambda: [0, 0])
+
+
+def pass_rate_key(generation_params: Dict[str, Any]) -> PassRateKey:
+    """Construye la clave (asignatura, nivel_cognitivo, tipo_reactivo) de unos parámetros."""
+    dominio = generation_params.get("dominio") or {}
+    formato = generation_params.get("formato") or {}
+    return (
+        str(dominio.get("asignatura", "")).strip().lower(),
+        str(generation_params.get("nivel_cognitivo", "")).strip().lower(),
+        str(formato.get("tipo_reactivo", "")).strip().lower(),
+    )
+
+
+def estimate_pass_rate(key: PassRateKey, default_rate: float = DEFAULT_PASS_RATE) -> float:
+    """Tasa de aprobación suavizada con la tasa por defecto como prior."""
+    passed, total = _PASS_HISTORY.get(key, (0, 0))
+    return (passed + default_rate * PRIOR_WEIGHT) / (total + PRIOR_WEIGHT)
+
+
+def plan_extra_candidates(n_items: int, generation_params: Dict[str, Any], cfg: Dict[str, Any]) -> int:
+    """Calcula cuántos candidatos adicionales generar para obtener n_items aprobados."""
+    rate = estimate_pass_rate(pass_rate_key(generation_params), cfg.get("default_pass_rate", DEFAULT_PASS_RATE))
+    rate = max(rate, 0.05)
+    extra = math.ceil(n_items / rate) - n_items
+    return max(0, min(extra, int(cfg.get("max_extra", DEFAULT_MAX_EXTRA))))
+
+
+def add_overprovisioned_candidates(items: List[Item], cfg: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Añade candidatos excedentes a cada lote y devuelve la cuota (n solicitado)
+    por batch_id. Los candidatos nuevos comparten lote y parámetros.
+    """
+    quotas: Dict[str, int] = {}
+    by_batch: Dict[str, List[Item]] = defaultdict(list)
+    for item in items:
+        by_batch[item.batch_id].append(item)
+
+    for batch_id, batch_items in by_batch.items():
+        quotas[batch_id] = len(batch_items)
+        params = batch_items[0].generation_params or {}
+        extra = plan_extra_candidates(len(batch_items), params, cfg)
+        for _ in range(extra):
+            items.append(Item(batch_id=batch_id, generation_params=params))
+        if extra:
+            logger.info(f"Batch {batch_id}: sobre-generando {extra} candidato(s) adicionales para una cuota de {len(batch_items)}.")
+
+    return quotas
+
+
+def is_surplus_candidate(item: Item) -> bool:
+    """True si la etapa de cuota descartó el ítem por exceder la cuota de su lote."""
+    return item.status == ItemStatus.SKIPPED and any(
+        entry.status == ItemStatus.SKIPPED and entry.comment.startswith(SURPLUS_CANDIDATE_COMMENT)
+        for entry in item.audits
+    )
+
+
+def record_outcomes(items: Iterable[Item]):
+    """Actualiza el historial de aprobación. Los candidatos cancelados no cuentan."""
+    for item in items:
+        if item.status == ItemStatus.SKIPPED or not item.generation_params:
+            continue
+        history = _PASS_HISTORY[pass_rate_key(item.generation_params)]
+        history[1] += 1
+        if item.status in PASSED_STATUSES:
+            history[0] += 1
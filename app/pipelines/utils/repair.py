@@ -0,0 +1,165 @@
+# app/pipelines/utils/repair.py
+
+"""
+Sub-bucle de reparación dirigida para ítems con errores estructurales.
+
+En lugar de marcar el ítem como FATAL (y perderlo), se envía únicamente el
+ítem roto junto con los errores exactos (de Pydantic o de validate_hard) a un
+modelo pequeño con un prompt de reparación, y se revalida localmente. El
+proceso se repite hasta `max_attempts` veces.
+"""
+
+from __future__ import annotations
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas.item_schemas import ItemPayloadSchema
+from app.schemas.models import Item
+from app.pipelines.utils.llm_utils import call_llm_and_parse_json_result
+from app.pipelines.utils.parsers import parse_payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPAIR_PROMPT = "08_agent_repair.md"
+DEFAULT_MAX_ATTEMPTS = 2
+
+# Código usado para los errores de esquema detectados por Pydantic.
+SCHEMA_ERROR_CODE = "E001_SCHEMA_INVALIDO"
+
+# Clave de `ctx` con las estadísticas de reparación por código de error de la ejecución.
+REPAIR_STATS_KEY = "repair_stats"
+
+# Una función de revalidación recibe el payload reparado y devuelve la lista
+# de errores (como texto) que aún persisten; vacía si el ítem es válido.
+Revalidator = Callable[[ItemPayloadSchema], List[str]]
+
+
+def get_repair_config(params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Extrae la configuración 'repair' de los parámetros de una etapa.
+    Devuelve None si la reparación no está habilitada.
+    """
+    repair_cfg = params.get("repair")
+    if not repair_cfg:
+        return None
+    if repair_cfg is True:
+        repair_cfg = {}
+    return {
+        "prompt": repair_cfg.get("prompt", DEFAULT_REPAIR_PROMPT),
+        "max_attempts": int(repair_cfg.get("max_attempts", DEFAULT_MAX_ATTEMPTS)),
+        "codes": repair_cfg.get("codes"),
+        "llm_params": {k: v for k, v in repair_cfg.items() if k not in ("prompt", "max_attempts", "codes")},
+    }
+
+
+def is_repairable(code: str, repair_cfg: Dict[str, Any]) -> bool:
+    """Indica si un código de error está dentro de los códigos reparables configurados."""
+    codes = repair_cfg.get("codes")
+    return not codes or code in codes
+
+
+def _record_repair(ctx: Dict[str, Any], codes: List[str], outcome: str):
+    stats = ctx.setdefault(REPAIR_STATS_KEY, {})
+    for code in codes:
+        stats.setdefault(code, {"attempted": 0, "repaired": 0})[outcome] += 1
+
+
+def format_validation_errors(error: ValidationError) -> List[str]:
+    """Convierte los errores de Pydantic en mensajes concisos con la ruta del campo."""
+    messages = []
+    for err in error.errors():
+        loc = ".".join(str(part) for part in err.get("loc", ()))
+        messages.append(f"{loc}: {err.get('msg')}")
+    return messages
+
+
+async def repair_item_payload(
+    item: Item,
+    broken_payload: Dict[str, Any],
+    errors: List[str],
+    codes: List[str],
+    stage_name: str,
+    ctx: Dict[str, Any],
+    repair_cfg: Dict[str, Any],
+    revalidate: Optional[Revalidator] = None,
+) -> Tuple[Optional[ItemPayloadSchema], int, int]:
+    """
+    Intenta reparar el payload de un ítem hasta `max_attempts` veces.
+    Devuelve (payload reparado o None, tokens usados, intentos realizados).
+    """
+    tokens_total = 0
+    current_payload = broken_payload
+    current_errors = list(errors)
+    attempts = 0
+
+    _record_repair(ctx, codes, "attempted")
+
+    for attempt in range(1, repair_cfg["max_attempts"] + 1):
+        attempts = attempt
+        llm_input = json.dumps(
+            {
+                "temp_id": str(item.temp_id),
+                "item_a_reparar": current_payload,
+                "errores_detectados": current_errors,
+            },
+            ensure_ascii=False,
+        )
+
+        result_text, llm_errors, tokens_used = await call_llm_and_parse_json_result(
+            prompt_name=repair_cfg["prompt"],
+            user_input_content=llm_input,
+            stage_name=stage_name,
+            item=item,
+            ctx=ctx,
+            expected_schema=None,
+            **repair_cfg["llm_params"],
+        )
+        tokens_total += tokens_used
+
+        if llm_errors or not result_text:
+            current_errors = [e.descripcion_hallazgo for e in llm_errors] if llm_errors else ["Respuesta vacía del LLM."]
+            logger.info(f"[{stage_name}] Item {item.temp_id}: intento de reparación {attempt} fallido: {current_errors[0][:200]}")
+            continue
+
+        try:
+            repaired_dict = parse_payload(result_text)
+            # Se tolera que el modelo envuelva el ítem en un arreglo de un elemento.
+            if isinstance(repaired_dict, list) and len(repaired_dict) == 1:
+                repaired_dict = repaired_dict[0]
+            result = ItemPayloadSchema.model_validate(repaired_dict)
+        except json.JSONDecodeError as e:
+            current_errors = [f"La respuesta no es JSON válido: {e}"]
+            continue
+        except ValidationError as e:
+            # Los errores exactos de Pydantic se reenvían en el siguiente intento.
+            if isinstance(repaired_dict, dict):
+                current_payload = repaired_dict
+            current_errors = format_validation_errors(e)
+            logger.info(f"[{stage_name}] Item {item.temp_id}: intento de reparación {attempt} con errores de esquema: {current_errors}")
+            continue
+
+        remaining = revalidate(result) if revalidate else []
+        if not remaining:
+            _record_repair(ctx, codes, "repaired")
+            return result, tokens_total, attempts
+
+        current_payload = result.model_dump(mode="json", exclude={"revision_log"})
+        current_errors = remaining
+        logger.info(f"[{stage_name}] Item {item.temp_id}: intento de reparación {attempt} aún con errores: {remaining}")
+
+    return None, tokens_total, attempts
+
+
+def get_repair_stats(ctx: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Devuelve, por código de error, los intentos, éxitos y la tasa de reparación de la ejecución."""
+    return {
+        code: {
+            "attempted": stats["attempted"],
+            "repaired": stats["repaired"],
+            "success_rate": round(stats["repaired"] / stats["attempted"], 3) if stats["attempted"] else 0.0,
+        }
+        for code, stats in sorted(ctx.get(REPAIR_STATS_KEY, {}).items())
+    }
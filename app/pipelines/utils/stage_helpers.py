@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import uuid
 
 # --- CORRECCIÓN DE IMPORTACIONES ---
@@ -14,6 +14,7 @@ from app.schemas.item_schemas import (
     ValidationResultSchema,
 )
 from app.core.log import logger
+from app.pipelines import live_status
 
 # ---------------------------------------------------------------------------
 # Funciones Helper Esenciales para el Pipeline
@@ -44,6 +45,33 @@ def initialize_items_for_pipeline(params: Dict[str, Any]) -> List[Item]:
     return items_to_process
 
 
+def iter_items_for_pipeline(requests: Iterable[Dict[str, Any]]) -> Iterator[Item]:
+    """
+    Versión perezosa de `initialize_items_for_pipeline` para cargas masivas:
+    recibe un iterable de solicitudes de generación y produce sus ítems uno a
+    uno, con un batch_id por solicitud. Las solicitudes inválidas se omiten.
+    """
+    for index, params in enumerate(requests):
+        try:
+            gen_params = ItemGenerationParams.model_validate(params)
+        except Exception as e:
+            logger.error(f"Solicitud {index} inválida, se omite: {e}")
+            continue
+
+        batch_id = str(uuid.uuid4())
+        generation_params = gen_params.model_dump(mode="json")
+        for _ in range(gen_params.n_items):
+            yield Item(batch_id=batch_id, generation_params=generation_params)
+
+
+def group_items_by_batch(items: List[Item]) -> List[List[Item]]:
+    """Agrupa los ítems por batch_id conservando el orden de aparición."""
+    groups: Dict[str, List[Item]] = {}
+    for item in items:
+        groups.setdefault(item.batch_id, []).append(item)
+    return list(groups.values())
+
+
 def add_revision_log_entry(
     item: Item,
     stage_name: str,
@@ -55,7 +83,8 @@ def add_revision_log_entry(
 ):
     """
     Función centralizada para actualizar el estado de un ítem y añadir una
-    entrada a su 'revision_log', ahora con metadatos completos.
+    entrada a su auditoría (`item.audits`), ahora con metadatos completos.
+    Al persistir, cada entrada se guarda como una fila de `item_events`.
     """
     # Si no se pasa una duración explícita, se intenta calcular desde el log anterior.
     calculated_duration = duration_ms
@@ -78,8 +107,7 @@ def add_revision_log_entry(
     item.status_comment = f"[{stage_name}]: {status.value}"
     item.audits.append(log_entry)
 
-    if item.payload and hasattr(item.payload, 'revision_log'):
-        item.payload.revision_log.append(log_entry)
+    live_status.record_transition(item, stage_name)
 
     # El log del servidor ahora es más informativo
     log_message_for_server = f"Item {item.temp_id}: {status.value} en '{stage_name}'. Dur: {calculated_duration}ms, Tokens: {tokens_used}, Códigos: {codes_found}. Detalle: {comment}"
@@ -89,6 +117,25 @@ def add_revision_log_entry(
         logger.info(log_message_for_server)
 
 
+def record_stage_skip(item: Item, stage_name: str, comment: str):
+    """
+    Registra en la auditoría que una etapa se omitió para el ítem.
+    A diferencia de add_revision_log_entry, no modifica el estado del ítem,
+    para que las etapas siguientes lo sigan procesando con normalidad.
+    """
+    log_entry = RevisionLogEntry(
+        stage_name=stage_name,
+        timestamp=datetime.utcnow(),
+        status=ItemStatus.SKIPPED,
+        comment=comment,
+        duration_ms=0,
+        tokens_used=0,
+    )
+    item.audits.append(log_entry)
+
+    logger.info(f"Item {item.temp_id}: {ItemStatus.SKIPPED.value} en '{stage_name}'. Detalle: {comment}")
+
+
 def handle_missing_payload(item: Item, stage_name: str) -> bool:
     """
     Maneja el caso donde el payload del ítem está ausente, marcándolo como fatal.
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 from pydantic import BaseModel, Field, UUID4
 
 # Se importa ItemStatus desde su archivo dedicado para evitar ciclos.
@@ -35,12 +35,36 @@ class ItemGenerationParams(BaseModel):
     audiencia: Dict[str, Any]
     nivel_cognitivo: str
     formato: FormatoSchema
+    # Clase de prioridad de sus llamadas LLM; la API usa 'interactive' si no se indica.
+    priority: Optional[Literal["interactive", "bulk", "prefill"]] = None
 
 
 class GenerationResultSchema(BaseModel):
     message: str
     batch_id: str
     num_items: int
+    # True si la solicitud se unió a un lote idéntico ya iniciado.
+    coalesced: bool = False
+    # True si los ítems se sirvieron al instante desde el inventario pregenerado.
+    from_inventory: bool = False
+    # Estimación del control de admisión para los lotes nuevos.
+    estimated_completion_seconds: Optional[float] = None
+    estimated_completion_at: Optional[datetime] = None
+
+
+class BatchCancelResultSchema(BaseModel):
+    """Respuesta a una solicitud de cancelación de lote."""
+    batch_id: str
+    message: str
+
+
+class QueueDepthSchema(BaseModel):
+    """Profundidad de una cola de trabajos del pipeline, para escalar su pool de workers."""
+    queue: str
+    resource_class: str
+    queued: int
+    running: int
+    oldest_queued_seconds: Optional[float] = None
 
 
 # --- ESQUEMAS INTERNOS UNIFICADOS (Basados en el prompt 01_agent_dominio.md) ---
@@ -132,13 +156,24 @@ class ItemPayloadSchema(BaseModel):
     metadata_creacion: MetadataCreacionSchema
 
     # Campos internos para el pipeline, se mantienen.
+    # Ya no se rellena: el historial del ítem está en `item_events`
+    # (GET /items/{item_id}/history). Se conserva por los payloads antiguos.
     revision_log: List[RevisionLogEntry] = Field(default_factory=list)
     final_evaluation: Optional[FinalEvaluationSchema] = None
 
 
 # --- Esquemas de Soporte (Hallazgos, Correcciones, etc.) ---
 
-class FindingSchema(BaseModel):
+class HistoryEntrySchema(BaseModel):
+    """
+    Base de las entradas del historial de un ítem (auditoría, hallazgos y
+    correcciones). `entry_id` se asigna al crear la entrada y la identifica en
+    `item_events` aunque la lista del ítem se recorte o se reinicie.
+    """
+    entry_id: uuid.UUID = Field(default_factory=uuid.uuid4)
+
+
+class FindingSchema(HistoryEntrySchema):
     codigo_error: str
     campo_con_error: str
     descripcion_hallazgo: str
@@ -150,7 +185,7 @@ class ValidationResultSchema(BaseModel):
     hallazgos: List[FindingSchema] = Field(default_factory=list)
 
 
-class CorrectionSchema(BaseModel):
+class CorrectionSchema(HistoryEntrySchema):
     codigo_error: str
     campo_con_error: str
     descripcion_correccion: str
@@ -168,7 +203,7 @@ class PatchRefinementResultSchema(BaseModel):
     status: str = Field(description="Debe ser 'refinado_exitosamente' o 'requiere_descarte_por_error_critico'")
     parches_propuestos: List[ProposedPatch] = Field(default_factory=list)
 
-class RevisionLogEntry(BaseModel):
+class RevisionLogEntry(HistoryEntrySchema):
     """
     Representa una entrada en el historial de auditoría de un ítem.
     Enriquecida con metadatos de rendimiento y calidad.
@@ -181,6 +216,17 @@ class RevisionLogEntry(BaseModel):
     tokens_used: Optional[int] = None
     codes_found: Optional[List[str]] = None
 
+class PayloadRevisionSchema(BaseModel):
+    """
+    Cambio del payload de un ítem en una etapa, como parche JSON (RFC 6902)
+    reversible (ver app.core.json_patch). La revisión 0 es el payload inicial
+    y su parche está vacío.
+    """
+    revision: int
+    stage_name: str
+    timestamp: datetime
+    patch: List[Dict[str, Any]] = Field(default_factory=list)
+
 class ScoreBreakdownSchema(BaseModel):
     psychometric_content_score: int
     clarity_pedagogy_score: int
@@ -230,10 +276,24 @@ class GenericRefinementResultSchema(BaseModel):
 
 class ItemResultSchema(BaseModel):
     """Esquema para el resultado de un solo ítem dentro de un lote."""
-    item_id: uuid.UUID
+    # Nulo mientras el ítem en curso aún no se ha persistido.
+    item_id: Optional[uuid.UUID] = None
     temp_id: uuid.UUID
     status: str
 
+class BatchBudgetSchema(BaseModel):
+    """Presupuesto de tokens y coste de un lote y su gasto registrado (None = sin límite)."""
+    max_tokens: Optional[int] = None
+    max_cost_usd: Optional[float] = None
+    tokens_used: int = 0
+    cost_usd: float = 0.0
+
+class StageProgressSchema(BaseModel):
+    """Ítems de un lote en curso que ya pasaron por una etapa."""
+    stage_name: str
+    processed_items: int
+    failed_items: int
+
 class BatchStatusResultSchema(BaseModel):
     """Esquema para la respuesta del estado de un lote."""
     batch_id: str
@@ -243,3 +303,61 @@ class BatchStatusResultSchema(BaseModel):
     successful_items: int
     failed_items: int
     results: List[ItemResultSchema]
+    budget: Optional[BatchBudgetSchema] = None
+    # Solo para lotes en curso en el proceso de la API.
+    current_stage: Optional[str] = None
+    stages: List[StageProgressSchema] = []
+
+class ItemSummarySchema(BaseModel):
+    """Fila del listado de ítems: solo los campos necesarios para navegar el banco."""
+    item_id: uuid.UUID
+    batch_id: str
+    status: str
+    created_at: datetime
+    asignatura: Optional[str] = None
+    tema: Optional[str] = None
+    nivel_cognitivo: Optional[str] = None
+
+class ItemPageSchema(BaseModel):
+    """Página del listado de ítems; `next_cursor` es nulo en la última página."""
+    items: List[ItemSummarySchema]
+    next_cursor: Optional[str] = None
+
+class SearchHitSchema(BaseModel):
+    """Resultado de la búsqueda: campos para decidir si el ítem sirve sin descargar su payload."""
+    item_id: uuid.UUID
+    batch_id: str
+    status: str
+    rank: float
+    enunciado_pregunta: Optional[str] = None
+    asignatura: Optional[str] = None
+    tema: Optional[str] = None
+    nivel_cognitivo: Optional[str] = None
+    tipo_reactivo: Optional[str] = None
+    score_total: Optional[int] = None
+
+class FacetValueSchema(BaseModel):
+    value: str
+    count: int
+
+class SearchResultSchema(BaseModel):
+    """
+    Página de resultados de GET /items/search con las facetas de todas las
+    coincidencias. Si `truncated` es True había más de SEARCH_MAX_CANDIDATES
+    coincidencias y `total` y las facetas se refieren solo a esas.
+    """
+    total: int
+    truncated: bool = False
+    items: List[SearchHitSchema]
+    facets: Dict[str, List[FacetValueSchema]]
+
+class ItemHistorySchema(BaseModel):
+    """Historial de un ítem, leído de `item_events`."""
+    item_id: uuid.UUID
+    revision_log: List[RevisionLogEntry]
+    findings: List[FindingSchema]
+    change_log: List[CorrectionSchema]
+
+class ItemRevisionSchema(PayloadRevisionSchema):
+    """Revisión guardada de un ítem; `has_snapshot` indica si guarda el payload completo."""
+    has_snapshot: bool = False
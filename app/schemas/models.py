@@ -6,7 +6,7 @@ from pydantic import BaseModel, Field
 
 # Dependencias de otros módulos de schemas
 from .enums import ItemStatus
-from .item_schemas import ItemPayloadSchema, FindingSchema, RevisionLogEntry, CorrectionSchema
+from .item_schemas import ItemPayloadSchema, FindingSchema, RevisionLogEntry, CorrectionSchema, PayloadRevisionSchema
 
 class Item(BaseModel):
     """
@@ -17,12 +17,14 @@ class Item(BaseModel):
     item_id: Optional[uuid.UUID] = None  # El ID definitivo de la DB, se rellena al final.
     temp_id: uuid.UUID = Field(default_factory=uuid.uuid4)
     batch_id: str
+    tenant_id: Optional[str] = None  # Cliente que solicitó el ítem (cabecera X-Tenant-ID).
 
     # --- Estado y Parámetros ---
     status: ItemStatus = ItemStatus.PENDING
     status_comment: Optional[str] = None
     generation_params: Optional[Dict[str, Any]] = None
     token_usage: int = 0
+    cost_usd: float = 0.0  # Coste estimado de sus llamadas LLM (app.llm.pricing).
 
     # --- Contenido y Metadatos Generados ---
     # Se usan Field(default_factory=list) para asegurar que siempre sean listas
@@ -31,6 +33,8 @@ class Item(BaseModel):
     findings: List[FindingSchema] = Field(default_factory=list)
     audits: List[RevisionLogEntry] = Field(default_factory=list)
     change_log: List[CorrectionSchema] = Field(default_factory=list)
+    # Cambios del payload por etapa (app.pipelines.payload_versions).
+    payload_revisions: List[PayloadRevisionSchema] = Field(default_factory=list)
 
     class Config:
         # Es una buena práctica para manejar tipos complejos como UUID.
@@ -0,0 +1,334 @@
+# app/worker.py
+
+"""
+Worker de la cola durable del pipeline.
+
+Cada proceso reclama trabajos de la tabla `pipeline_jobs` con
+SELECT ... FOR UPDATE SKIP LOCKED y ejecuta `runner.run` para sus ítems,
+con hasta `--concurrency` trabajos en paralelo. Mientras un trabajo se
+ejecuta, un heartbeat renueva su lease; si el proceso muere, el lease vence
+y otro worker lo vuelve a reclamar. El rendimiento escala añadiendo procesos
+o nodos.
+
+En el modo distribuido (PIPELINE_EXECUTION_MODE=distributed) cada trabajo
+corresponde a una etapa: el worker la ejecuta y encola la siguiente. Cada
+pool de workers puede limitarse a unas etapas o a una clase de recursos y
+dimensionarse por separado.
+
+Uso:
+    python -m app.worker --concurrency 4
+    python -m app.worker --stage-class llm --concurrency 32
+    python -m app.worker --stage-class cpu,db --concurrency 2
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.log import logger
+from app.db import async_crud, crud
+from app.db.session import PipelineSessionLocal, SessionLocal, dispose_async_engines
+from app.schemas.models import Item
+from app.pipelines.budget import flush_budget_spend
+from app.pipelines.cancellation import CancellationToken
+from app.pipelines.runner import (
+    finish_run,
+    get_stage_resource_class,
+    load_pipeline_config,
+    log_repair_stats,
+    next_stage_index,
+    prepare_run,
+    run as run_pipeline_async,
+    run_stage,
+)
+
+# Importación por efecto secundario: registra todas las etapas del pipeline.
+from app.pipelines import builtins  # noqa: F401
+
+
+def _db_call(fn, *args):
+    """Ejecuta una función de crud con su propia sesión (pensado para asyncio.to_thread)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+class Worker:
+    """Consume trabajos de `pipeline_jobs` con paralelismo, leases y heartbeats."""
+
+    def __init__(self, worker_id: str, concurrency: int, stage_names: Optional[List[str]] = None):
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.stage_names = stage_names
+        self._slots = asyncio.Semaphore(concurrency)
+        self._stopping = asyncio.Event()
+        self._tasks: set = set()
+
+    def stop(self):
+        logger.info(f"Worker {self.worker_id}: deteniendo; se terminarán los trabajos en curso.")
+        self._stopping.set()
+
+    async def run_forever(self):
+        queues = ", ".join(self.stage_names) if self.stage_names is not None else "all"
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency} (queues: {queues}).")
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            if self._stopping.is_set():
+                self._slots.release()
+                break
+            try:
+                job = await asyncio.to_thread(
+                    _db_call, crud.claim_pipeline_job, self.worker_id, settings.worker_lease_seconds, self.stage_names
+                )
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id}: error al reclamar trabajo: {e}", exc_info=True)
+                job = None
+
+            if job is None:
+                self._slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.worker_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job.stage_name is not None:
+                coro = self._process_stage_job(job)
+            else:
+                coro = self._process_job(job.id, job.batch_id, job.status, job.attempts, job.items)
+            task = asyncio.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: self._slots.release())
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info(f"Worker {self.worker_id} stopped.")
+
+    async def _heartbeat(self, job_id: uuid.UUID, token: CancellationToken, work: asyncio.Future) -> bool:
+        """
+        Renueva el lease periódicamente y propaga las cancelaciones solicitadas.
+        Si el lease pasó a otro worker cancela `work` (la ejecución del trabajo)
+        y devuelve True: el nuevo dueño lo retoma y este worker no debe
+        persistir ítems ni cerrar el trabajo.
+        """
+        while True:
+            await asyncio.sleep(settings.worker_heartbeat_seconds)
+            try:
+                status = await asyncio.to_thread(
+                    _db_call, crud.renew_job_lease, job_id, self.worker_id, settings.worker_lease_seconds
+                )
+            except Exception as e:
+                logger.warning(f"Worker {self.worker_id}: fallo del heartbeat del trabajo {job_id}: {e}")
+                continue
+            if status is None:
+                logger.warning(
+                    f"Worker {self.worker_id}: el lease del trabajo {job_id} pasó a otro worker; se abandona sin persistir."
+                )
+                work.cancel()
+                return True
+            if status == "cancelling":
+                token.cancel("Cancelado por el usuario.")
+                return False
+
+    async def _finish_job(self, job_id: uuid.UUID, status: str, error: Optional[str] = None) -> bool:
+        """Cierra un trabajo propio. Devuelve False si el lease ya es de otro worker."""
+        updated = await asyncio.to_thread(_db_call, crud.finish_pipeline_job, job_id, self.worker_id, status, error)
+        if not updated:
+            logger.warning(
+                f"Worker {self.worker_id}: el trabajo {job_id} ya no es de este worker; no se marca como '{status}'."
+            )
+        return bool(updated)
+
+    async def _process_job(self, job_id: uuid.UUID, batch_id: str, status: str, attempts: int, items_data):
+        logger.info(f"Worker {self.worker_id}: processing job {job_id} (batch {batch_id}, attempt {attempts}).")
+        token = CancellationToken()
+        if status == "cancelling":
+            token.cancel("Cancelado por el usuario.")
+
+        items = [Item.model_validate(data) for data in items_data]
+        work = asyncio.ensure_future(run_pipeline_async(
+            pipeline_config_path=settings.pipeline_config_path,
+            items_to_process=items,
+            ctx={"async_session_factory": PipelineSessionLocal, "cancel_token": token},
+        ))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, token, work))
+        final_status, error = "done", None
+        try:
+            await work
+            if _lease_lost(heartbeat):
+                return
+            async with PipelineSessionLocal() as db:
+                await async_crud.sync_item_statuses(db, items)
+            if token.cancelled:
+                final_status = "cancelled"
+        except asyncio.CancelledError:
+            if not _lease_lost(heartbeat):
+                raise
+            return
+        except Exception as e:
+            logger.error(f"Worker {self.worker_id}: job {job_id} failed: {e}", exc_info=True)
+            error = str(e)
+            final_status = "queued" if attempts < settings.worker_max_attempts else "failed"
+        finally:
+            heartbeat.cancel()
+
+        try:
+            if not await self._finish_job(job_id, final_status, error):
+                final_status = "abandoned"
+        except Exception as e:
+            # El lease vencerá y otro worker retomará el trabajo.
+            logger.error(f"Worker {self.worker_id}: no se pudo cerrar el trabajo {job_id}: {e}", exc_info=True)
+        logger.info(f"Worker {self.worker_id}: job {job_id} -> {final_status}.")
+
+    async def _process_stage_job(self, job):
+        """Modo distribuido: ejecuta una etapa del lote y encola la siguiente."""
+        logger.info(
+            f"Worker {self.worker_id}: processing stage '{job.stage_name}' of batch {job.batch_id} "
+            f"(job {job.id}, attempt {job.attempts})."
+        )
+        config = load_pipeline_config(settings.pipeline_config_path)
+        if config is None:
+            await self._finish_job(job.id, "failed", "Pipeline config not available.")
+            return
+
+        items = [Item.model_validate(data) for data in job.items]
+        context: Dict[str, Any] = dict(job.context or {})
+        ctx: Dict[str, Any] = {}
+        if job.stage_index == 0:
+            # Primera etapa: sobre-generación y plazo del lote, compartidos
+            # con las etapas siguientes a través del contexto del trabajo.
+            prepare_run(config, items, ctx)
+            context["item_quotas"] = ctx.get("item_quotas")
+            context["quota_stage"] = ctx.get("quota_stage")
+            if config.get("deadline_seconds"):
+                context["deadline_at"] = time.time() + config["deadline_seconds"]
+        ctx["item_quotas"] = context.get("item_quotas")
+        ctx["quota_stage"] = context.get("quota_stage")
+
+        deadline_at = context.get("deadline_at")
+        token = CancellationToken(max(deadline_at - time.time(), 0.001) if deadline_at else None)
+        cancelled_items = None
+        if context.get("cancel_reason"):
+            token.cancel(context["cancel_reason"])
+            cancelled_ids = set(context.get("cancelled_temp_ids", []))
+            cancelled_items = [item for item in items if str(item.temp_id) in cancelled_ids]
+        elif job.status == "cancelling":
+            token.cancel("Cancelado por el usuario.")
+        ctx["cancel_token"] = token
+        ctx["async_session_factory"] = PipelineSessionLocal
+        work = asyncio.ensure_future(run_stage(config, job.stage_index, items, ctx, cancelled_items))
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, token, work))
+
+        try:
+            cancelled_items = await work
+            if _lease_lost(heartbeat):
+                return
+            if cancelled_items is not None:
+                context["cancel_reason"] = token.reason
+                context["cancelled_temp_ids"] = [str(item.temp_id) for item in cancelled_items]
+
+            next_index = next_stage_index(config, job.stage_index, cancelled=cancelled_items is not None)
+            if next_index is None:
+                finish_run(config, items, token, ctx)
+                await flush_budget_spend(ctx, completed=True)
+                await asyncio.to_thread(_db_call, crud.sync_item_statuses, items)
+                final_status = "cancelled" if token.cancelled else "done"
+                if not await self._finish_job(job.id, final_status):
+                    final_status = "abandoned"
+            else:
+                # Cada trabajo de etapa es una ejecución: sus reparaciones se registran aquí.
+                log_repair_stats(ctx)
+                next_name = config["stages"][next_index]["name"]
+                next_job = await asyncio.to_thread(
+                    _db_call, crud.advance_pipeline_job, job.id, self.worker_id, items, next_index, next_name, context
+                )
+                if next_job is None:
+                    logger.warning(
+                        f"Worker {self.worker_id}: el trabajo {job.id} ya no es de este worker; no se encola '{next_name}'."
+                    )
+                    final_status = "abandoned"
+                else:
+                    final_status = f"-> {next_name}"
+        except asyncio.CancelledError:
+            if not _lease_lost(heartbeat):
+                raise
+            return
+        except Exception as e:
+            logger.error(f"Worker {self.worker_id}: stage job {job.id} failed: {e}", exc_info=True)
+            final_status = "queued" if job.attempts < settings.worker_max_attempts else "failed"
+            try:
+                await self._finish_job(job.id, final_status, str(e))
+            except Exception as db_error:
+                logger.error(f"Worker {self.worker_id}: no se pudo cerrar el trabajo {job.id}: {db_error}", exc_info=True)
+        finally:
+            heartbeat.cancel()
+        logger.info(f"Worker {self.worker_id}: job {job.id} ('{job.stage_name}') {final_status}.")
+
+
+def _lease_lost(heartbeat: asyncio.Task) -> bool:
+    """True si el heartbeat terminó porque el lease del trabajo pasó a otro worker."""
+    return heartbeat.done() and not heartbeat.cancelled() and heartbeat.result() is True
+
+
+def resolve_stage_names(stages: Optional[str], stage_classes: Optional[str]) -> Optional[List[str]]:
+    """
+    Traduce los filtros --stages / --stage-class a la lista de etapas que
+    atenderá el worker. None significa todas las colas.
+    """
+    if not stages and not stage_classes:
+        return None
+    names = {name.strip() for name in (stages or "").split(",") if name.strip()}
+    if stage_classes:
+        classes = {cls.strip() for cls in stage_classes.split(",") if cls.strip()}
+        config = load_pipeline_config(settings.pipeline_config_path) or {}
+        for stage_config in config.get("stages", []):
+            name = stage_config.get("name")
+            if name and get_stage_resource_class(name) in classes:
+                names.add(name)
+    return sorted(names)
+
+
+def _default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def _main_async(worker_id: str, concurrency: int, stage_names: Optional[List[str]]):
+    worker = Worker(worker_id, concurrency, stage_names)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+    try:
+        await worker.run_forever()
+    finally:
+        await dispose_async_engines()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Worker de la cola durable del pipeline de SIGIE.")
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency,
+                        help="Número de trabajos que el proceso ejecuta en paralelo.")
+    parser.add_argument("--worker-id", default=_default_worker_id(),
+                        help="Identificador del worker para los leases (por defecto host-pid).")
+    parser.add_argument("--stages", default=None,
+                        help="Etapas (separadas por comas) cuyas colas atiende el worker en modo distribuido.")
+    parser.add_argument("--stage-class", default=None,
+                        help="Clases de recursos (llm, cpu, db) cuyas colas atiende el worker en modo distribuido.")
+    args = parser.parse_args(argv)
+    stage_names = resolve_stage_names(args.stages, args.stage_class)
+    asyncio.run(_main_async(args.worker_id, max(1, args.concurrency), stage_names))
+
+
+if __name__ == "__main__":
+    main()
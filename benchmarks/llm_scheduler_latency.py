@@ -0,0 +1,87 @@
+# benchmarks/llm_scheduler_latency.py
+
+"""
+Benchmark de latencia: solicitudes interactivas pequeñas que llegan mientras
+un trabajo masivo satura el límite de llamadas LLM simultáneas.
+
+Compara el orden de llegada (FIFO, todas las llamadas con la misma clave)
+frente al planificador con clases de prioridad (`app.llm.scheduler`). Las
+llamadas LLM se simulan con una espera fija; no se contacta a ningún proveedor.
+
+Uso:
+    python benchmarks/llm_scheduler_latency.py --bulk-calls 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.llm.scheduler import LLMScheduler, ScheduleKey  # noqa: E402
+
+WEIGHTS = {"interactive": 16.0, "bulk": 4.0, "prefill": 1.0}
+
+
+async def _call(scheduler: LLMScheduler, key: ScheduleKey, call_seconds: float) -> float:
+    start = time.perf_counter()
+    async with scheduler.slot(key):
+        await asyncio.sleep(call_seconds * random.uniform(0.8, 1.2))
+    return time.perf_counter() - start
+
+
+async def _interactive_batch(scheduler, fifo: bool, index: int, calls: int, call_seconds: float) -> float:
+    """Un lote interactivo: sus llamadas en paralelo; latencia = la más lenta."""
+    if fifo:
+        key = ScheduleKey("bulk", "bulk-tenant", "offline-job")
+    else:
+        key = ScheduleKey("interactive", f"teacher-{index}", f"gui-{index}")
+    latencies = await asyncio.gather(*(_call(scheduler, key, call_seconds) for _ in range(calls)))
+    return max(latencies)
+
+
+async def _run(fifo: bool, args) -> list:
+    random.seed(7)
+    scheduler = LLMScheduler(args.concurrency, WEIGHTS)
+    bulk_key = ScheduleKey("bulk", "bulk-tenant", "offline-job")
+    bulk = [asyncio.create_task(_call(scheduler, bulk_key, args.call_seconds)) for _ in range(args.bulk_calls)]
+
+    interactive = []
+    for index in range(args.interactive_batches):
+        await asyncio.sleep(args.interactive_interval)
+        interactive.append(asyncio.create_task(
+            _interactive_batch(scheduler, fifo, index, args.interactive_calls, args.call_seconds)
+        ))
+    latencies = await asyncio.gather(*interactive)
+    for task in bulk:
+        task.cancel()
+    await asyncio.gather(*bulk, return_exceptions=True)
+    return latencies
+
+
+def _p95(values: list) -> float:
+    return statistics.quantiles(values, n=20)[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk-calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--call-seconds", type=float, default=0.05)
+    parser.add_argument("--interactive-batches", type=int, default=20)
+    parser.add_argument("--interactive-calls", type=int, default=10)
+    parser.add_argument("--interactive-interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"{'orden':<14} {'p50 (s)':>9} {'p95 (s)':>9} {'máx (s)':>9}")
+    for name, fifo in (("fifo", True), ("planificador", False)):
+        latencies = asyncio.run(_run(fifo, args))
+        print(f"{name:<14} {statistics.median(latencies):>9.2f} {_p95(latencies):>9.2f} {max(latencies):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
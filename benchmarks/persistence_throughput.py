@@ -0,0 +1,101 @@
+# benchmarks/persistence_throughput.py
+
+"""
+Benchmark de persistencia: ítems por segundo de `crud.save_items` al insertar
+N ítems nuevos y al volver a guardarlos (actualización), frente al guardado
+anterior ítem por ítem (un SELECT, un INSERT/UPDATE y un refresh por ítem).
+
+Escribe en la base de datos de DATABASE_URL con un batch_id propio y borra
+sus filas al terminar; no conviene lanzarlo contra la base de producción. El
+guardado ítem por ítem solo se mide hasta `--per-row-max` ítems.
+
+Uso:
+    python benchmarks/persistence_throughput.py --sizes 10,1000,100000
+"""
+
+import argparse
+import copy
+import logging
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from windowed_memory import PAYLOAD_TEMPLATE  # noqa: E402
+
+from app.db import crud, models as db_models  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.schemas.enums import ItemStatus  # noqa: E402
+from app.schemas.item_schemas import ItemPayloadSchema  # noqa: E402
+from app.schemas.models import Item  # noqa: E402
+
+
+def _items(n_items: int, batch_id: str) -> list:
+    payload = ItemPayloadSchema.model_validate(copy.deepcopy(PAYLOAD_TEMPLATE))
+    return [
+        Item(batch_id=batch_id, status=ItemStatus.PERSISTENCE_SUCCESS, payload=payload, token_usage=1500)
+        for _ in range(n_items)
+    ]
+
+
+def _save_items_per_row(db, items: list):
+    """Guardado anterior a los upserts por conjuntos: 2N+1 viajes a la base de datos."""
+    db_items = []
+    for item in items:
+        values = crud.item_column_values(item)
+        db_item = db.query(db_models.ItemModel).filter_by(id=item.item_id).first() if item.item_id else None
+        if db_item:
+            for column, value in values.items():
+                setattr(db_item, column, value)
+        else:
+            db_item = db_models.ItemModel(**values)
+            db.add(db_item)
+        db_items.append(db_item)
+    db.commit()
+    for item, db_item in zip(items, db_items):
+        db.refresh(db_item)
+        item.item_id = db_item.id
+
+
+def _measure(save, n_items: int) -> tuple:
+    batch_id = f"bench-{uuid.uuid4()}"
+    items = _items(n_items, batch_id)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        save(db, items)
+        insert_s = time.perf_counter() - start
+        db.expunge_all()
+
+        start = time.perf_counter()
+        save(db, items)
+        update_s = time.perf_counter() - start
+        return n_items / insert_s, n_items / update_s
+    finally:
+        db.rollback()
+        db.query(db_models.ItemModel).filter_by(batch_id=batch_id).delete()
+        db.commit()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,100000", help="Tamaños de lote separados por comas.")
+    parser.add_argument("--per-row-max", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'guardado':<12} {'ítems':>8} {'insert (ítems/s)':>17} {'update (ítems/s)':>17}")
+    for n_items in (int(size) for size in args.sizes.split(",")):
+        modes = [("upsert", crud.save_items)]
+        if n_items <= args.per_row_max:
+            modes.append(("por ítem", _save_items_per_row))
+        for name, save in modes:
+            insert_rate, update_rate = _measure(save, n_items)
+            print(f"{name:<12} {n_items:>8} {insert_rate:>17.0f} {update_rate:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
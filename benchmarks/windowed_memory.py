@@ -0,0 +1,165 @@
+# benchmarks/windowed_memory.py
+
+"""
+Benchmark de memoria: pipeline completo sobre N ítems en modo lista (todos los
+ítems en memoria durante la ejecución) frente al modo por ventanas
+(`iter_items_for_pipeline` + `window_size`).
+
+No llama a ningún LLM ni a la base de datos: la generación y la persistencia
+se sustituyen por etapas sintéticas, y se ejecutan las validaciones reales.
+Cada modo corre en un subproceso para medir su pico de RSS por separado.
+
+Uso:
+    python benchmarks/windowed_memory.py --items 10000 --window-size 100
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+REQUEST = json.loads((Path(__file__).resolve().parents[1] / "request_item.json").read_text())
+ITEMS_PER_REQUEST = 5
+
+PAYLOAD_TEMPLATE = {
+    "version": "1.0",
+    "dominio": REQUEST["dominio"],
+    "objetivo_aprendizaje": REQUEST["objetivo_aprendizaje"],
+    "audiencia": REQUEST["audiencia"],
+    "nivel_cognitivo": REQUEST["nivel_cognitivo"],
+    "formato": {"tipo_reactivo": "cuestionamiento_directo", "numero_opciones": 4},
+    "contexto": {"contexto_regional": None, "referencia_curricular": None},
+    "cuerpo_item": {
+        "estimulo": "Durante una apendicectomía, la enfermera instrumentista prepara el material para cada tiempo quirúrgico. " * 4,
+        "enunciado_pregunta": "¿Qué acción corresponde al tiempo de hemostasia en este procedimiento?",
+        "opciones": [
+            {"id": "a", "texto": "Pinzar y ligar los vasos sangrantes del mesoapéndice."},
+            {"id": "b", "texto": "Realizar la incisión en el punto de McBurney con bisturí."},
+            {"id": "c", "texto": "Seccionar la base apendicular tras colocar la jareta."},
+            {"id": "d", "texto": "Afrontar el peritoneo con sutura absorbible continua."},
+        ],
+    },
+    "clave_y_diagnostico": {
+        "respuesta_correcta_id": "a",
+        "errores_comunes_mapeados": ["Confundir hemostasia con exéresis."],
+        "retroalimentacion_opciones": [
+            {"id": "a", "es_correcta": True, "justificacion": "La hemostasia consiste en controlar el sangrado de los vasos seccionados."},
+            {"id": "b", "es_correcta": False, "justificacion": "La incisión corresponde al primer tiempo quirúrgico, la diéresis."},
+            {"id": "c", "es_correcta": False, "justificacion": "Seccionar el apéndice corresponde al tiempo de exéresis del órgano."},
+            {"id": "d", "es_correcta": False, "justificacion": "Afrontar tejidos corresponde al tiempo de síntesis o sutura final."},
+        ],
+    },
+    "metadata_creacion": {"fecha_creacion": "2025-07-01", "agente_generador": "benchmark"},
+}
+
+PIPELINE_YAML = """
+stages:
+  - name: bench_generate
+  - name: validate_hard
+    params: {executor: inline}
+  - name: validate_soft
+    params: {executor: inline}
+  - name: bench_persist
+"""
+
+
+def _register_synthetic_stages():
+    from app.pipelines.registry import register
+    from app.pipelines.abstractions import BaseStage
+    from app.pipelines.utils.stage_helpers import add_revision_log_entry
+    from app.schemas.enums import ItemStatus
+    from app.schemas.item_schemas import ItemPayloadSchema
+
+    @register("bench_generate")
+    class BenchGenerateStage(BaseStage):
+        async def execute(self, items):
+            for item in items:
+                item.payload = ItemPayloadSchema.model_validate(copy.deepcopy(PAYLOAD_TEMPLATE))
+                add_revision_log_entry(item, self.stage_name, ItemStatus.GENERATION_SUCCESS, "Ítem sintético.")
+            return items
+
+    @register("bench_persist")
+    class BenchPersistStage(BaseStage):
+        async def execute(self, items):
+            for item in items:
+                add_revision_log_entry(item, self.stage_name, ItemStatus.PERSISTENCE_SUCCESS, "Persistencia simulada.")
+            return items
+
+
+def _requests(n_items: int):
+    for _ in range(n_items // ITEMS_PER_REQUEST):
+        yield dict(REQUEST, n_items=ITEMS_PER_REQUEST)
+
+
+async def _run_mode(mode: str, n_items: int, window_size: int, config_path: str):
+    from app.pipelines.runner import run
+    from app.pipelines.utils.stage_helpers import initialize_items_for_pipeline, iter_items_for_pipeline
+
+    if mode == "list":
+        items = []
+        for request in _requests(n_items):
+            items.extend(initialize_items_for_pipeline(request))
+        await run(config_path, items_to_process=items)
+    else:
+        await run(config_path, item_source=iter_items_for_pipeline(_requests(n_items)), window_size=window_size)
+
+
+def _child(mode: str, n_items: int, window_size: int):
+    import logging
+    logging.disable(logging.CRITICAL)
+    _register_synthetic_stages()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yml", delete=False) as f:
+        f.write(PIPELINE_YAML)
+        config_path = f.name
+
+    # Importa las etapas antes de medir para no contar la carga de módulos.
+    from app.pipelines.registry import get_full_registry
+    get_full_registry()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(_run_mode(mode, n_items, window_size, config_path))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    os.unlink(config_path)
+
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": mode, "items": n_items, "elapsed_s": round(elapsed, 2),
+                      "peak_traced_mb": round(peak / 2**20, 1), "max_rss_mb": round(max_rss_mb, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--window-size", type=int, default=100)
+    parser.add_argument("--mode", choices=["list", "windowed"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _child(args.mode, args.items, args.window_size)
+        return
+
+    print(f"{'modo':<10} {'ítems':>7} {'tiempo (s)':>11} {'pico tracemalloc (MB)':>22} {'RSS máx (MB)':>13}")
+    for mode in ("list", "windowed"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--items", str(args.items), "--window-size", str(args.window_size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10} {result['items']:>7} {result['elapsed_s']:>11} {result['peak_traced_mb']:>22} {result['max_rss_mb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,18 +11,47 @@ CREATE TABLE IF NOT EXISTS items (
     temp_id UUID NOT NULL,
     batch_id VARCHAR(255) NOT NULL,
     status VARCHAR(255) NOT NULL,
+    -- Sin 'revision_log': el historial del ítem está en 'item_events'.
     payload JSONB,
-    findings JSONB NOT NULL DEFAULT '[]'::jsonb,
-    audits JSONB NOT NULL DEFAULT '[]'::jsonb,
-    change_log JSONB NOT NULL DEFAULT '[]'::jsonb,
     prompt_v TEXT,
     token_usage INTEGER,
+    cost_usd DOUBLE PRECISION,
     final_evaluation JSONB NOT NULL DEFAULT '[]'::jsonb,
     generation_params JSONB,
+    tenant_id TEXT,
     created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    -- Búsqueda de texto completo en español: enunciado (peso A), estímulo (B)
+    -- y texto de las opciones (C). Postgres la recalcula al escribir el payload.
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'enunciado_pregunta', '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'estimulo', '')), 'B') ||
+        setweight(jsonb_to_tsvector('spanish', coalesce(jsonb_path_query_array(payload, '$.cuerpo_item.opciones[*].texto'), '[]'::jsonb), '["string"]'), 'C')
+    ) STORED,
+    -- Campos de filtro y faceta extraídos del JSONB: contarlos no obliga a
+    -- descomprimir el payload de cada fila.
+    asignatura TEXT GENERATED ALWAYS AS (payload -> 'dominio' ->> 'asignatura') STORED,
+    tema TEXT GENERATED ALWAYS AS (payload -> 'dominio' ->> 'tema') STORED,
+    nivel_cognitivo TEXT GENERATED ALWAYS AS (payload ->> 'nivel_cognitivo') STORED,
+    tipo_reactivo TEXT GENERATED ALWAYS AS (payload -> 'formato' ->> 'tipo_reactivo') STORED,
+    score_total INTEGER GENERATED ALWAYS AS ((final_evaluation ->> 'score_total')::integer) STORED
 );
 
+-- Columnas añadidas después de crear la tabla, para bases de datos anteriores
+-- (CREATE TABLE IF NOT EXISTS no añade columnas a una tabla existente)
+ALTER TABLE items ADD COLUMN IF NOT EXISTS tenant_id TEXT;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS cost_usd DOUBLE PRECISION;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'enunciado_pregunta', '')), 'A') ||
+    setweight(to_tsvector('spanish', coalesce(payload -> 'cuerpo_item' ->> 'estimulo', '')), 'B') ||
+    setweight(jsonb_to_tsvector('spanish', coalesce(jsonb_path_query_array(payload, '$.cuerpo_item.opciones[*].texto'), '[]'::jsonb), '["string"]'), 'C')
+) STORED;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS asignatura TEXT GENERATED ALWAYS AS (payload -> 'dominio' ->> 'asignatura') STORED;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS tema TEXT GENERATED ALWAYS AS (payload -> 'dominio' ->> 'tema') STORED;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS nivel_cognitivo TEXT GENERATED ALWAYS AS (payload ->> 'nivel_cognitivo') STORED;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS tipo_reactivo TEXT GENERATED ALWAYS AS (payload -> 'formato' ->> 'tipo_reactivo') STORED;
+ALTER TABLE items ADD COLUMN IF NOT EXISTS score_total INTEGER GENERATED ALWAYS AS ((final_evaluation ->> 'score_total')::integer) STORED;
+
 -- Trigger para actualizar 'updated_at' automáticamente
 CREATE OR REPLACE FUNCTION trigger_set_timestamp()
 RETURNS TRIGGER AS $$
@@ -42,13 +71,39 @@ CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- --- ÍNDICES ---
 
--- Índice para búsquedas por lote
-CREATE INDEX IF NOT EXISTS idx_items_batch_id ON items (batch_id);
+-- Índice para búsquedas por lote; incluye el estado para que el sondeo del
+-- estado de un lote cuente sus ítems sin leer las filas (ni sus JSONB).
+CREATE INDEX IF NOT EXISTS idx_items_batch_id_status ON items (batch_id, status);
+-- Sustituido por idx_items_batch_id_status (y por ix_items_batch_id si la tabla la creó el ORM).
+DROP INDEX IF EXISTS idx_items_batch_id;
+DROP INDEX IF EXISTS ix_items_batch_id;
+CREATE INDEX IF NOT EXISTS idx_items_tenant_id ON items (tenant_id);
+
+-- Índices de la paginación por clave (created_at, id) de GET /items, sin
+-- filtro y con cada filtro de igualdad disponible.
+CREATE INDEX IF NOT EXISTS idx_items_created_at_id ON items (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_items_status_created_at_id ON items (status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_items_batch_id_created_at_id ON items (batch_id, created_at, id);
+-- Sobre las columnas generadas; sustituyen a los índices de expresión sobre el
+-- payload que tenían los nombres idx_items_<campo>_created_at_id.
+DROP INDEX IF EXISTS idx_items_asignatura_created_at_id;
+DROP INDEX IF EXISTS idx_items_tema_created_at_id;
+DROP INDEX IF EXISTS idx_items_nivel_cognitivo_created_at_id;
+CREATE INDEX IF NOT EXISTS idx_items_col_asignatura_created_at_id ON items (asignatura, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_items_col_tema_created_at_id ON items (tema, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_items_col_nivel_cognitivo_created_at_id ON items (nivel_cognitivo, created_at, id);
+
+-- Búsqueda de texto completo y facetas de GET /items/search
+CREATE INDEX IF NOT EXISTS idx_items_search_vector ON items USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS idx_items_tipo_reactivo ON items (tipo_reactivo);
+CREATE INDEX IF NOT EXISTS idx_items_score_total ON items (score_total);
 
 -- Índices GIN para campos JSONB
 CREATE INDEX IF NOT EXISTS idx_items_payload ON items USING gin (payload);
-CREATE INDEX IF NOT EXISTS idx_items_findings ON items USING gin (findings);
-CREATE INDEX IF NOT EXISTS idx_items_change_log ON items USING gin (change_log);
+-- Los hallazgos y correcciones pasaron a 'item_events'; sus antiguos índices
+-- solo encarecerían las escrituras en bases de datos anteriores.
+DROP INDEX IF EXISTS idx_items_findings;
+DROP INDEX IF EXISTS idx_items_change_log;
 
 -- Índices para filtros específicos dentro del payload
 CREATE INDEX IF NOT EXISTS idx_payload_metadata_area ON items USING gin ((payload -> 'metadata' ->> 'area') gin_trgm_ops);
@@ -58,3 +113,149 @@ CREATE INDEX IF NOT EXISTS idx_payload_metadata_tema ON items USING gin ((payloa
 CREATE INDEX IF NOT EXISTS idx_payload_metadata_nivel_cognitivo ON items USING gin ((payload -> 'metadata' ->> 'nivel_cognitivo') gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_payload_metadata_dificultad_prevista ON items USING gin ((payload -> 'metadata' ->> 'dificultad_prevista') gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_payload_tipo_reactivo ON items USING gin ((payload ->> 'tipo_reactivo') gin_trgm_ops);
+
+-- --- HISTORIAL DE LOS ÍTEMS ---
+
+-- Auditoría, hallazgos y correcciones de cada ítem, solo de inserción: guardar
+-- un ítem añade sus entradas nuevas en lugar de reescribir arrays JSONB en su fila
+CREATE TABLE IF NOT EXISTS item_events (
+    id BIGSERIAL PRIMARY KEY,
+    item_id UUID NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+    batch_id VARCHAR(255) NOT NULL,
+    kind VARCHAR(32) NOT NULL,
+    entry_id UUID NOT NULL DEFAULT gen_random_uuid(),
+    seq INTEGER NOT NULL,
+    stage_name VARCHAR(255),
+    status VARCHAR(255),
+    code VARCHAR(255),
+    duration_ms INTEGER,
+    tokens_used INTEGER,
+    occurred_at TIMESTAMPTZ,
+    data JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Las entradas se deduplican por su 'entry_id', no por su posición: una lista
+-- recortada o reiniciada (p. ej. al reintentar un trabajo) reutiliza posiciones.
+ALTER TABLE item_events ADD COLUMN IF NOT EXISTS entry_id UUID NOT NULL DEFAULT gen_random_uuid();
+ALTER TABLE item_events DROP CONSTRAINT IF EXISTS uq_item_events_item_kind_seq;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_item_events_item_entry_id ON item_events (item_id, entry_id);
+
+CREATE INDEX IF NOT EXISTS idx_item_events_batch_id ON item_events (batch_id);
+-- Analítica por etapa (duración, tokens y fallos de cada etapa)
+CREATE INDEX IF NOT EXISTS idx_item_events_stage_name_status ON item_events (stage_name, status);
+
+-- Revisiones del payload: parche JSON (RFC 6902) de cada etapa que lo cambió;
+-- la revisión 0 y cada PAYLOAD_SNAPSHOT_INTERVAL revisiones guardan además el
+-- payload completo para acotar la reconstrucción
+CREATE TABLE IF NOT EXISTS item_revisions (
+    item_id UUID NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+    revision INTEGER NOT NULL,
+    stage_name VARCHAR(255),
+    patch JSONB NOT NULL,
+    snapshot JSONB,
+    occurred_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (item_id, revision)
+);
+
+-- --- COLA DURABLE DEL PIPELINE ---
+
+-- Trabajos consumidos por los procesos `python -m app.worker`
+CREATE TABLE IF NOT EXISTS pipeline_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    batch_id VARCHAR(255) NOT NULL,
+    status VARCHAR(32) NOT NULL DEFAULT 'queued',
+    items JSONB NOT NULL,
+    stage_index INTEGER,
+    stage_name VARCHAR(255),
+    context JSONB,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Columnas del modo distribuido en bases de datos anteriores
+-- (CREATE TABLE IF NOT EXISTS no añade columnas a una tabla existente)
+ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS stage_index INTEGER;
+ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS stage_name VARCHAR(255);
+ALTER TABLE pipeline_jobs ADD COLUMN IF NOT EXISTS context JSONB;
+
+CREATE OR REPLACE TRIGGER set_timestamp
+BEFORE UPDATE ON pipeline_jobs
+FOR EACH ROW
+EXECUTE PROCEDURE trigger_set_timestamp();
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_batch_id ON pipeline_jobs (batch_id);
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_stage_name ON pipeline_jobs (stage_name);
+-- Índice parcial para el SELECT ... FOR UPDATE SKIP LOCKED de los workers, por
+-- cola de etapa; sustituye al índice anterior sin etapa (idx_pipeline_jobs_claimable)
+DROP INDEX IF EXISTS idx_pipeline_jobs_claimable;
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_stage_claimable ON pipeline_jobs (stage_name, status, created_at)
+    WHERE status IN ('queued', 'running', 'cancelling');
+
+-- --- AGRUPACIÓN DE SOLICITUDES IDÉNTICAS ---
+
+-- Solicitudes de generación recientes por hash de parámetros o Idempotency-Key
+CREATE TABLE IF NOT EXISTS generation_requests (
+    request_key TEXT PRIMARY KEY,
+    params_hash VARCHAR(64) NOT NULL,
+    batch_id VARCHAR(255) NOT NULL,
+    num_items INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_generation_requests_batch_id ON generation_requests (batch_id);
+
+-- --- INVENTARIO DE ÍTEMS PREGENERADOS ---
+
+-- Frecuencia de solicitudes por combinación de parámetros
+CREATE TABLE IF NOT EXISTS inventory_demand (
+    combo_key VARCHAR(64) PRIMARY KEY,
+    combo JSONB NOT NULL,
+    generation_params JSONB NOT NULL,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    last_requested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Lotes pregenerados: sus ítems forman la reserva de cada combinación
+CREATE TABLE IF NOT EXISTS inventory_batches (
+    batch_id VARCHAR(255) PRIMARY KEY,
+    combo_key VARCHAR(64) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_batches_combo_key ON inventory_batches (combo_key);
+
+-- Entregas: un ítem del inventario nunca se entrega dos veces al mismo cliente
+CREATE TABLE IF NOT EXISTS inventory_deliveries (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    source_item_id UUID NOT NULL,
+    tenant_id TEXT NOT NULL,
+    item_id UUID NOT NULL,
+    batch_id VARCHAR(255) NOT NULL,
+    delivered_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT uq_inventory_deliveries_item_tenant UNIQUE (source_item_id, tenant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_deliveries_source_item_id ON inventory_deliveries (source_item_id);
+
+-- --- PRESUPUESTO DE TOKENS Y COSTE ---
+
+-- Presupuesto de cada lote y su gasto; las filas sin completed_at reservan su
+-- máximo en el presupuesto mensual del cliente
+CREATE TABLE IF NOT EXISTS batch_budgets (
+    batch_id VARCHAR(255) PRIMARY KEY,
+    tenant_id TEXT,
+    max_tokens INTEGER,
+    max_cost_usd DOUBLE PRECISION,
+    tokens_used INTEGER NOT NULL DEFAULT 0,
+    cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    completed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_batch_budgets_tenant_created ON batch_budgets (tenant_id, created_at);